@@ -21,10 +21,14 @@ import math
 import numpy as np
 # Own
 from base_metaheuristic import Base
+import instrumentation
+from solution_archive import SolutionArchive
 
 class ACOr(Base):
     """ Class for the Ant Colony Optimization for Continuous Domains, following (Socha and Dorigo, 2006) """
 
+    checkpoint_attributes = ['SA', 'best_solution', 'q', 'xi']
+    
     def __init__(self):
         """ Constructor """
         # Define verbosity and NULL problem definition
@@ -42,6 +46,10 @@ class ACOr(Base):
         self.SA = None                                  # Solution Archive
         self.best_solution = None                       # Best solution of the archive
         
+        # In the sequential sampling, ants choose guides and sample variables one at a time, as in the published results.
+        # In the vectorized sampling, the whole population is sampled at once using array operations
+        self.sampling_mode = 'sequential'
+        
 
     def set_parameters(self, pop_size, k, q, xi, function_evaluations_array):
         """ Define values for the parameters used by the algorithm """
@@ -65,6 +73,8 @@ class ACOr(Base):
         self.num_iter = int(np.max(self.relative_iterations))
         self.pop_size = pop_size
         self.k = k
+        self.initial_evaluations = k
+        self.iteration_evaluations = pop_size
         self.q = q
         self.xi = xi
 
@@ -85,9 +95,19 @@ class ACOr(Base):
         self.num_variables = len(initial_ranges)
         self.initial_ranges = initial_ranges
         self.is_bounded = is_bounded
-        self.SA = np.zeros((self.k, self.num_variables + 1))
+        self.archive = SolutionArchive(self.k, self.pop_size, self.num_variables)
+        self.SA = self.archive.solutions
 
     
+    def set_sampling_mode(self, sampling_mode):
+        """ Choose between the 'sequential' ant sampling, used to obtain the published results, and the 'vectorized' sampling of the whole population """
+        if sampling_mode != 'sequential' and sampling_mode != 'vectorized':
+            print("Error, sampling mode must be 'sequential' or 'vectorized'")
+            exit(-1)
+            
+        self.sampling_mode = sampling_mode
+        
+        
     def _biased_selection(self, probabilities):
         """ Returns an index based on a set of probabilities (also known as roulette wheel selection in GA) """
         r = np.random.uniform(0, sum(probabilities))
@@ -121,91 +141,142 @@ class ACOr(Base):
         self.control_q()
         self.control_xi()
     
+    def emigrants(self, num_migrants):
+        """ The best solutions of the archive """
+        return np.array(self.SA[:num_migrants])
+        
+    def inject_migrants(self, migrants):
+        """ Merge migrants into the archive as new solutions, so they replace the worst archive solutions they are better than """
+        migrants = np.asarray(migrants)
+        migrants = migrants[np.argsort(migrants[:, -1], kind = 'stable')[:self.pop_size]]
+        self.archive.merge(migrants)
+        self.SA = self.archive.solutions
+        self.best_solution = np.array(self.SA[0, :])
+    
+    def _sequential_sampling(self, pop, p):
+        """ Each ant selects a guide and samples its variables one at a time. Returns the guide of each ant """
+        Mi = self.SA[:, 0:self.num_variables]                               # Matrix of means
+        guides = np.zeros(self.pop_size, dtype = int)                       # Archive solution each ant sampled from
+        for ant in range(self.pop_size):                                    # For each ant in the population
+            l = self._biased_selection(p)                                   # Select solution of the SA to sample from based on probabilities p
+            guides[ant] = l
+            # Compute average distances from the chosen solution to other solutions
+            # Used as standard deviation of solution generation
+            sigmas_array = self.xi * np.sum(np.abs(self.SA[:,:-1] - self.SA[l, :-1]), axis = 0) / (self.k - 1)
+            
+            for var in range(self.num_variables):
+                sigma = sigmas_array[var]
+                pop[ant, var] = np.random.normal(Mi[l, var], sigma)         # Sample from normal distribution with mean Mi and st. dev. sigma
+                
+                # Search space boundaries violation is only dealt with when the variable is considered bounded (self.is_bounded)
+                if self.is_bounded[var]:
+                    # Use the hard border strategy
+                    if pop[ant, var] < self.initial_ranges[var][0]:
+                        pop[ant, var] = self.initial_ranges[var][0]
+                    elif pop[ant, var] > self.initial_ranges[var][1]:
+                        pop[ant, var] = self.initial_ranges[var][1]        
+                    
+                    # Use the random position strategy
+                    # if pop[ant, var] < self.initial_ranges[var][0] or pop[ant, var] > self.initial_ranges[var][1]:                   
+                        # pop[ant, var] = np.random.uniform(self.initial_ranges[var][0], self.initial_ranges[var][1])
+                        
+        return guides
+        
+        
+    def _vectorized_sampling(self, pop, p):
+        """ All guides are chosen with a single weighted draw and the whole population is sampled at once. Returns the guide of each ant """
+        solutions = self.SA[:, :-1]
+        guides = np.random.choice(self.k, size = self.pop_size, p = p)
+        
+        # Average distances to the other solutions are computed once for each distinct guide, as a (distinct guides, num_variables) matrix
+        distinct_guides, guide_indices = np.unique(guides, return_inverse = True)
+        distances = np.sum(np.abs(solutions[np.newaxis, :, :] - solutions[distinct_guides, np.newaxis, :]), axis = 1)
+        sigmas = (self.xi / (self.k - 1)) * distances
+        
+        # Sample from normal distributions centered in the guides, then use the hard border strategy for bounded variables
+        pop[:, :-1] = np.random.normal(solutions[guides], sigmas[guide_indices])
+        np.clip(pop[:, :-1], self.lower_bounds, self.upper_bounds, out = pop[:, :-1])
+        
+        return guides
+        
+        
     def optimize(self):
         """ Initializes the archive and enter the main loop, until it reaches maximum number of iterations """
         # Error checking
         if self.num_variables == None:
             print("Error, number of variables and their boundaries must be defined prior to optimization")
             exit(-1)
-        if self.cost_function == None:
+        if self.cost_function == None and self.batch_cost_function == None:
             print("Error, cost function must be defined prior to optimization")
             exit(-1)
         
         # Keep solutions defined by function_evaluations_array
         recorded_solutions = []
-        
-        # Initialize the archive by random sampling, respecting each variable's boundaries   
-        if self.verbosity:   print("[INITIALIZING SOLUTION ARCHIVE]")
-        pop = np.zeros((self.pop_size, self.num_variables +1))
-        w = np.zeros(self.k)
-        
-        for i in range(self.k):
-            for j in range(self.num_variables): 
-                self.SA[i, j] = np.random.uniform(self.initial_ranges[j][0], self.initial_ranges[j][1])     # Initialize solution archive randomly
-            self.SA[i, -1] = self.cost_function(self.SA[i, 0:self.num_variables], -1)                           # Get initial cost for each solution
-        self.SA = self.SA[self.SA[:, -1].argsort()]                                                         # Sort solution archive (best solutions first)
-        
-        # Array containing indices of solution archive position
-        x = np.linspace(1,self.k,self.k) 
-        w = self.gaussian_pdf_weights(x)                                         # Weights as a gaussian function of rank with mean 1, std qk
-        p = w/sum(w) 
+        first_iteration = 0
+        self.lower_bounds, self.upper_bounds = self.search_bounds()
+        
+        # Resume from a checkpoint or start a new search
+        loop_state = self.resume_checkpoint()
+        if loop_state != None:
+            first_iteration = loop_state['iteration']
+            recorded_solutions = loop_state['recorded_solutions']
+        else:
+            # Initialize the archive by random sampling, respecting each variable's boundaries   
+            if self.verbosity:   print("[INITIALIZING SOLUTION ARCHIVE]")
+            for i in range(self.k):
+                for j in range(self.num_variables): 
+                    self.SA[i, j] = np.random.uniform(self.initial_ranges[j][0], self.initial_ranges[j][1])     # Initialize solution archive randomly
+            self.SA[:, -1] = self.evaluate_population(self.SA[:, 0:self.num_variables])                             # Get initial cost for each solution
+        self.archive.initialize(self.SA)                                                                        # Sort solution archive (best solutions first)
+        self.SA = self.archive.solutions
+        
+        # Probabilities of selecting solutions as search guides, as a gaussian function of rank with mean 1, std qk
+        p = self.archive.rank_probabilities(self.q * self.k)
         
         if self.verbosity:   print("ALGORITHM MAIN LOOP")
         # Algorithm runs until it reaches the determined number of iterations
-        for iteration in range(self.num_iter):
+        for iteration in range(first_iteration, self.num_iter):
             if self.verbosity:
                 print("[%d]" % iteration)
                 print(self.SA[0, :])
             
-            success_count = 0                                                   # Count how many ant improve the solution they are sampling from    
-            Mi = self.SA[:, 0:self.num_variables]                               # Matrix of means
-            for ant in range(self.pop_size):                                    # For each ant in the population
-                l = self._biased_selection(p)                                   # Select solution of the SA to sample from based on probabilities p
-                # Compute average distances from the chosen solution to other solutions
-                # Used as standard deviation of solution generation
-                sigmas_array = self.xi * np.sum(np.abs(self.SA[:,:-1] - self.SA[l, :-1]), axis = 0) / (self.k - 1)
-                
-                for var in range(self.num_variables):
-                    sigma = sigmas_array[var]
-                    pop[ant, var] = np.random.normal(Mi[l, var], sigma)         # Sample from normal distribution with mean Mi and st. dev. sigma
+            # Sample new solutions around guides chosen from the archive, directly into its free rows
+            pop = self.archive.new_solutions
+            with instrumentation.phase('sampling'):
+                if self.sampling_mode == 'vectorized':
+                    guides = self._vectorized_sampling(pop, p)
+                else:
+                    guides = self._sequential_sampling(pop, p)
                     
-                    # Search space boundaries violation is only dealt with when the variable is considered bounded (self.is_bounded)
-                    if self.is_bounded[var]:
-                        # Use the hard border strategy
-                        if pop[ant, var] < self.initial_ranges[var][0]:
-                            pop[ant, var] = self.initial_ranges[var][0]
-                        elif pop[ant, var] > self.initial_ranges[var][1]:
-                            pop[ant, var] = self.initial_ranges[var][1]        
+            # Evaluate cost of new solutions
+            pop[:, -1] = self.evaluate_population(pop[:, 0:self.num_variables])
+            
+            with instrumentation.phase('archive_update'):
+                # Check if the new solutions are better than the ones the ants sampled from
+                success_count = int(np.sum(pop[:, -1] < self.SA[guides, -1]))
                         
-                        # Use the random position strategy
-                        # if pop[ant, var] < self.initial_ranges[var][0] or pop[ant, var] > self.initial_ranges[var][1]:                   
-                            # pop[ant, var] = np.random.uniform(self.initial_ranges[var][0], self.initial_ranges[var][1])
-                    
-                # Evaluate cost of new solution
-                pop[ant, -1] = self.cost_function(pop[ant, 0:self.num_variables], -1)       
+                # Compute success rate, updates xi and q (No effect in vanilla ACOr)
+                self.handle_adaptions(success_count)
                 
-                # Check if the new solution is better than the one the ant sampled from
-                if pop[ant, -1] < self.SA[l, -1]:
-                    success_count += 1
-                    
-            # Compute success rate, updates xi and q (No effect in vanilla ACOr)
-            self.handle_adaptions(success_count)
+                # Update PDF from which ants sample their centers, according to updates in q parameter
+                p = self.archive.rank_probabilities(self.q * self.k)
             
-            # Append new solutions to the Archive
-            self.SA = np.append(self.SA, pop, axis = 0)                                                         
-            # Update PDF from which ants sample their centers, according to updates in q parameter
-            w = self.gaussian_pdf_weights(x)                                         # Weights as a gaussian function of rank with mean 1, std qk
-            p = w/sum(w)                                                            # Probabilities of selecting solutions as search guides
-        
-            # Sort solution archive according to the fitness of each solution
-            self.SA = self.SA[self.SA[:, -1].argsort()]                                                         
-            # Remove worst solutions
-            self.SA = self.SA[0:self.k, :]   
+                # Merge new solutions into the archive, keeping the k best ones sorted
+                self.archive.merge()
+                self.SA = self.archive.solutions
             # Extract current best solution
             self.best_solution = np.array(self.SA[0, :])
             if (self.relative_iterations - 1 == iteration).any():
                 recorded_solutions.append(np.array(self.best_solution))
             
+            self.iteration_finished()
+            self.checkpoint_if_due({'iteration': iteration + 1, 'recorded_solutions': recorded_solutions}, self.function_evaluations)
+            if self.stopping_criterion_met():
+                break
+            
+        recorded_solutions = self.fill_recorded_solutions(recorded_solutions, self.best_solution)
+        self.finish_search()
+        
         return np.array(recorded_solutions)
         
         
@@ -214,6 +285,8 @@ class ACOr(Base):
 class SRAACOr(ACOr):
     """ Parent class of all adaptive versions of ACOr."""
     
+    checkpoint_attributes = ACOr.checkpoint_attributes + ['success_rate']
+    
     def __init__(self):
         """ Constructor """
         super().__init__()
@@ -15,11 +15,24 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+# Python standard lib
+import os
+import copy
+import time
+import pickle
 from abc import ABC, abstractmethod
+# 3rd party
+import numpy as np
+# Own
+import evaluation_executors
+import instrumentation
 
 class Base:
     """ """
     
+    # Attributes that define the search state between iterations, saved in checkpoints. Each algorithm lists its own
+    checkpoint_attributes = []
+    
     def __init__(self):
         """ Constructor """
         self.verbosity = True
@@ -29,6 +42,37 @@ class Base:
         self.initial_ranges = []                        # Initialization boundaries for each variable
         self.is_bounded = []                            # Here, if a variable is constrained, it will be limited to its initialization boundaries for all the search
         self.cost_function = None                       # Cost function to guide the search
+        self.batch_cost_function = None                 # Optional cost function evaluating a whole population (one solution per row) at once
+        self.executor = evaluation_executors.SerialExecutor()   # Evaluates populations, possibly in parallel
+        
+        # Checkpointing of the search state, disabled by default
+        self.checkpoint_filename = None
+        self.checkpoint_interval_evaluations = None     # Maximum number of function evaluations between checkpoints
+        self.checkpoint_interval_seconds = None         # Maximum number of seconds between checkpoints
+        self.last_checkpoint_evaluations = 0
+        self.last_checkpoint_time = None
+        
+        # Accounting of the function evaluations of the current search
+        self.function_evaluations = 0                   # Exact number of cost function evaluations
+        self.best_evaluated_cost = np.inf               # Lowest cost evaluated
+        self.reference_cost = np.inf                    # Lowest cost at the last improvement larger than the relative tolerance
+        self.last_improvement_evaluations = 0           # Function evaluations at that improvement
+        self.search_start_time = None
+        self.previous_search_seconds = 0.0              # Seconds spent in the search before resuming it from a checkpoint
+        
+        # Optional stopping criteria, besides the function evaluations budget
+        self.max_seconds = None                         # Maximum wall-clock seconds of search
+        self.target_cost = None                         # Stop once a cost lower or equal to this one is evaluated
+        self.stagnation_evaluations = None              # Stop after this number of function evaluations without improvement
+        self.relative_tolerance = 0.0                   # Improvements smaller than this fraction of the best cost are not considered as such
+        self.stop_reason = None                         # Criterion that stopped the last search, None if it used the whole budget
+        self.last_progress_time = None                  # Time of the last progress event written to the instrumentation trace
+        self.search_summary = None                      # Instrumentation summary of the last search, when instrumentation is enabled
+        self.iteration_hook = None                      # Optional function called with the algorithm at the end of each iteration (e.g. migrations of island_model)
+        
+        # Function evaluations before the first iteration and per iteration, as counted by the relative iterations of set_parameters
+        self.initial_evaluations = 0
+        self.iteration_evaluations = None
         
     
     def set_verbosity(self, status):
@@ -45,6 +89,269 @@ class Base:
         """ Sets the cost function that will guide the search """
         self.cost_function = cost_function
     
+    
+    def set_batch_cost(self, batch_cost_function):
+        """ Sets an optional cost function that receives a (P, D) matrix of solutions and returns their P costs.
+            Population-based algorithms use it instead of calling the cost function once per solution """
+        self.batch_cost_function = batch_cost_function
+        
+    
+    def set_iteration_hook(self, iteration_hook):
+        """ Sets a function called with the algorithm at the end of each iteration, after the best solution is recorded. None removes it """
+        self.iteration_hook = iteration_hook
+        
+        
+    def iteration_finished(self):
+        """ Called by the algorithms at the end of each iteration, before checkpointing """
+        if self.iteration_hook != None:
+            self.iteration_hook(self)
+            
+            
+    def emigrants(self, num_migrants):
+        """ Up to num_migrants of the best solutions of the search state, with their costs as the last column """
+        print("Error, %s does not support migrations" % type(self).__name__)
+        exit(-1)
+        
+        
+    def inject_migrants(self, migrants):
+        """ Insert solutions found by other searches (with their costs as the last column) into the search state """
+        print("Error, %s does not support migrations" % type(self).__name__)
+        exit(-1)
+        
+        
+    def set_executor(self, executor):
+        """ Sets the executor used to evaluate populations (see evaluation_executors). Costs do not depend on the executor, so results are the same for any of them """
+        self.executor = executor
+        
+        
+    def evaluate(self, candidate_solution, modified_variable):
+        """ Returns the cost of a single solution, given the variable modified from the previous candidate (-1 if all of them were modified) """
+        with instrumentation.phase('evaluation'):
+            cost = self.cost_function(candidate_solution, modified_variable)
+        self.account_evaluations(1, cost)
+        
+        return cost
+        
+        
+    def evaluate_population(self, solutions, account = True):
+        """ Returns the costs of a (P, D) matrix of solutions, considering that all variables of each solution were modified.
+            If account is False, the caller accounts the evaluations it uses with account_evaluations """
+        with instrumentation.phase('evaluation'):
+            costs = self.executor.evaluate(solutions, self.cost_function, self.batch_cost_function)
+        if account:
+            self.account_evaluations(len(costs), np.min(costs))
+        
+        return costs
+        
+        
+    def account_evaluations(self, num_evaluations, lowest_cost):
+        """ Count function evaluations and keep track of the improvements of the lowest cost evaluated. All evaluations must go through this method,
+            except the discarded speculative evaluations of SA """
+        self.function_evaluations += num_evaluations
+        if lowest_cost < self.best_evaluated_cost:
+            self.best_evaluated_cost = lowest_cost
+        if lowest_cost < self.reference_cost - self.relative_tolerance * abs(self.reference_cost) or self.reference_cost == np.inf:
+            self.reference_cost = lowest_cost
+            self.last_improvement_evaluations = self.function_evaluations
+        
+        # Periodic progress events, from which evaluations per second over time are obtained
+        if instrumentation.enabled and time.monotonic() - self.last_progress_time >= instrumentation.trace_interval_seconds:
+            self.last_progress_time = time.monotonic()
+            instrumentation.trace('progress', function_evaluations = self.function_evaluations, best_cost = self.best_evaluated_cost, 
+                                  seconds = self.elapsed_seconds(), evaluation_seconds = instrumentation.phase_seconds['evaluation'])
+            
+            
+    def set_stopping_criteria(self, max_seconds = None, target_cost = None, stagnation_evaluations = None, relative_tolerance = 0.0):
+        """ Stop the search before using the whole function evaluations budget after max_seconds seconds, once a cost lower or equal to target_cost is found 
+            or after stagnation_evaluations function evaluations without improvements larger than relative_tolerance times the best cost.
+            Criteria set to None are not used. Solutions not reached in the function_evaluations_array are filled with the last best solution """
+        if (max_seconds != None and max_seconds <= 0) or (stagnation_evaluations != None and stagnation_evaluations <= 0):
+            print("Error, maximum seconds and stagnation evaluations must be positive")
+            exit(-1)
+        if relative_tolerance < 0:
+            print("Error, relative tolerance must not be negative")
+            exit(-1)
+            
+        self.max_seconds = max_seconds
+        self.target_cost = target_cost
+        self.stagnation_evaluations = stagnation_evaluations
+        self.relative_tolerance = relative_tolerance
+        
+        
+    def elapsed_seconds(self):
+        """ Wall-clock seconds spent in the current search, including the time before resuming it from a checkpoint """
+        return self.previous_search_seconds + time.monotonic() - self.search_start_time
+        
+        
+    def stopping_criterion_met(self):
+        """ Check the stopping criteria, storing the one met in stop_reason. Called by the algorithms at the end of their iterations """
+        if self.target_cost != None and self.best_evaluated_cost <= self.target_cost:
+            self.stop_reason = 'target_cost'
+        elif self.stagnation_evaluations != None and self.function_evaluations - self.last_improvement_evaluations >= self.stagnation_evaluations:
+            self.stop_reason = 'stagnation'
+        elif self.max_seconds != None and self.elapsed_seconds() >= self.max_seconds:
+            self.stop_reason = 'max_seconds'
+        
+        if self.stop_reason != None and self.verbosity:
+            print("[STOPPED BY %s AFTER %d FUNCTION EVALUATIONS]" % (self.stop_reason.upper(), self.function_evaluations))
+            
+        return self.stop_reason != None
+        
+        
+    def record_points(self, function_evaluations_array):
+        """ Mask of the function evaluations at which solutions are recorded with the current parameters, i.e. those accepted by set_parameters
+            and reached after at least one iteration, as in fill_recorded_solutions """
+        relative_iterations = (np.array(function_evaluations_array) - self.initial_evaluations) / self.iteration_evaluations
+        
+        return np.array([x.is_integer() and x >= 1 for x in relative_iterations], dtype = bool)
+        
+        
+    def fill_recorded_solutions(self, recorded_solutions, best_solution):
+        """ Complete the solutions recorded at each element of function_evaluations_array with the last best solution, when the search stopped early.
+            Only the elements reached after at least one iteration are recorded, as in the algorithms main loops """
+        num_records = len(np.unique(self.relative_iterations[self.relative_iterations >= 1]))
+        if len(recorded_solutions) > num_records:
+            print("Error, more solutions were recorded than function evaluations of interest")
+            exit(-1)
+        while len(recorded_solutions) < num_records:
+            recorded_solutions.append(np.array(best_solution))
+            
+        return recorded_solutions
+        
+        
+    def commit_candidate(self):
+        """ Tells a stateful cost function (e.g. optimization_utilities.IncrementalCost) that the last evaluated candidate was accepted """
+        if hasattr(self.cost_function, 'commit'):
+            self.cost_function.commit()
+            
+            
+    def rollback_candidate(self):
+        """ Tells a stateful cost function that the last evaluated candidate was rejected """
+        if hasattr(self.cost_function, 'rollback'):
+            self.cost_function.rollback()
+            
+    
+    def search_bounds(self):
+        """ Returns lower and upper bounds of each variable during the search, which are infinite for unbounded variables """
+        lower_bounds = np.array([self.initial_ranges[var][0] if self.is_bounded[var] else -np.inf for var in range(self.num_variables)])
+        upper_bounds = np.array([self.initial_ranges[var][1] if self.is_bounded[var] else np.inf for var in range(self.num_variables)])
+        
+        return lower_bounds, upper_bounds
+        
+        
+    def set_checkpoint(self, checkpoint_filename, interval_evaluations = None, interval_seconds = None):
+        """ Periodically save the search state to checkpoint_filename, at the end of the first iteration after interval_evaluations function evaluations
+            or interval_seconds seconds since the last checkpoint. If the file exists when optimize() is called, the search resumes from it.
+            The file is removed when optimize() finishes """
+        if interval_evaluations == None and interval_seconds == None:
+            print("Error, define the checkpoint interval in function evaluations or seconds")
+            exit(-1)
+        if (interval_evaluations != None and interval_evaluations <= 0) or (interval_seconds != None and interval_seconds <= 0):
+            print("Error, checkpoint intervals must be positive")
+            exit(-1)
+            
+        self.checkpoint_filename = checkpoint_filename
+        self.checkpoint_interval_evaluations = interval_evaluations
+        self.checkpoint_interval_seconds = interval_seconds
+        
+        
+    def save_checkpoint(self, loop_state, function_evaluations):
+        """ Save the search state: algorithm attributes, the state of the main loop, the global random state and the state of a stateful cost function """
+        state = {'algorithm'            : type(self).__name__,
+                 'num_variables'        : self.num_variables,
+                 'attributes'           : {name: copy.deepcopy(getattr(self, name)) for name in self.checkpoint_attributes},
+                 'loop_state'           : copy.deepcopy(loop_state),
+                 'function_evaluations' : function_evaluations,
+                 'random_state'         : np.random.get_state(),
+                 'accounting'           : {'function_evaluations'           : self.function_evaluations,
+                                           'best_evaluated_cost'            : self.best_evaluated_cost,
+                                           'reference_cost'                 : self.reference_cost,
+                                           'last_improvement_evaluations'   : self.last_improvement_evaluations,
+                                           'elapsed_seconds'                : self.elapsed_seconds()}}
+        if hasattr(self.cost_function, 'get_state'):
+            state['cost_function_state'] = self.cost_function.get_state()
+        
+        # Write to a temporary file first, so an interruption while writing does not corrupt the previous checkpoint
+        temporary_filename = self.checkpoint_filename + '.tmp'
+        with open(temporary_filename, 'wb') as file:
+            pickle.dump(state, file)
+        os.replace(temporary_filename, self.checkpoint_filename)
+        
+        self.last_checkpoint_evaluations = function_evaluations
+        self.last_checkpoint_time = time.monotonic()
+        
+        
+    def checkpoint_if_due(self, loop_state, function_evaluations):
+        """ Save a checkpoint if the interval since the last one was reached. Called by the algorithms at the end of their iterations """
+        if self.checkpoint_filename == None:
+            return
+            
+        evaluations_due = self.checkpoint_interval_evaluations != None and function_evaluations - self.last_checkpoint_evaluations >= self.checkpoint_interval_evaluations
+        seconds_due = self.checkpoint_interval_seconds != None and time.monotonic() - self.last_checkpoint_time >= self.checkpoint_interval_seconds
+        if evaluations_due or seconds_due:
+            self.save_checkpoint(loop_state, function_evaluations)
+            
+            
+    def resume_checkpoint(self):
+        """ Start the accounting of a search. If a checkpoint exists, restore the search state from it and return the state of the main loop. Otherwise return None """
+        self.last_checkpoint_evaluations = 0
+        self.last_checkpoint_time = time.monotonic()
+        self.function_evaluations = 0
+        self.best_evaluated_cost = np.inf
+        self.reference_cost = np.inf
+        self.last_improvement_evaluations = 0
+        self.search_start_time = time.monotonic()
+        self.previous_search_seconds = 0.0
+        self.stop_reason = None
+        self.last_progress_time = self.search_start_time
+        self.search_summary = None
+        if instrumentation.enabled:
+            instrumentation.reset()
+            instrumentation.trace('search_start', algorithm = type(self).__name__, num_variables = self.num_variables, 
+                                  resumed = self.checkpoint_filename != None and os.path.exists(self.checkpoint_filename))
+        if self.checkpoint_filename == None or not os.path.exists(self.checkpoint_filename):
+            return None
+            
+        with open(self.checkpoint_filename, 'rb') as file:
+            state = pickle.load(file)
+        if state['algorithm'] != type(self).__name__ or state['num_variables'] != self.num_variables:
+            print("Error, the checkpoint was saved by a different algorithm or problem")
+            exit(-1)
+            
+        for name, value in state['attributes'].items():
+            setattr(self, name, value)
+        np.random.set_state(state['random_state'])
+        if 'cost_function_state' in state:
+            self.cost_function.set_state(state['cost_function_state'])
+        self.last_checkpoint_evaluations = state['function_evaluations']
+        if 'accounting' in state:
+            self.function_evaluations = state['accounting']['function_evaluations']
+            self.best_evaluated_cost = state['accounting']['best_evaluated_cost']
+            self.reference_cost = state['accounting']['reference_cost']
+            self.last_improvement_evaluations = state['accounting']['last_improvement_evaluations']
+            self.previous_search_seconds = state['accounting']['elapsed_seconds']
+        
+        return state['loop_state']
+        
+        
+    def finish_search(self):
+        """ Called by the algorithms at the end of optimize(): remove the checkpoint and, with instrumentation enabled, summarize the search """
+        self.finish_checkpoints()
+        if instrumentation.enabled:
+            self.search_summary = instrumentation.summary(self.elapsed_seconds())
+            self.search_summary['function_evaluations'] = self.function_evaluations
+            self.search_summary['evaluations_per_second'] = self.function_evaluations / max(self.elapsed_seconds(), 1e-12)
+            self.search_summary['best_cost'] = self.best_evaluated_cost
+            self.search_summary['stop_reason'] = self.stop_reason
+            instrumentation.trace('search_end', algorithm = type(self).__name__, **self.search_summary)
+            
+            
+    def finish_checkpoints(self):
+        """ Remove the checkpoint of a finished search, so the next call to optimize() starts a new search """
+        if self.checkpoint_filename != None and os.path.exists(self.checkpoint_filename):
+            os.remove(self.checkpoint_filename)
+            
+            
     @abstractmethod
     def define_variables(self, initial_ranges, is_bounded):
         pass
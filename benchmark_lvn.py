@@ -0,0 +1,203 @@
+#!python3
+
+# Copyright (C) 2020  Victor O. Costa
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# Micro-benchmarks of the LVN evaluation hot path: filterbank propagation, weights normalization, output computation, NMSE, solution decoding and the cost function of define_cost.
+# Each benchmark sweeps a grid of the parameters it depends on (N, L, H, Q, alpha). After a warmup, the number of calls per measurement is chosen so that it lasts
+# at least min_measurement_seconds, and the median wall-clock time per call over the repeated measurements is reported, with evaluations and samples per second.
+# Results are written to JSON. If a baseline JSON from a previous run is given, each case is compared against it to expose speedups and regressions.
+# Usage: benchmark_lvn.py [quick] [{output json} [{baseline json}]], where quick selects a small grid
+
+# Python standard library
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import itertools
+# Third party 
+import numpy as np
+import scipy
+
+# Utilities
+import data_handling
+import optimization_utilities
+# LVN
+import laguerre_volterra_network_structure
+
+Fs = 25
+num_repeats = 5
+min_measurement_seconds = 0.05
+# A case is reported as a regression or a speedup when its time per call changes by more than this factor from the baseline
+comparison_threshold = 1.1
+
+full_grid = {'N'        : [1000, 10000, 100000, 1000000],
+             'L'        : [5, 10],
+             'H'        : [3, 5],
+             'Q'        : [2, 4],
+             'alpha'    : [0.2, 0.9]}
+quick_grid = {'N'       : [1000, 10000],
+              'L'       : [5],
+              'H'       : [3],
+              'Q'       : [4],
+              'alpha'   : [0.5]}
+
+
+def random_parameters(L, H, Q, alpha):
+    ''' Random LVN parameters, as decoded from a candidate solution '''
+    W = np.random.uniform(-1, 1, (H, L))
+    C = np.random.uniform(-1, 1, (H, Q))
+    
+    return alpha, W, C, np.random.uniform(-1, 1)
+    
+    
+def uncached_cost(compute_cost, candidate):
+    ''' Cost of a candidate after clearing the filterbank cache shared by the cost functions, so that its filterbank is always propagated '''
+    optimization_utilities.filterbank_cache.clear()
+    
+    return compute_cost(candidate, -1)
+    
+    
+def measure(function):
+    ''' Median and minimum wall-clock seconds per call of function, after a warmup call '''
+    function()
+    
+    # Number of calls so that each measurement lasts at least min_measurement_seconds
+    num_calls = 1
+    while True:
+        time_start = time.perf_counter()
+        for _ in range(num_calls):
+            function()
+        elapsed = time.perf_counter() - time_start
+        if elapsed >= min_measurement_seconds:
+            break
+        num_calls *= 2
+    
+    times = [elapsed / num_calls]
+    for _ in range(num_repeats - 1):
+        time_start = time.perf_counter()
+        for _ in range(num_calls):
+            function()
+        times.append((time.perf_counter() - time_start) / num_calls)
+    
+    return float(np.median(times)), float(np.min(times)), num_calls
+    
+    
+def benchmark_cases(grid, data_directory):
+    ''' Generator of (benchmark name, parameters, number of samples per call, function to time) '''
+    # Filterbank propagation depends on the signal, the filterbank order and alpha
+    for N, L, alpha in itertools.product(grid['N'], grid['L'], grid['alpha']):
+        system = laguerre_volterra_network_structure.LVN()
+        system.define_structure(L, 1, 1, 1/Fs)
+        x = np.random.normal(0, 1, N)
+        yield 'propagate_laguerre_filterbank', {'N': N, 'L': L, 'alpha': alpha}, N, lambda system = system, x = x, alpha = alpha: system.propagate_laguerre_filterbank(x, alpha)
+    
+    # Normalization and decoding only depend on the structure
+    for L, H, Q in itertools.product(grid['L'], grid['H'], grid['Q']):
+        system = laguerre_volterra_network_structure.LVN()
+        system.define_structure(L, H, Q, 1/Fs)
+        _, W, C, _ = random_parameters(L, H, Q, 0.5)
+        yield 'normalize_scale_parameters', {'L': L, 'H': H, 'Q': Q}, None, lambda system = system, W = W, C = C: system.normalize_scale_parameters(W, C)
+        
+        solution = np.random.uniform(0, 1, 2 + L * H + H * Q)
+        yield 'decode_solution', {'L': L, 'H': H, 'Q': Q}, None, lambda solution = solution, L = L, H = H, Q = Q: optimization_utilities.decode_solution(solution, L, H, Q)
+        
+    # NMSE depends on the signal length and on alpha, through the system memory
+    for N, alpha in itertools.product(grid['N'], grid['alpha']):
+        y = np.random.normal(0, 1, N)
+        y_pred = y + np.random.normal(0, 0.1, N)
+        yield 'NMSE', {'N': N, 'alpha': alpha}, N, lambda y = y, y_pred = y_pred, alpha = alpha: optimization_utilities.NMSE(y, y_pred, alpha)
+        
+    # Output computation and the whole cost function depend on the signal, on the structure and on alpha, through the filterbank and the system memory
+    for N, L, H, Q, alpha in itertools.product(grid['N'], grid['L'], grid['H'], grid['Q'], grid['alpha']):
+        system = laguerre_volterra_network_structure.LVN()
+        system.define_structure(L, H, Q, 1/Fs)
+        x = np.random.normal(0, 1, N)
+        alpha, W, C, offset = random_parameters(L, H, Q, alpha)
+        yield 'compute_output', {'N': N, 'L': L, 'H': H, 'Q': Q, 'alpha': alpha}, N, lambda system = system, x = x, alpha = alpha, W = W, C = C, offset = offset: system.compute_output(x, alpha, W, C, offset, True)
+        
+        # The cost function reads its signals from a file. Each call evaluates the next of a set of random candidates, with alphas within 5% of the alpha of the case,
+        #  after clearing the filterbank cache, so that every call measures an evaluation without cache hits
+        signals_filename = os.path.join(data_directory, 'benchmark_%d' % N + data_handling.IO_BINARY_EXTENSION)
+        if not os.path.exists(signals_filename):
+            data_handling.write_io_binary(signals_filename, np.random.normal(0, 1, N), np.random.normal(0, 1, N))
+        compute_cost = optimization_utilities.define_cost(L, H, Q, Fs, signals_filename)
+        candidates = np.random.uniform(0.1, 0.9, (1000, 2 + L * H + H * Q))
+        candidates[:, 0] = alpha * np.random.uniform(0.95, 1.05, 1000)
+        candidates = itertools.cycle(list(candidates))
+        yield 'compute_cost', {'N': N, 'L': L, 'H': H, 'Q': Q, 'alpha': alpha}, N, lambda compute_cost = compute_cost, candidates = candidates: uncached_cost(compute_cost, next(candidates))
+        
+        
+def case_key(result):
+    ''' Key identifying a benchmark case across runs '''
+    return result['benchmark'] + ' ' + ' '.join('%s=%s' % (name, result['parameters'][name]) for name in sorted(result['parameters']))
+    
+    
+if __name__ == '__main__':
+    arguments = [argument for argument in sys.argv[1:] if argument != 'quick']
+    grid = quick_grid if 'quick' in sys.argv[1:] else full_grid
+    output_filename = arguments[0] if len(arguments) > 0 else 'benchmark_lvn.json'
+    baseline_filename = arguments[1] if len(arguments) > 1 else None
+    
+    baseline = {}
+    if baseline_filename != None:
+        with open(baseline_filename) as file:
+            baseline = {case_key(result): result for result in json.load(file)['results']}
+    
+    np.random.seed(0)
+    results = []
+    with tempfile.TemporaryDirectory() as data_directory:
+        for benchmark, parameters, samples_per_call, function in benchmark_cases(grid, data_directory):
+            seconds_per_call, min_seconds_per_call, num_calls = measure(function)
+            result = {'benchmark'               : benchmark,
+                      'parameters'              : parameters,
+                      'seconds_per_call'        : seconds_per_call,
+                      'min_seconds_per_call'    : min_seconds_per_call,
+                      'calls_per_measurement'   : num_calls,
+                      'evaluations_per_second'  : 1 / seconds_per_call,
+                      'samples_per_second'      : samples_per_call / seconds_per_call if samples_per_call != None else None}
+            
+            line = '%-75s %12.3e s/call %12.1f eval/s' % (case_key(result), seconds_per_call, result['evaluations_per_second'])
+            if result['samples_per_second'] != None:
+                line += ' %12.3e samples/s' % result['samples_per_second']
+            if case_key(result) in baseline:
+                result['baseline_seconds_per_call'] = baseline[case_key(result)]['seconds_per_call']
+                result['speedup'] = result['baseline_seconds_per_call'] / seconds_per_call
+                line += '   %.2fx' % result['speedup']
+            print(line)
+            results.append(result)
+    
+    metadata = {'date'              : time.strftime('%Y-%m-%d %H:%M:%S'),
+                'platform'          : platform.platform(),
+                'processor'         : platform.processor(),
+                'python'            : platform.python_version(),
+                'numpy'             : np.__version__,
+                'scipy'             : scipy.__version__,
+                'num_repeats'       : num_repeats,
+                'baseline'          : baseline_filename}
+    with open(output_filename, 'w') as file:
+        json.dump({'metadata': metadata, 'results': results}, file, indent = 1)
+    
+    # Summary of the comparison with the baseline
+    compared = [result for result in results if 'speedup' in result]
+    if len(compared) > 0:
+        speedups = np.array([result['speedup'] for result in compared])
+        print('\nCompared %d cases with %s: geometric mean speedup %.2fx' % (len(compared), baseline_filename, np.exp(np.mean(np.log(speedups)))))
+        for result in compared:
+            if result['speedup'] < 1 / comparison_threshold:
+                print('Regression: %s is %.2fx slower' % (case_key(result), 1 / result['speedup']))
+            elif result['speedup'] > comparison_threshold:
+                print('Speedup: %s is %.2fx faster' % (case_key(result), result['speedup']))
@@ -0,0 +1,87 @@
+#!python3
+
+# Copyright (C) 2020  Victor O. Costa
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Check that the constant time Bates sampler of ACFSA follows the distribution of the exact sampler (the mean of n uniforms), and time both
+# For crystallization factors around and above the exact sampling threshold, samples of both samplers are compared with the two-sample Kolmogorov-Smirnov test,
+#  and the variance and excess kurtosis of the constant time samples are compared with their exact values 1/(12n) and -1.2/n
+
+# Python std lib
+import sys
+import time
+# Third party
+import numpy as np
+from scipy.stats import ks_2samp, kurtosis
+# Own
+import simulated_annealing
+
+crystallization_factors = [1, 2, 8, 32, 33, 48, 100, 1000, 10000, 100000]
+default_num_samples = 20000
+# Significance level of the whole check, divided among the tested crystallization factors (Bonferroni correction)
+significance_level = 0.01
+
+# Exact samples of the Bates distribution, drawing the uniforms in blocks to bound memory usage
+def exact_samples(n, num_samples):
+    samples = np.empty(num_samples)
+    block_size = max(1, 2 ** 22 // n)
+    for start in range(0, num_samples, block_size):
+        stop = min(start + block_size, num_samples)
+        samples[start : stop] = np.mean(np.random.uniform(low = -0.5, high = 0.5, size = (stop - start, n)), axis = 1)
+
+    return samples
+
+
+if __name__ == '__main__':
+    # Argument checking
+    if len(sys.argv) > 3:
+        print('Error, wrong number of arguments. Execute this script as follows:\npython3 %s [{number of samples} [{seed}]]' % sys.argv[0])
+        exit(-1)
+
+    num_samples = default_num_samples
+    if len(sys.argv) >= 2:
+        num_samples = int(sys.argv[1])
+        if num_samples <= 0:
+            print('Error, the number of samples must be positive')
+            exit(-1)
+    if len(sys.argv) == 3:
+        np.random.seed(int(sys.argv[2]))
+
+    threshold = simulated_annealing.BATES_EXACT_THRESHOLD
+    corrected_level = significance_level / len(crystallization_factors)
+    all_passed = True
+    print('Exact sampling up to n = %d, %d samples per sampler, KS significance level %.1e per n' % (threshold, num_samples, corrected_level))
+    for n in crystallization_factors:
+        reference = exact_samples(n, num_samples)
+
+        time_start = time.perf_counter()
+        samples = np.array([simulated_annealing.sample_bates(n, threshold) for _ in range(num_samples)])
+        sampler_time = (time.perf_counter() - time_start) / num_samples
+
+        time_start = time.perf_counter()
+        for _ in range(min(num_samples, 1000)):
+            simulated_annealing.sample_bates(n, None)
+        exact_time = (time.perf_counter() - time_start) / min(num_samples, 1000)
+
+        statistic, p_value = ks_2samp(samples, reference)
+        passed = p_value >= corrected_level
+        all_passed = all_passed and passed
+        print('n = %6d   KS D = %.4f  p = %.3f %s   variance ratio = %.4f   excess kurtosis = %+.4f (exact %+.4f)   %.2f us/sample (exact sampler %.2f us/sample)' %
+              (n, statistic, p_value, 'ok  ' if passed else 'FAIL', np.var(samples) * 12 * n, kurtosis(samples), -1.2 / n, sampler_time * 1e6, exact_time * 1e6))
+
+    if not all_passed:
+        print('Error, the constant time sampler differs from the exact sampler')
+        exit(-1)
+    print('The constant time sampler matches the exact sampler')
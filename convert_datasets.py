@@ -0,0 +1,50 @@
+#!python3
+
+# Copyright (C) 2020  Victor O. Costa
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Python std lib
+import os
+import sys
+# Own
+import data_handling
+
+## Convert the IO signals (.csv) and systems (.LVN) of a directory to the binary formats, or back to CSV with the "--csv" option
+# Usage: convert_datasets.py [{directory} [--csv]]
+directory = "./signals_and_systems"
+to_binary = True
+if len(sys.argv) > 1:
+    directory = sys.argv[1]
+if len(sys.argv) > 2 and sys.argv[2] == "--csv":
+    to_binary = False
+
+for file_name in sorted(os.listdir(directory)):
+    source_name = os.path.join(directory, file_name)
+    base_name, extension = os.path.splitext(source_name)
+    if to_binary and extension == ".csv":
+        destination_name = base_name + data_handling.IO_BINARY_EXTENSION
+        data_handling.convert_io_file(source_name, destination_name)
+    elif to_binary and extension == ".LVN":
+        destination_name = base_name + data_handling.LVN_BINARY_EXTENSION
+        data_handling.convert_LVN_file(source_name, destination_name)
+    elif not to_binary and extension == data_handling.IO_BINARY_EXTENSION:
+        destination_name = base_name + ".csv"
+        data_handling.convert_io_file(source_name, destination_name)
+    elif not to_binary and extension == data_handling.LVN_BINARY_EXTENSION:
+        destination_name = base_name + ".LVN"
+        data_handling.convert_LVN_file(source_name, destination_name)
+    else:
+        continue
+    print("%s -> %s" % (source_name, destination_name))
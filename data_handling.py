@@ -15,40 +15,105 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+# Python std lib
+import os
+import struct
 # 3rd party
 import numpy as np
 import csv
 # Own
 import simulated_systems
 import optimization_utilities
+import instrumentation
 
-# Write a given LVN structure and system into a file 
-def write_LVN_file(file_name, system_parameters):
+## Binary formats
+# IO signals: a 64 bytes header with magic, version and number of samples, followed by the input and then the output samples as little-endian float64.
+# LVN models: a 32 bytes header with magic, version, L, H and Q, followed by alpha, W, C and offset as little-endian float64, in the decode_solution layout.
+IO_BINARY_EXTENSION = ".lvio"
+LVN_BINARY_EXTENSION = ".lvnb"
+_IO_MAGIC = b"LVNIO\x00\x00\x00"
+_LVN_MAGIC = b"LVNMODEL"
+_BINARY_VERSION = 1
+_IO_HEADER = struct.Struct("<8sIQ")
+_IO_HEADER_BYTES = 64
+_LVN_HEADER = struct.Struct("<8sIIII")
+_LVN_HEADER_BYTES = 32
+_BINARY_DTYPE = np.dtype("<f8")
+
+# Check whether a file starts with the given magic bytes
+def _has_magic(file_name, magic):
+    with open(file_name, mode = 'rb') as file:
+        return file.read(len(magic)) == magic
+        
+        
+# Write a given LVN structure and system into a file, as CSV or in the binary format
+def write_LVN_file(file_name, system_parameters, binary = False):
     print(system_parameters)
     L = len(system_parameters[1][0])
     H = len(system_parameters[1])
     Q = len(system_parameters[2][0])
-    system_file_name = file_name + "_system.LVN"
-    with open(system_file_name, mode = 'w', newline='') as file:
+    if binary:
+        write_LVN_binary(file_name + "_system" + LVN_BINARY_EXTENSION, L, H, Q, system_parameters)
+    else:
+        write_LVN_csv(file_name + "_system.LVN", L, H, Q, system_parameters)
+    
+    
+# Write the (alpha, W, C, offset) parameters of an LVN into a CSV model file
+def write_LVN_csv(file_name, L, H, Q, system_parameters):
+    with open(file_name, mode = 'w', newline='') as file:
         writer = csv.writer(file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
         writer.writerow([L, H, Q])
         for parameters in system_parameters:
             writer.writerow((np.array(parameters)).flatten())
+            
+            
+# Write the (alpha, W, C, offset) parameters of an LVN into a binary model file
+def write_LVN_binary(file_name, L, H, Q, system_parameters):
+    alpha, W, C, offset = system_parameters
+    flat_parameters = np.concatenate(([alpha], np.ravel(W), np.ravel(C), [offset])).astype(_BINARY_DTYPE)
+    if len(flat_parameters) != 2 + H * L + H * Q:
+        print("Error, LVN parameters do not match the given structure")
+        exit(-1)
+        
+    with open(file_name, mode = 'wb') as file:
+        file.write(_LVN_HEADER.pack(_LVN_MAGIC, _BINARY_VERSION, L, H, Q).ljust(_LVN_HEADER_BYTES, b"\x00"))
+        file.write(flat_parameters.tobytes())
+        
+        
+# Read a binary model file and return the system's structure and parameters
+def read_LVN_binary(file_name):
+    with open(file_name, mode = 'rb') as file:
+        magic, version, L, H, Q = _LVN_HEADER.unpack(file.read(_LVN_HEADER_BYTES)[:_LVN_HEADER.size])
+        if magic != _LVN_MAGIC or version != _BINARY_VERSION:
+            print("Error, %s is not a supported binary LVN file" % file_name)
+            exit(-1)
+        flat_parameters = np.fromfile(file, dtype = _BINARY_DTYPE)
+        
+    if len(flat_parameters) != 2 + H * L + H * Q:
+        print("Error, %s is truncated" % file_name)
+        exit(-1)
+    alpha, W, C, offset = optimization_utilities.decode_solution(flat_parameters.astype(float), L, H, Q)
     
+    return L, H, Q, (alpha, W, C, offset)
     
-# Reads LVN file and returns the system's parameters
+    
+# Reads LVN file, as CSV or in the binary format, and returns the system's parameters
 def read_LVN_file(file_name):
+    if _has_magic(file_name, _LVN_MAGIC):
+        _, _, _, parameters = read_LVN_binary(file_name)
+        return parameters
+        
     with open(file_name, mode = 'r', newline='') as file:
         csv_reader = csv.reader(file, delimiter=',')
         csv_strings = []
         for row in csv_reader:
             csv_strings.append(row)
         
-        L, H, Q   = list( np.array(csv_strings[0]).astype(np.int) )
+        L, H, Q   = list( np.array(csv_strings[0]).astype(int) )
         
         alpha       = float(csv_strings[1][0])
-        flat_W      = list( np.array(csv_strings[2]).astype(np.float) )
-        flat_C      = list( np.array(csv_strings[3]).astype(np.float) )
+        flat_W      = list( np.array(csv_strings[2]).astype(float) )
+        flat_C      = list( np.array(csv_strings[3]).astype(float) )
         offset      = float(csv_strings[4][0])
         
         concatenated_parameters = [alpha] + flat_W + flat_C + [offset]
@@ -58,7 +123,8 @@ def read_LVN_file(file_name):
         
         
 # Generate IO data using a Gaussian White Noise (GWN) signal as input to enable the system to capture dynamics of frequency cross-terms, adding GWN to output to reach a certain SNR
-def generate_io(system_type, num_samples, file_name, deterministic_parameters):
+# Signals and systems are written as CSV, or in the binary formats if binary is True
+def generate_io(system_type, num_samples, file_name, deterministic_parameters, binary = False):
 
     if system_type.lower() != "lvn" and system_type.lower() != "cascade":
         print("The system type must be \"lvn\" or \"cascade\"")
@@ -76,7 +142,7 @@ def generate_io(system_type, num_samples, file_name, deterministic_parameters):
         else:
             noiseless_output = simulated_systems.simulate_LVN_deterministic(input, L, H, Q, deterministic_parameters)
             
-        write_LVN_file(file_name, deterministic_parameters)
+        write_LVN_file(file_name, deterministic_parameters, binary)
     # Infinite order
     else:
         # Train
@@ -100,13 +166,20 @@ def generate_io(system_type, num_samples, file_name, deterministic_parameters):
     # Generate noisy output
     output = noiseless_output + noise
     
-    csv_name = file_name + ".csv"
-    with open(csv_name, mode = 'w', newline='') as file:
+    if binary:
+        write_io_binary(file_name + IO_BINARY_EXTENSION, input, output)
+    else:
+        write_io(file_name + ".csv", input, output)
+    
+    return deterministic_parameters
+
+
+# Write IO data into a CSV, one signal per row
+def write_io(file_name, input, output):
+    with open(file_name, mode = 'w', newline='') as file:
         csv_writer = csv.writer(file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
         csv_writer.writerow(input)
         csv_writer.writerow(output)
-    
-    return deterministic_parameters
 
 
 # Read IO data from CSVs
@@ -127,4 +200,114 @@ def read_io(file_name):
             input.append(float(input_string[index]))
             output.append(float(output_string[index]))
         
-    return input, output
\ No newline at end of file
+    return input, output
+
+
+# Write IO data into the binary format
+def write_io_binary(file_name, input, output):
+    input = np.ascontiguousarray(input, dtype = _BINARY_DTYPE)
+    output = np.ascontiguousarray(output, dtype = _BINARY_DTYPE)
+    if len(input) != len(output):
+        print("Error, input and output signals have different lengths")
+        exit(-1)
+        
+    with open(file_name, mode = 'wb') as file:
+        file.write(_IO_HEADER.pack(_IO_MAGIC, _BINARY_VERSION, len(input)).ljust(_IO_HEADER_BYTES, b"\x00"))
+        file.write(input.tobytes())
+        file.write(output.tobytes())
+        
+        
+# Map binary IO data into memory, returning read-only input and output arrays backed by the file. No sample is read until it is used
+def read_io_binary(file_name):
+    with open(file_name, mode = 'rb') as file:
+        magic, version, num_samples = _IO_HEADER.unpack(file.read(_IO_HEADER.size))
+    if magic != _IO_MAGIC or version != _BINARY_VERSION:
+        print("Error, %s is not a supported binary IO file" % file_name)
+        exit(-1)
+    if os.path.getsize(file_name) != _IO_HEADER_BYTES + 2 * num_samples * _BINARY_DTYPE.itemsize:
+        print("Error, %s is truncated" % file_name)
+        exit(-1)
+    if num_samples == 0:
+        return np.zeros(0), np.zeros(0)
+        
+    signals = np.memmap(file_name, dtype = _BINARY_DTYPE, mode = 'r', offset = _IO_HEADER_BYTES, shape = (2, num_samples))
+    
+    return signals[0], signals[1]
+    
+    
+# Check whether a file holds IO data in the binary format
+def is_binary_io(file_name):
+    return _has_magic(file_name, _IO_MAGIC)
+    
+    
+# Convert IO data between CSV and the binary format. The source format is detected, the destination is binary if its name ends with IO_BINARY_EXTENSION
+def convert_io_file(source_name, destination_name):
+    if is_binary_io(source_name):
+        input, output = read_io_binary(source_name)
+    else:
+        input, output = read_io(source_name)
+        
+    if destination_name.endswith(IO_BINARY_EXTENSION):
+        write_io_binary(destination_name, input, output)
+    else:
+        write_io(destination_name, input, output)
+        
+        
+# Convert an LVN file between CSV and the binary format. The source format is detected, the destination is binary if its name ends with LVN_BINARY_EXTENSION
+def convert_LVN_file(source_name, destination_name):
+    alpha, W, C, offset = read_LVN_file(source_name)
+    H, L = np.shape(W)
+    Q = np.shape(C)[1]
+    
+    if destination_name.endswith(LVN_BINARY_EXTENSION):
+        write_LVN_binary(destination_name, L, H, Q, (alpha, W, C, offset))
+    else:
+        write_LVN_csv(destination_name, L, H, Q, (alpha, W, C, offset))
+
+
+class IODataset:
+    ''' Input and output signals of a dataset, stored as contiguous float64 arrays, along with constants derived from them. '''
+    def __init__(self, key, input, output):
+        ''' Constructor. '''
+        if len(input) != len(output):
+            print("Error, input and output signals have different lengths")
+            exit(-1)
+        
+        self.key = key                                                      # (file path, modification time) pair identifying the dataset contents
+        self.input = np.ascontiguousarray(input, dtype = np.float64)
+        self.output = np.ascontiguousarray(output, dtype = np.float64)
+        self.num_samples = len(self.input)
+        self._output_energies = {}                                          # Sum of squared outputs after the first M samples, keyed by M
+        
+        
+    def output_energy(self, M):
+        ''' Sum of squared output samples from sample M on, which is the denominator of the NMSE for a system with memory M. '''
+        if M not in self._output_energies:
+            if self.num_samples <= M:
+                print("Data length is less than required by the memory parameter")
+                exit(-1)
+            tail = self.output[M:]
+            self._output_energies[M] = float(np.dot(tail, tail))
+        
+        return self._output_energies[M]
+        
+        
+# Datasets already loaded by this process, keyed by absolute file path. Each entry keeps the modification time the dataset was read with.
+_loaded_datasets = {}
+
+# Load IO data from a CSV or a binary file only once per process, returning an IODataset. Binary files are memory-mapped instead of read
+def load_io(file_name):
+    path = os.path.abspath(file_name)
+    mtime = os.stat(path).st_mtime_ns
+    
+    # Reload the dataset if it is not cached or if the file changed after it was cached
+    if path not in _loaded_datasets or _loaded_datasets[path].key[1] != mtime:
+        with instrumentation.phase('data_loading'):
+            if is_binary_io(path):
+                input, output = read_io_binary(path)
+            else:
+                input, output = read_io(path)
+        _loaded_datasets[path] = IODataset((path, mtime), input, output)
+    
+    return _loaded_datasets[path]
+
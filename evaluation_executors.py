@@ -0,0 +1,141 @@
+#!python3
+
+# Copyright (C) 2020  Victor O. Costa
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Executors evaluate the solutions of a generation (a (P, D) matrix) and return their P costs in the same order.
+# Costs only depend on the solutions, so results are the same for any executor and number of workers.
+
+# Python std lib
+import concurrent.futures
+# 3rd party
+import numpy as np
+
+
+def evaluate_chunk(solutions, cost_function, batch_cost_function):
+    """ Evaluate a chunk of solutions with the batch cost function if available, otherwise with one cost function call per solution """
+    if batch_cost_function != None:
+        return np.asarray(batch_cost_function(solutions), dtype = np.float64)
+    
+    costs = np.zeros(len(solutions))
+    for i, solution in enumerate(solutions):
+        costs[i] = cost_function(solution, -1)
+        
+    return costs
+    
+    
+def split_chunks(solutions, num_chunks):
+    """ Split solutions into at most num_chunks contiguous non-empty chunks """
+    return [chunk for chunk in np.array_split(solutions, min(num_chunks, len(solutions))) if len(chunk) > 0]
+    
+    
+class SerialExecutor:
+    """ Evaluates solutions in the calling process """
+    
+    def evaluate(self, solutions, cost_function, batch_cost_function):
+        """ Returns the costs of a (P, D) matrix of solutions """
+        return evaluate_chunk(solutions, cost_function, batch_cost_function)
+        
+    def shutdown(self):
+        pass
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        
+        
+class ThreadExecutor(SerialExecutor):
+    """ Evaluates contiguous chunks of solutions in a pool of threads of the calling process.
+        Only worthwhile when the cost function releases the GIL for most of its time (e.g. long signals) """
+    
+    def __init__(self, num_workers):
+        """ Constructor """
+        if num_workers <= 0:
+            print("Error, the number of workers must be positive")
+            exit(-1)
+            
+        self.num_workers = num_workers
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers = num_workers)
+        
+        
+    def evaluate(self, solutions, cost_function, batch_cost_function):
+        """ Returns the costs of a (P, D) matrix of solutions """
+        chunks = split_chunks(solutions, self.num_workers)
+        futures = [self.pool.submit(evaluate_chunk, chunk, cost_function, batch_cost_function) for chunk in chunks]
+        
+        return np.concatenate([future.result() for future in futures])
+        
+        
+    def shutdown(self):
+        self.pool.shutdown()
+        
+        
+# Cost functions of a process pool worker, defined on its first chunk (pool initializers need Python 3.7)
+_worker_cost_definitions = None
+_worker_cost_function = None
+_worker_batch_cost_function = None
+
+def _initialize_worker(cost_definition, batch_cost_definition, cost_arguments):
+    """ Define the cost functions of a worker process, loading the dataset once for all its evaluations """
+    global _worker_cost_definitions, _worker_cost_function, _worker_batch_cost_function
+    _worker_cost_definitions = (cost_definition, batch_cost_definition, cost_arguments)
+    _worker_cost_function = None
+    _worker_batch_cost_function = None
+    if cost_definition != None:
+        _worker_cost_function = cost_definition(*cost_arguments)
+    if batch_cost_definition != None:
+        _worker_batch_cost_function = batch_cost_definition(*cost_arguments)
+        
+        
+def _evaluate_worker_chunk(solutions, cost_definition, batch_cost_definition, cost_arguments):
+    """ Evaluate a chunk of solutions with the cost functions of the worker process, defining them if this is its first chunk """
+    if _worker_cost_definitions != (cost_definition, batch_cost_definition, cost_arguments):
+        _initialize_worker(cost_definition, batch_cost_definition, cost_arguments)
+        
+    return evaluate_chunk(solutions, _worker_cost_function, _worker_batch_cost_function)
+    
+    
+class ProcessExecutor(SerialExecutor):
+    """ Evaluates contiguous chunks of solutions in a pool of persistent worker processes.
+        Cost functions are closures and cannot be sent to other processes, so each worker builds its own by calling
+        cost_definition(*cost_arguments) and/or batch_cost_definition(*cost_arguments) (e.g. optimization_utilities.define_cost with (L, H, Q, Fs, train_filename)).
+        The cost functions passed to evaluate are ignored """
+    
+    def __init__(self, num_workers, cost_definition, cost_arguments, batch_cost_definition = None):
+        """ Constructor """
+        if num_workers <= 0:
+            print("Error, the number of workers must be positive")
+            exit(-1)
+        if cost_definition == None and batch_cost_definition == None:
+            print("Error, define at least one cost function for the workers")
+            exit(-1)
+            
+        self.num_workers = num_workers
+        self.cost_definitions = (cost_definition, batch_cost_definition, tuple(cost_arguments))
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers = num_workers)
+        
+        
+    def evaluate(self, solutions, cost_function, batch_cost_function):
+        """ Returns the costs of a (P, D) matrix of solutions """
+        chunks = split_chunks(solutions, self.num_workers)
+        futures = [self.pool.submit(_evaluate_worker_chunk, chunk, *self.cost_definitions) for chunk in chunks]
+        
+        return np.concatenate([future.result() for future in futures])
+        
+        
+    def shutdown(self):
+        self.pool.shutdown()
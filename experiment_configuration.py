@@ -0,0 +1,195 @@
+#!python3
+
+# Copyright (C) 2020  Victor O. Costa
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Configuration of the experiments: simulated systems, LVN structures, search space and metaheuristic parameters
+
+# Utilities
+import optimization_utilities
+# Metaheuristics
+import ant_colony_for_continuous_domains
+import simulated_annealing
+import particle_swarm_optimization
+
+# Simulated system orders and metaheuristics, in the order their results are reported
+orders = ['finite', 'infinite']
+metaheuristic_names = ['sa', 'acfsa', 'pso', 'aiwpso', 'acor', 'baacor']
+
+# Number of independent runs of each metaheuristic
+num_runs = 30
+
+# Number of objective function evaluations of interest
+function_evals = [i * 100 for i in range(101)] + [11000 + i * 1000 for i in range(90)]
+
+# Sampling frequency is assumed to be 25 Hz, but could be any other value
+Fs = 25
+
+
+# Filenames for train and test signals of a simulated system
+def signal_filenames(order_str):
+    train_filename = './signals_and_systems/' + order_str + '_order_train.csv'
+    test_filename  = './signals_and_systems/' + order_str + '_order_test.csv'
+    
+    return train_filename, test_filename
+    
+    
+# Whether the simulated system has finite or infinite order determines the structure of the optimized LVN
+def lvn_structure(order_str):
+    if order_str == 'finite':
+        L = 5;  H = 3;  Q = 4
+    else:
+        L = 2;  H = 3;  Q = 5
+        
+    return L, H, Q
+    
+    
+# Define the ranges to be used in random initialization of algorithms for each variable,
+#  along with which variables are bounded by these ranges during the optimization
+def search_space(L, H, Q):
+    # Variables initial ranges
+    alpha_min   = 1e-5; alpha_max   = 0.9   # estimated lag with alpha = 0.9 is 263
+    weight_min  = -1;   weight_max  = 1
+    coef_min    = -1;   coef_max    = 1  
+    offset_min  = -1;   offset_max  = 1
+    
+    initial_ranges = []
+    is_bounded = []
+    
+    # Alpha variable is bounded
+    initial_ranges.append([alpha_min,alpha_max])
+    is_bounded.append(True)
+    # Hidden units input weights are forcedly bounded by l2-normalization (normalization to unit Euclidean norm), not by the metaheuristics
+    for _ in range(L * H): 
+        initial_ranges.append([weight_min, weight_max])
+        is_bounded.append(False)
+    # Polynomial coefficients are not bounded in the initial range
+    for _ in range(Q * H):
+        initial_ranges.append([coef_min,coef_max])
+        is_bounded.append(False)
+    # Output offset is not bounded in the initial range
+    initial_ranges.append([offset_min, offset_max])
+    is_bounded.append(False)
+    
+    return initial_ranges, is_bounded
+    
+    
+# Instantiate and parameterize a metaheuristic by its (lower case) name
+def build_metaheuristic(metaheuristic_name, function_evals):
+    if metaheuristic_name == 'acor':
+        # Parameters used for ACOr
+        k = 50;  pop_size = 10;  q = 0.01; xi = 0.85
+        metaheuristic = ant_colony_for_continuous_domains.ACOr()
+        metaheuristic.set_parameters(pop_size, k, q, xi, function_evals)
+        
+    elif metaheuristic_name == 'baacor':
+        # Parameters used for BAACOr
+        k = 50
+        m = 10
+        q_min = 1e-2;    q_max = 1.0
+        xi_min = 0.1;    xi_max = 0.93
+        # Configure
+        metaheuristic = ant_colony_for_continuous_domains.BAACOr()
+        metaheuristic.set_parameters(m, k, q_min, q_max, xi_min, xi_max, 'exp', 'sig', function_evals)
+        
+    elif metaheuristic_name == 'sa':
+        # Parameters to be used for SA
+        initial_temperature = 10.0;  cooling_constant = 0.99;  step_size = 1e-2;
+        local_iterations = 100
+        metaheuristic = simulated_annealing.SA()
+        metaheuristic.set_parameters(initial_temperature, cooling_constant, step_size, local_iterations, function_evals)
+        
+    elif metaheuristic_name == 'acfsa':
+        # Parameters to be used for ACFSA
+        local_iterations = 100
+        initial_temperature = 10
+        cooling_constant = 0.99
+        # Configure
+        metaheuristic = simulated_annealing.ACFSA()
+        metaheuristic.set_parameters(initial_temperature, cooling_constant, local_iterations, function_evals)
+        
+    elif metaheuristic_name == 'ptsa':
+        # Parameters to be used for parallel tempering SA, whose temperature ladder covers several orders of magnitude around the SA initial temperature
+        min_temperature = 1e-2;  max_temperature = 10.0;  cooling_constant = 0.99;  step_size = 1e-2
+        local_iterations = 10;  num_replicas = 10;  exchange_interval = 10
+        metaheuristic = simulated_annealing.ParallelTemperingSA()
+        metaheuristic.set_parameters(min_temperature, max_temperature, cooling_constant, step_size, local_iterations, num_replicas, exchange_interval, function_evals)
+        
+    elif metaheuristic_name == 'ptacfsa':
+        # Parameters to be used for parallel tempering ACFSA
+        min_temperature = 1e-2;  max_temperature = 10.0;  cooling_constant = 0.99
+        local_iterations = 10;  num_replicas = 10;  exchange_interval = 10
+        metaheuristic = simulated_annealing.ParallelTemperingACFSA()
+        metaheuristic.set_parameters(min_temperature, max_temperature, cooling_constant, local_iterations, num_replicas, exchange_interval, function_evals)
+        
+    elif metaheuristic_name == 'pso':
+        # Parameters to be used for PSO
+        swarm_size = 20;  personal_acceleration = 2;  global_acceleration = 2
+        metaheuristic = particle_swarm_optimization.PSO()
+        metaheuristic.set_parameters(swarm_size, personal_acceleration, global_acceleration, function_evals)
+        
+    elif metaheuristic_name == 'aiwpso':
+        # Parameters to be used for AIWPSO
+        swarm_size = 20;  personal_acceleration = 2;  global_acceleration = 2
+        min_inertia = 0.3; max_inertia = 0.99
+        metaheuristic = particle_swarm_optimization.AIWPSO()
+        metaheuristic.set_parameters(swarm_size, personal_acceleration, global_acceleration, min_inertia, max_inertia, function_evals)
+        
+    else:
+        print('Error, choose an available metaheuristic')
+        exit(-1)
+        
+    metaheuristic.set_verbosity(False)
+    
+    return metaheuristic
+    
+    
+# Cost function definition based on structural parameters and ground truth
+def set_costs(metaheuristic, metaheuristic_name, L, H, Q, train_filename):
+    # SA and ACFSA modify a single variable per candidate, so they use the incremental cost evaluation.
+    # Their parallel tempering variants evaluate one candidate per replica at once, so they use the batch cost evaluation as the population-based metaheuristics
+    if metaheuristic_name == 'sa' or metaheuristic_name == 'acfsa':
+        metaheuristic.set_cost(optimization_utilities.IncrementalCost(L, H, Q, Fs, train_filename))
+    else:
+        metaheuristic.set_cost(optimization_utilities.define_cost(L, H, Q, Fs, train_filename))
+        metaheuristic.set_batch_cost(optimization_utilities.define_batch_cost(L, H, Q, Fs, train_filename))
+        
+        
+# Instantiate a metaheuristic and configure it to optimize the LVN of a simulated system
+# By default, solutions are recorded at the function evaluations of interest of the experiments
+def configure_experiment(order_str, metaheuristic_name, function_evaluations_array = None):
+    train_filename, _ = signal_filenames(order_str)
+    L, H, Q = lvn_structure(order_str)
+    
+    if function_evaluations_array is None:
+        function_evaluations_array = function_evals
+    metaheuristic = build_metaheuristic(metaheuristic_name, function_evaluations_array)
+    set_costs(metaheuristic, metaheuristic_name, L, H, Q, train_filename)
+    initial_ranges, is_bounded = search_space(L, H, Q)
+    metaheuristic.define_variables(initial_ranges, is_bounded)
+    
+    return metaheuristic
+    
+    
+# Compute the cost on the test set of each solution found at the function evaluations of interest
+def test_costs(solutions_at_FEs, L, H, Q, test_data, LVN):
+    run_test_NMSEs = []
+    for solution in solutions_at_FEs:
+        alpha, W, C, offset = optimization_utilities.decode_solution(solution, L, H, Q)
+        test_out_prediction = LVN.compute_output(test_data.input, alpha, W, C, offset, True, test_data.key)
+        test_nmse = optimization_utilities.NMSE_dataset(test_data, test_out_prediction, alpha)
+        run_test_NMSEs.append(test_nmse)
+        
+    return run_test_NMSEs
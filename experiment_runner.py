@@ -0,0 +1,150 @@
+#!python3
+
+# Copyright (C) 2020  Victor O. Costa
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Run every (simulated system order, metaheuristic, run) job of the experiments on a pool of local processes.
+# Each job seeds the random number generator from its own position in the job matrix, so results do not depend on scheduling.
+# Finished jobs are stored in ./results/runs/ and skipped when the runner is restarted.
+# When all runs of a metaheuristic in a system are finished, they are gathered into the ./results/*.npy files read by results_stats.py
+# With the 'trace' flag, each job also writes a JSON-lines trace of its search (progress, phase timers and summary) next to its results
+
+# Python standard library
+import os
+import sys
+import time
+import concurrent.futures
+# Third party 
+import numpy as np
+
+# Utilities
+import data_handling
+import experiment_configuration
+import instrumentation
+# LVN
+import laguerre_volterra_network_structure
+
+runs_directory = './results/runs/'
+# Seed of the whole experiment, from which the seed of each job is derived
+default_base_seed = 2020
+
+
+def run_filename(order_str, metaheuristic_name, run):
+    return runs_directory + f'{metaheuristic_name}_{order_str}_run{run}.npz'
+    
+    
+def trace_filename(order_str, metaheuristic_name, run):
+    return runs_directory + f'{metaheuristic_name}_{order_str}_run{run}.trace.jsonl'
+    
+    
+def job_seed(base_seed, order_str, metaheuristic_name, run):
+    ''' Independent seed for the global NumPy random state of a job, determined only by its position in the job matrix '''
+    order_index = experiment_configuration.orders.index(order_str)
+    metaheuristic_index = experiment_configuration.metaheuristic_names.index(metaheuristic_name)
+    seed_sequence = np.random.SeedSequence(base_seed, spawn_key = (order_index, metaheuristic_index, run))
+    
+    return seed_sequence.generate_state(4)
+    
+    
+def run_job(order_str, metaheuristic_name, run, base_seed, trace = False):
+    ''' Optimize an LVN once and save the solutions found at the function evaluations of interest, with their test costs and the wall-clock time spent,
+        as results_collection.py does. With more processes than cores, this time includes waiting for the other jobs '''
+    np.random.seed(job_seed(base_seed, order_str, metaheuristic_name, run))
+    
+    L, H, Q = experiment_configuration.lvn_structure(order_str)
+    _, test_filename = experiment_configuration.signal_filenames(order_str)
+    metaheuristic = experiment_configuration.configure_experiment(order_str, metaheuristic_name)
+    
+    if trace:
+        instrumentation.enable(trace_filename(order_str, metaheuristic_name, run))
+    time_start = time.perf_counter()
+    solutions_at_FEs = metaheuristic.optimize()
+    time_end = time.perf_counter()
+    instrumentation.disable()
+    
+    test_data = data_handling.load_io(test_filename)
+    LVN = laguerre_volterra_network_structure.LVN()
+    LVN.define_structure(L, H, Q, 1/experiment_configuration.Fs)
+    test_costs = experiment_configuration.test_costs(solutions_at_FEs, L, H, Q, test_data, LVN)
+    
+    # Write to a temporary file first, so that an interrupted job never leaves a finished-looking file
+    filename = run_filename(order_str, metaheuristic_name, run)
+    temporary_filename = filename + '.tmp.npz'
+    np.savez(temporary_filename, time = time_end - time_start, train_solutions = solutions_at_FEs, test_costs = test_costs)
+    os.replace(temporary_filename, filename)
+    
+    return order_str, metaheuristic_name, run
+    
+    
+def gather_results(order_str, metaheuristic_name):
+    ''' Gather all runs of a metaheuristic in a system into the files produced by results_collection.py '''
+    optimization_times = []
+    train_solutions = []
+    train_costs = []
+    test_costs = []
+    for run in range(experiment_configuration.num_runs):
+        with np.load(run_filename(order_str, metaheuristic_name, run)) as run_results:
+            optimization_times.append(float(run_results['time']))
+            train_solutions.append(run_results['train_solutions'])
+            train_costs.append(run_results['train_solutions'][:, -1])
+            test_costs.append(run_results['test_costs'])
+            
+    output_base_filename = metaheuristic_name + '_' + order_str
+    np.save('./results/' + output_base_filename + '_times.npy'          , optimization_times)   
+    np.save('./results/' + output_base_filename + '_train_solutions.npy', train_solutions)
+    np.save('./results/' + output_base_filename + '_train_costs.npy', train_costs)
+    np.save('./results/' + output_base_filename + '_test_costs.npy' , test_costs)
+    
+    
+if __name__ == '__main__':
+    # Argument checking
+    trace = 'trace' in sys.argv[1:]
+    arguments = [argument for argument in sys.argv[1:] if argument != 'trace']
+    if len(arguments) > 2:
+        print('Error, wrong number of arguments. Execute this script as follows:\npython3 %s [trace] [{number of processes} [{base seed}]]' % sys.argv[0])
+        print('By default, one process per CPU is used and the base seed is %d' % default_base_seed)
+        exit(-1)
+        
+    num_processes = os.cpu_count()
+    if len(arguments) >= 1:
+        num_processes = int(arguments[0])
+        if num_processes <= 0:
+            print('Error, the number of processes must be positive')
+            exit(-1)
+    base_seed = default_base_seed
+    if len(arguments) == 2:
+        base_seed = int(arguments[1])
+        
+    os.makedirs(runs_directory, exist_ok = True)
+    
+    # Expand the job matrix, skipping jobs finished by previous executions
+    jobs = []
+    for order_str in experiment_configuration.orders:
+        for metaheuristic_name in experiment_configuration.metaheuristic_names:
+            for run in range(experiment_configuration.num_runs):
+                if not os.path.exists(run_filename(order_str, metaheuristic_name, run)):
+                    jobs.append((order_str, metaheuristic_name, run))
+    print('%d jobs to run on %d processes' % (len(jobs), num_processes))
+    
+    with concurrent.futures.ProcessPoolExecutor(max_workers = num_processes) as pool:
+        futures = [pool.submit(run_job, order_str, metaheuristic_name, run, base_seed, trace) for order_str, metaheuristic_name, run in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            order_str, metaheuristic_name, run = future.result()
+            print('Finished %s %s run %d' % (metaheuristic_name, order_str, run))
+            
+    # Gather the runs of each metaheuristic in each system
+    for order_str in experiment_configuration.orders:
+        for metaheuristic_name in experiment_configuration.metaheuristic_names:
+            gather_results(order_str, metaheuristic_name)
@@ -0,0 +1,160 @@
+#!python3
+
+# Copyright (C) 2020  Victor O. Costa
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# Opt-in instrumentation of searches and cost evaluations: per-phase wall-clock timers, counters, cache hit rates and a JSON-lines trace.
+# Instrumentation is disabled by default. While disabled, phase() returns a shared no-op context and nothing is recorded, so instrumented code only pays a function call.
+# Phases may be nested: the 'evaluation' phase of the metaheuristics contains the 'filterbank', 'readout' and 'nmse' phases of the cost functions.
+# Only the current process is recorded: with evaluation_executors.ProcessExecutor, the phases of the cost functions run in the worker processes are not captured,
+#  and the 'evaluation' phase of the metaheuristics is the wall-clock time spent waiting for the workers.
+
+# Python std lib
+import json
+import time
+from collections import defaultdict
+
+enabled = False
+phase_seconds = defaultdict(float)              # Accumulated seconds of each phase
+phase_calls = defaultdict(int)                  # Number of times each phase was entered
+counters = defaultdict(int)
+caches = {}                                     # Caches whose statistics() are reported, by name
+trace_interval_seconds = 1.0                    # Minimum seconds between progress events of a search
+_cache_baselines = {}                           # Hits and misses of each cache when the statistics were reset
+_trace_file = None
+_start_time = time.perf_counter()
+
+
+class _NullPhase:
+    ''' Context returned by phase() while instrumentation is disabled. '''
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+        
+_null_phase = _NullPhase()
+
+
+class _Phase:
+    ''' Context accumulating the wall-clock time spent inside it into a named phase. '''
+    __slots__ = ('name', 'start')
+    
+    def __init__(self, name):
+        self.name = name
+        
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        phase_seconds[self.name] += time.perf_counter() - self.start
+        phase_calls[self.name] += 1
+        return False
+        
+        
+def phase(name):
+    ''' Context manager timing a phase, e.g. "with instrumentation.phase('filterbank'):" '''
+    if not enabled:
+        return _null_phase
+    
+    return _Phase(name)
+    
+    
+def count(name, amount = 1):
+    ''' Increase a named counter '''
+    if enabled:
+        counters[name] += amount
+        
+        
+def register_cache(name, cache):
+    ''' Report the hit rate of a cache with a statistics() method, such as laguerre_volterra_network_structure.FilterbankCache '''
+    caches[name] = cache
+    
+    
+def reset():
+    ''' Clear timers and counters, and count cache hits and misses from now on '''
+    global _start_time
+    phase_seconds.clear()
+    phase_calls.clear()
+    counters.clear()
+    for name, cache in caches.items():
+        statistics = cache.statistics()
+        _cache_baselines[name] = (statistics['hits'], statistics['misses'])
+    _start_time = time.perf_counter()
+    
+    
+def enable(trace_filename = None, interval_seconds = 1.0):
+    ''' Start recording. If trace_filename is given, events are written to it as one JSON object per line '''
+    global enabled, _trace_file, trace_interval_seconds
+    disable()
+    reset()
+    enabled = True
+    trace_interval_seconds = interval_seconds
+    if trace_filename != None:
+        _trace_file = open(trace_filename, 'w', buffering = 1)
+        
+        
+def disable():
+    ''' Stop recording and close the trace file. Accumulated data can still be read with summary() '''
+    global enabled, _trace_file
+    enabled = False
+    if _trace_file != None:
+        _trace_file.close()
+        _trace_file = None
+        
+        
+def trace(event, **fields):
+    ''' Write an event with the seconds since recording started and the given fields to the trace file, if any '''
+    if _trace_file == None:
+        return
+    
+    record = {'event': event, 'time': time.perf_counter() - _start_time}
+    record.update(fields)
+    _trace_file.write(json.dumps(record, default = float) + '\n')
+    
+    
+def cache_statistics():
+    ''' Hits, misses and hit rate of each registered cache since the last reset '''
+    statistics = {}
+    for name, cache in caches.items():
+        cache_statistics = cache.statistics()
+        initial_hits, initial_misses = _cache_baselines.get(name, (0, 0))
+        hits = cache_statistics['hits'] - initial_hits
+        misses = cache_statistics['misses'] - initial_misses
+        statistics[name] = {'hits'      : hits,
+                            'misses'    : misses,
+                            'hit_rate'  : hits / (hits + misses) if hits + misses > 0 else 0.0,
+                            'evictions' : cache_statistics['evictions'],
+                            'bytes'     : cache_statistics['bytes']}
+    
+    return statistics
+    
+    
+def summary(total_seconds = None):
+    ''' Timers, counters and cache statistics recorded since the last reset.
+        Given the total seconds of a search, also the fraction spent in cost evaluations and whether the search is bound by them or by the algorithm overhead.
+        Phases of worker processes (e.g. of evaluation_executors.ProcessExecutor) are not included '''
+    report = {'phases'  : {name: {'seconds': phase_seconds[name], 'calls': phase_calls[name]} for name in sorted(phase_seconds)},
+              'counters': dict(counters),
+              'caches'  : cache_statistics()}
+    
+    if total_seconds != None and total_seconds > 0:
+        evaluation_seconds = phase_seconds.get('evaluation', 0.0)
+        report['total_seconds'] = total_seconds
+        report['evaluation_fraction'] = evaluation_seconds / total_seconds
+        report['overhead_seconds'] = total_seconds - evaluation_seconds
+        report['bound_by'] = 'evaluation' if evaluation_seconds >= total_seconds / 2 else 'overhead'
+        
+    return report
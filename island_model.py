@@ -0,0 +1,235 @@
+#!python3
+
+# Copyright (C) 2020  Victor O. Costa
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Island model: several instances of a metaheuristic search the same problem in separate processes, periodically sending their best solutions to each other.
+# Each island receives an equal share of the function evaluations budget, so the global number of function evaluations at each record is the same of a single search,
+#  and the global solution at each record is the best one among the islands.
+# Migrations happen every migration_interval iterations of the metaheuristic, through its iteration hook, between neighbouring islands of a ring or fully connected topology.
+# They are synchronous: an island waits for the migrants of its neighbours before continuing, so results depend only on the seed.
+# Islands that finish their search (e.g. by a stopping criterion) notify their neighbours, which stop waiting for them.
+
+# Python std lib
+import sys
+import multiprocessing
+import concurrent.futures
+# Third party
+import numpy as np
+# Own
+import experiment_configuration
+import data_handling
+import laguerre_volterra_network_structure
+
+topologies = ['ring', 'fully_connected']
+
+# Islands to which an island sends its emigrants
+def out_neighbours(island, num_islands, topology):
+    if num_islands == 1:
+        return []
+    if topology == 'ring':
+        return [(island + 1) % num_islands]
+
+    return [other for other in range(num_islands) if other != island]
+
+# Islands from which an island receives migrants
+def in_neighbours(island, num_islands, topology):
+    if num_islands == 1:
+        return []
+    if topology == 'ring':
+        return [(island - 1) % num_islands]
+
+    return [other for other in range(num_islands) if other != island]
+
+
+class Migration:
+    """ Iteration hook of an island, exchanging migrants with its neighbours every migration_interval iterations.
+        Messages are (source island, migration number, emigrants), or (source island, None, None) when the source finished its search """
+
+    def __init__(self, island, num_islands, topology, migration_interval, num_migrants, inboxes):
+        """ Constructor """
+        self.island = island
+        self.destinations = out_neighbours(island, num_islands, topology)
+        self.sources = in_neighbours(island, num_islands, topology)
+        self.migration_interval = migration_interval
+        self.num_migrants = num_migrants
+        self.inboxes = inboxes                          # Queue of messages of each island
+
+        self.iteration = 0
+        self.migration = 0
+        self.pending = {}                               # Emigrants received ahead of time, by source and migration number
+        self.finished_sources = set()
+
+
+    def __call__(self, metaheuristic):
+        """ Count the iteration and, if a migration is due, send emigrants and inject the migrants received """
+        self.iteration += 1
+        if self.iteration % self.migration_interval != 0 or (len(self.destinations) == 0 and len(self.sources) == 0):
+            return
+
+        self.migration += 1
+        emigrants = metaheuristic.emigrants(self.num_migrants)
+        for destination in self.destinations:
+            self.inboxes[destination].put((self.island, self.migration, emigrants))
+
+        migrants = self.receive(self.migration)
+        if len(migrants) > 0:
+            metaheuristic.inject_migrants(np.concatenate(migrants))
+
+
+    def receive(self, migration):
+        """ Wait for the emigrants of the given migration from each source that did not finish its search """
+        migrants = []
+        for source in self.sources:
+            while (source, migration) not in self.pending and source not in self.finished_sources:
+                message_source, message_migration, emigrants = self.inboxes[self.island].get()
+                if message_migration is None:
+                    self.finished_sources.add(message_source)
+                else:
+                    self.pending[(message_source, message_migration)] = emigrants
+            if (source, migration) in self.pending:
+                migrants.append(self.pending.pop((source, migration)))
+
+        return migrants
+
+
+    def finish(self):
+        """ Tell the destinations that no more emigrants will be sent """
+        for destination in self.destinations:
+            self.inboxes[destination].put((self.island, None, None))
+
+
+# Search of an island, in a worker process. The metaheuristic is built by configure(*configure_arguments, function_evaluations_array), since it cannot be sent to other processes
+def run_island(island, num_islands, topology, migration_interval, num_migrants, inboxes, seed, configure, configure_arguments, function_evaluations_array):
+    np.random.seed(seed)
+    migration = Migration(island, num_islands, topology, migration_interval, num_migrants, inboxes)
+    try:
+        metaheuristic = configure(*configure_arguments, function_evaluations_array)
+        metaheuristic.set_iteration_hook(migration)
+        recorded_solutions = metaheuristic.optimize()
+    finally:
+        # Neighbours must not wait for an island that finished or failed
+        migration.finish()
+
+    return recorded_solutions, metaheuristic.function_evaluations, metaheuristic.stop_reason
+
+
+class IslandModel:
+    """ Runs num_islands instances of a metaheuristic in as many processes, with migrations between them.
+        configure(*configure_arguments, function_evaluations_array) must return a configured metaheuristic recording solutions at the given function evaluations,
+        and configure(*configure_arguments) the same metaheuristic with default function evaluations,
+        such as experiment_configuration.configure_experiment with (order_str, metaheuristic_name) """
+
+    def __init__(self, num_islands, configure, configure_arguments, topology = 'ring', migration_interval = 10, num_migrants = 1):
+        """ Constructor """
+        if num_islands <= 0 or migration_interval <= 0 or num_migrants <= 0:
+            print("Error, the number of islands, migration interval and number of migrants must be positive")
+            exit(-1)
+        if topology not in topologies:
+            print("Error, topology must be one of " + ", ".join(topologies))
+            exit(-1)
+
+        self.num_islands = num_islands
+        self.configure = configure
+        self.configure_arguments = tuple(configure_arguments)
+        self.topology = topology
+        self.migration_interval = migration_interval
+        self.num_migrants = num_migrants
+
+        # Results of the last search
+        self.island_solutions = None                    # Solutions recorded by each island (num_islands, records, D + 1)
+        self.function_evaluations = 0                   # Function evaluations of all islands
+        self.stop_reasons = None                        # Stopping criterion of each island, None if it used its whole budget
+
+
+    def island_record_points(self, function_evaluations_array):
+        """ Mask of the global function evaluations whose share per island is a function evaluation at which the metaheuristic can record solutions """
+        island_evaluations = np.array(function_evaluations_array) / self.num_islands
+        divisible = np.array([x.is_integer() for x in island_evaluations], dtype = bool)
+        # The record points depend only on the parameters of the metaheuristic, so it is configured with its default function evaluations
+        metaheuristic = self.configure(*self.configure_arguments)
+
+        return divisible & metaheuristic.record_points(island_evaluations)
+
+
+    def optimize(self, function_evaluations_array, seed = None):
+        """ Search with all islands, returning the best solution among the islands at each of the global function evaluations of function_evaluations_array.
+            The share of each function evaluations per island must be a record point of the metaheuristic (see island_record_points).
+            Island seeds are derived from seed or, if it is None, from the global NumPy random state """
+        function_evaluations_array = np.array(function_evaluations_array)
+        # Validate before starting the islands, whose errors would only be seen in the worker processes
+        valid = self.island_record_points(function_evaluations_array)
+        if not valid.all():
+            print("Error, the shares per island of the function evaluations %s are not record points of the metaheuristic on %d islands" % (function_evaluations_array[~valid].tolist(), self.num_islands))
+            exit(-1)
+        island_evaluations = (function_evaluations_array // self.num_islands).astype(int)
+
+        if seed is None:
+            seed = np.random.randint(0, 2 ** 32, size = 4)
+        island_seeds = [seed_sequence.generate_state(4) for seed_sequence in np.random.SeedSequence(seed).spawn(self.num_islands)]
+
+        # Migrations are synchronous, so every island needs its own process
+        with multiprocessing.Manager() as manager:
+            inboxes = [manager.Queue() for _ in range(self.num_islands)]
+            with concurrent.futures.ProcessPoolExecutor(max_workers = self.num_islands) as pool:
+                futures = [pool.submit(run_island, island, self.num_islands, self.topology, self.migration_interval, self.num_migrants, inboxes,
+                                       island_seeds[island], self.configure, self.configure_arguments, island_evaluations) for island in range(self.num_islands)]
+                results = [future.result() for future in futures]
+
+        self.island_solutions = np.array([island_result[0] for island_result in results])
+        self.function_evaluations = sum(island_result[1] for island_result in results)
+        self.stop_reasons = [island_result[2] for island_result in results]
+
+        # Islands fill the records they did not reach with their last best solution, so all have the same records
+        best_islands = np.argmin(self.island_solutions[:, :, -1], axis = 0)
+
+        return self.island_solutions[best_islands, np.arange(self.island_solutions.shape[1])]
+
+
+if __name__ == '__main__':
+    # Argument checking
+    if len(sys.argv) < 4 or len(sys.argv) > 6:
+        print('Error, wrong number of arguments. Execute this script as follows:\npython3 %s {simulated system order} {metaheuristic} {number of islands} [{topology} [{migration interval}]]' % sys.argv[0])
+        print('Topologies are ' + ', '.join(topologies))
+        exit(-1)
+
+    order_str = sys.argv[1]
+    if order_str != 'finite' and order_str != 'infinite':
+        print('Error, choose either \'finite\' or \'infinite\' for the simulated system order')
+        exit(-1)
+    metaheuristic_name = (sys.argv[2]).lower()
+    num_islands = int(sys.argv[3])
+    topology = 'ring'
+    if len(sys.argv) >= 5:
+        topology = sys.argv[4]
+    migration_interval = 10
+    if len(sys.argv) == 6:
+        migration_interval = int(sys.argv[5])
+
+    islands = IslandModel(num_islands, experiment_configuration.configure_experiment, (order_str, metaheuristic_name), topology, migration_interval)
+    # Keep the function evaluations of interest whose share per island the metaheuristic can record
+    function_evals = np.array(experiment_configuration.function_evals)
+    function_evals = function_evals[islands.island_record_points(function_evals)]
+    print('Recording solutions at %d of the %d function evaluations of interest' % (len(function_evals), len(experiment_configuration.function_evals)))
+    solutions_at_FEs = islands.optimize(function_evals)
+
+    # Errors of the best solution found at each function evaluations of interest
+    L, H, Q = experiment_configuration.lvn_structure(order_str)
+    _, test_filename = experiment_configuration.signal_filenames(order_str)
+    LVN = laguerre_volterra_network_structure.LVN()
+    LVN.define_structure(L, H, Q, 1/experiment_configuration.Fs)
+    test_costs = experiment_configuration.test_costs(solutions_at_FEs, L, H, Q, data_handling.load_io(test_filename), LVN)
+    print('%d islands, %d function evaluations, stop reasons %s' % (num_islands, islands.function_evaluations, islands.stop_reasons))
+    print('Final train cost: %f, test cost: %f' % (solutions_at_FEs[-1, -1], test_costs[-1]))
@@ -17,10 +17,16 @@
 
 # Python std lib
 import math
+import threading
+import functools
+from collections import OrderedDict
 from collections.abc import Iterable
 # Third party
 import numpy as np
-
+from scipy.signal import lfilter
+from scipy.fft import rfft, irfft, next_fast_len
+# Own
+import instrumentation
 
 
 class LVN:
@@ -32,6 +38,13 @@ class LVN:
         self.H = None           # num_hidden_units
         self.Q = None           # polynomial_order
         self.T = None           # sampling_interval
+        
+        # Engine used to propagate signals through the Laguerre filterbank
+        self.filterbank_engine = 'iir'
+        # Optional cache of filterbank outputs, shared among LVNs evaluated on the same signals
+        self.filterbank_cache = None
+        # How compute_output evaluates the polynomials of the hidden units
+        self.readout = 'horner'
 
         
     def define_structure(self, laguerre_order, num_hidden_units, polynomial_order, sampling_interval):
@@ -42,6 +55,32 @@ class LVN:
         self.T = sampling_interval
         
       
+    def set_filterbank_engine(self, engine):
+        ''' Select how the Laguerre filterbank is propagated: 'iir' runs each order as a first-order IIR section with a compiled recursive filter,
+            'fft' convolves the signal with the truncated impulse responses by FFT and 'loop' is the reference sample-by-sample implementation.
+            'iir' is the default; 'fft' only matches it up to the truncation and rounding errors, so its results are not bit-identical to those of the other engines. '''
+        if engine not in ('iir', 'fft', 'loop'):
+            print("Error, filterbank engine must be 'iir', 'fft' or 'loop'")
+            exit(-1)
+        
+        self.filterbank_engine = engine
+        
+        
+    def set_readout(self, readout):
+        ''' Select how compute_output evaluates the hidden units polynomials: 'horner' applies Horner's scheme to the hidden nodes inputs and accumulates each unit into the output,
+            'matrix' builds the (N, HQ+1) hidden layer outputs matrix and weights its columns by the polynomial coefficients. '''
+        if readout != 'horner' and readout != 'matrix':
+            print("Error, readout must be 'horner' or 'matrix'")
+            exit(-1)
+        
+        self.readout = readout
+        
+        
+    def set_filterbank_cache(self, filterbank_cache):
+        ''' Share a FilterbankCache among evaluations, so that the filterbank is propagated only once for each signal and alpha. None disables caching. '''
+        self.filterbank_cache = filterbank_cache
+        
+        
     def normalize_scale_parameters(self, hidden_units_weights, polynomial_coefficients):
         ''' Normalize hidden unit input weights to unit norm and scale polynomial coefficients according to the hidden unit it belongs and the polynomial order. '''
         # Shape of the dependent parameters are defined by structural parameters 
@@ -81,6 +120,44 @@ class LVN:
             print('Error, alpha must be positive')
             exit(-1)
         
+        engine = self.filterbank_engine
+        if engine == 'loop':
+            return self._propagate_laguerre_filterbank_loop(signal, alpha)
+        if engine == 'fft':
+            return self._propagate_laguerre_filterbank_fft(signal, alpha)
+        
+        alpha_sqrt = math.sqrt(alpha)
+        signal = np.asarray(signal, dtype = np.float64)
+        bank_outputs = np.empty((self.L, len(signal)))
+        
+        # V_{0} is a low-pass section: V_{0}[n] = sqrt(alpha) * V_{0}[n-1] + T * sqrt(1 - alpha) * x[n]
+        bank_outputs[0, :] = lfilter([self.T * math.sqrt(1 - alpha)], [1.0, -alpha_sqrt], signal)
+        
+        # V_{j} with j = 1, .., L-1 are all-pass sections applied to V_{j-1}: V_{j}[n] = sqrt(alpha) * (V_{j}[n-1] + V_{j-1}[n]) - V_{j-1}[n-1]
+        for j in range(1, self.L):
+            bank_outputs[j, :] = lfilter([alpha_sqrt, -1.0], [1.0, -alpha_sqrt], bank_outputs[j - 1, :])
+        
+        return bank_outputs
+        
+        
+    def _propagate_laguerre_filterbank_fft(self, signal, alpha):
+        ''' Propagate the input signal through the Laguerre filter bank by FFT convolution with the impulse responses, truncated where their energy becomes negligible. '''
+        signal = np.asarray(signal, dtype = np.float64)
+        N = len(signal)
+        M = min(laguerre_truncation_length(alpha, self.L), N)
+        impulse_responses = laguerre_impulse_responses(alpha, self.L, M)
+        
+        # Linear convolution of all orders with a single transform of the signal, keeping the first N samples
+        fft_length = next_fast_len(N + M - 1, True)
+        signal_spectrum = rfft(signal, fft_length)
+        bank_outputs = irfft(rfft(impulse_responses, fft_length, axis = 1) * signal_spectrum, fft_length, axis = 1)[:, :N]
+        
+        # The filterbank of the network scales the orthonormal Laguerre filters by the sampling interval
+        return self.T * bank_outputs
+        
+        
+    def _propagate_laguerre_filterbank_loop(self, signal, alpha):
+        ''' Reference sample-by-sample propagation of the input signal through the Laguerre filter bank. '''
         alpha_sqrt = math.sqrt(alpha)
         bank_outputs = np.zeros((self.L, 1 + len(signal)))      # The bank_outputs matrix initially has one extra column to represent zero values at n = -1
         
@@ -98,8 +175,26 @@ class LVN:
         return bank_outputs
         
         
-    def compute_output(self, x, laguerre_alpha, hidden_units_weights, polynomial_coefficients, output_offset, weights_modified):
-        ''' Compute output from input time-series for a given set of dependent continuous parameters (smoothing constant, filterbank-nonlinearities weights, polynomial coefficients and output offset). '''
+    def cached_laguerre_filterbank(self, signal, alpha, signal_key):
+        ''' Propagate input signal through the Laguerre filter bank, reusing the filterbank cache when the signal is identified by a (hashable) signal_key. '''
+        if self.filterbank_cache is None or signal_key is None:
+            with instrumentation.phase('filterbank'):
+                return self.propagate_laguerre_filterbank(signal, alpha)
+        
+        # Engines differ by rounding errors, so they do not share filterbank outputs
+        cache_key = (signal_key, alpha, self.L, self.T, self.filterbank_engine)
+        bank_outputs = self.filterbank_cache.get(cache_key)
+        if bank_outputs is None:
+            with instrumentation.phase('filterbank'):
+                bank_outputs = self.propagate_laguerre_filterbank(signal, alpha)
+            self.filterbank_cache.put(cache_key, bank_outputs)
+        
+        return bank_outputs
+        
+        
+    def compute_output(self, x, laguerre_alpha, hidden_units_weights, polynomial_coefficients, output_offset, weights_modified, signal_key = None):
+        ''' Compute output from input time-series for a given set of dependent continuous parameters (smoothing constant, filterbank-nonlinearities weights, polynomial coefficients and output offset).
+            If signal_key identifies the input signal, filterbank outputs are looked up in the filterbank cache. '''
         ## Error checking
         # Network structure must be specified before dependent parameters
         if self.L == None or self.H == None or self.Q == None:
@@ -120,19 +215,77 @@ class LVN:
         if weights_modified:
             hidden_units_weights, polynomial_coefficients = self.normalize_scale_parameters(hidden_units_weights, polynomial_coefficients)
         
-        # Precompute alpha square root to avoid repeated computation
-        alpha_sqrt = np.sqrt(laguerre_alpha)
-        hidden_units_weights = np.array(hidden_units_weights)
         polynomial_coefficients = np.array(polynomial_coefficients)
         
+        if self.readout == 'matrix':
+            # The outputs of hidden layer mat is (N, HQ+1)
+            hidden_layer_out = self.compute_hidden_layer_outputs(x, laguerre_alpha, hidden_units_weights, signal_key)
+            
+            # Flatten polynomial coefficients to compute the final output from hidden layer outputs using matrix-vector multiplication
+            flattened_coefficients = (polynomial_coefficients.T).flatten()
+            # The output offset in the first position is always multiplied by 1
+            linear_params = np.concatenate(([output_offset], flattened_coefficients))
+            
+            with instrumentation.phase('readout'):
+                return self.linear_readout(hidden_layer_out, linear_params)
+        
+        # Filter bank outputs mat is (L, N) and hidden nodes inputs mat is (H, N)
+        laguerre_outputs = self.cached_laguerre_filterbank(x, laguerre_alpha, signal_key)
+        with instrumentation.phase('readout'):
+            hidden_nodes_inputs = self.project_hidden_units(laguerre_outputs, hidden_units_weights)
+            y = self.horner_readout(hidden_nodes_inputs, polynomial_coefficients, output_offset)
+        
+        return y
+        
+        
+    def horner_readout(self, hidden_nodes_inputs, polynomial_coefficients, output_offset):
+        ''' Compute the output from the (H, N) hidden nodes inputs, evaluating the polynomial of each hidden unit with Horner's scheme and accumulating it into the output.
+            Only two vectors of length N are allocated. '''
+        N = np.shape(hidden_nodes_inputs)[1]
+        y = np.full(N, float(output_offset))
+        unit_output = np.empty(N)
+        
+        # The polynomials have no constant term: c_1 u + c_2 u^2 + ... + c_Q u^Q = u (c_1 + u (c_2 + ... + u c_Q))
+        for unit in range(self.H):
+            unit_input = hidden_nodes_inputs[unit]
+            np.multiply(unit_input, polynomial_coefficients[unit, self.Q - 1], out = unit_output)
+            for q in range(self.Q - 2, -1, -1):
+                unit_output += polynomial_coefficients[unit, q]
+                unit_output *= unit_input
+            y += unit_output
+        
+        return y
+        
+        
+    def linear_readout(self, hidden_layer_out, linear_params):
+        ''' Weight the (N, HQ+1) hidden layer outputs by the linear parameters, with a matrix-vector multiplication. '''
+        return hidden_layer_out @ linear_params
+        
+        
+    def compute_hidden_layer_outputs(self, x, laguerre_alpha, hidden_units_weights, signal_key = None):
+        ''' Compute the (N, HQ+1) matrix of hidden layer outputs, whose first column is ones and whose remaining columns are the powers 1..Q of each hidden node input.
+            The LVN output is linear in this matrix, with the output offset and the polynomial coefficients (ordered by power, then by hidden unit) as parameters. '''
         # Propagate the input signal through the filter bank
         # Filter bank outputs mat is (L, N)
-        N = len(x)
-        laguerre_outputs = self.propagate_laguerre_filterbank(x, laguerre_alpha)
+        laguerre_outputs = self.cached_laguerre_filterbank(x, laguerre_alpha, signal_key)
+        
+        return self.expand_hidden_layer(laguerre_outputs, hidden_units_weights)
+        
+        
+    def project_hidden_units(self, laguerre_outputs, hidden_units_weights):
+        ''' Compute the (H, N) inputs of the hidden nodes from the (L, N) filterbank outputs. '''
+        hidden_units_weights = np.array(hidden_units_weights)
         
         # Define the input of each hidden node as the dot product between the Laguerre filterbank outputs and the weight vectors
+        return hidden_units_weights @ laguerre_outputs
+        
+        
+    def expand_hidden_layer(self, laguerre_outputs, hidden_units_weights):
+        ''' Compute the (N, HQ+1) matrix of hidden layer outputs from the (L, N) filterbank outputs. '''
+        N = np.shape(laguerre_outputs)[1]
+        
         # Hidden nodes inputs mat is (N,H)
-        hidden_nodes_inputs = np.matmul(laguerre_outputs.T, hidden_units_weights.T)
+        hidden_nodes_inputs = self.project_hidden_units(laguerre_outputs, hidden_units_weights).T
         
         # The outputs of hidden layer mat is (N, HQ+1).
         # Each node has one projection as input and Q values as outputs (Q-1 of them are nonlinear)
@@ -141,19 +294,212 @@ class LVN:
         for q in range(1, self.Q + 1):
             hidden_layer_out[:, 1  + (q - 1) * self.H : 1 + q * self.H] = np.power(hidden_nodes_inputs, q)
         
-        # Flatten polynomial coefficients to compute the final output from hidden layer outputs using matrix-vector multiplication
-        flattened_coefficients = (polynomial_coefficients.T).flatten()
-        # print(flattened_coefficients)
-        # print(output_offset)
-        # The output offset in the first position is always multiplied by 1
-        linear_params = np.concatenate(([output_offset], flattened_coefficients))
+        return hidden_layer_out
         
         
-        y = hidden_layer_out @ linear_params
+    def compute_output_batch(self, x, laguerre_alphas, hidden_units_weights, polynomial_coefficients, output_offsets, signal_key = None):
+        ''' Compute the outputs (P, N) of P LVNs sharing the same structure and input signal.
+            Weights are (P, H, L), coefficients are (P, H, Q), alphas and offsets are (P,).
+            Candidates with the same alpha share one filterbank propagation. '''
+        # Network structure must be specified before dependent parameters
+        if self.L == None or self.H == None or self.Q == None:
+            print("Error, first define the LVN structure")
+            exit(-1)
+        laguerre_alphas = np.asarray(laguerre_alphas, dtype = np.float64)
+        hidden_units_weights = np.asarray(hidden_units_weights, dtype = np.float64)
+        polynomial_coefficients = np.asarray(polynomial_coefficients, dtype = np.float64)
+        output_offsets = np.asarray(output_offsets, dtype = np.float64)
+        P = len(laguerre_alphas)
+        # Shape of the dependent parameters are defined by structural parameters 
+        if np.any(laguerre_alphas < 0) or np.any(laguerre_alphas > 1):
+            print("Error, invalid laguerre alpha")
+            exit(-1)
+        if np.shape(hidden_units_weights) != (P, self.H, self.L):
+            print("Error, wrong shape of hidden unit weights")
+            exit(-1)  
+        if np.shape(polynomial_coefficients) != (P, self.H, self.Q):
+            print("Error, wrong shape of polynomial coefficients")
+            exit(-1)
+        
+        y = np.empty((P, len(x)))
+        # Group candidates with identical alpha
+        unique_alphas, group_indices = np.unique(laguerre_alphas, return_inverse = True)
+        for group, alpha in enumerate(unique_alphas):
+            members = np.flatnonzero(group_indices == group)
+            laguerre_outputs = self.cached_laguerre_filterbank(x, alpha, signal_key)
+            
+            with instrumentation.phase('readout'):
+                # Hidden nodes inputs are (G, H, N) for the G candidates of the group
+                hidden_nodes_inputs = np.einsum('ghl,ln->ghn', hidden_units_weights[members], laguerre_outputs)
+                # Polynomial expansion of all candidates is (G, Q, H, N), with powers 1..Q of the hidden nodes inputs
+                hidden_nodes_powers = np.empty((len(members), self.Q, self.H, len(x)))
+                hidden_nodes_powers[:, 0] = hidden_nodes_inputs
+                for q in range(1, self.Q):
+                    np.multiply(hidden_nodes_powers[:, q - 1], hidden_nodes_inputs, out = hidden_nodes_powers[:, q])
+                
+                y[members] = np.einsum('ghq,gqhn->gn', polynomial_coefficients[members], hidden_nodes_powers) + output_offsets[members, np.newaxis]
         
         return y
         
         
+class StreamingLVN:
+    ''' Stateful inference of an LVN over an input signal received in chunks of any size.
+        The Laguerre filterbank state is carried from one chunk to the next, so the concatenated output chunks equal the output of LVN.compute_output over the whole signal
+        up to rounding errors, since the matrix products of the readout may round differently for different numbers of samples.
+        Memory usage depends only on the chunk size, not on the signal length. '''
+    def __init__(self, network, laguerre_alpha, hidden_units_weights, polynomial_coefficients, output_offset, weights_modified = False):
+        ''' Constructor, taking the structure from an LVN object and the dependent continuous parameters as in LVN.compute_output. '''
+        # Network structure must be specified before dependent parameters
+        if network.L == None or network.H == None or network.Q == None:
+            print("Error, first define the LVN structure")
+            exit(-1)
+        # Laguerre filterbank smoothing constant must be between 0 and 1
+        if laguerre_alpha <= 0 or laguerre_alpha > 1:
+            print("Error, invalid laguerre alpha")
+            exit(-1)
+        if np.shape(hidden_units_weights) != (network.H, network.L):
+            print("Error, wrong shape of hidden unit weights")
+            exit(-1)  
+        if np.shape(polynomial_coefficients) != (network.H, network.Q):
+            print("Error, wrong shape of polynomial coefficients")
+            exit(-1)
+        
+        if weights_modified:
+            hidden_units_weights, polynomial_coefficients = network.normalize_scale_parameters(hidden_units_weights, polynomial_coefficients)
+        
+        self.network = network
+        self.hidden_units_weights = np.array(hidden_units_weights, dtype = np.float64)
+        self.polynomial_coefficients = np.array(polynomial_coefficients, dtype = np.float64)
+        self.output_offset = output_offset
+        # Output offset followed by the polynomial coefficients ordered by power, then by hidden unit, as the columns of the hidden layer outputs
+        self.linear_params = np.concatenate(([output_offset], (np.array(polynomial_coefficients).T).flatten()))
+        
+        # Coefficients of the low-pass section V_{0} and of the all-pass sections V_{j}, as in LVN.propagate_laguerre_filterbank
+        alpha_sqrt = math.sqrt(laguerre_alpha)
+        self.low_pass_numerator = [network.T * math.sqrt(1 - laguerre_alpha)]
+        self.all_pass_numerator = [alpha_sqrt, -1.0]
+        self.denominator = [1.0, -alpha_sqrt]
+        
+        # State of each first-order section of the filterbank
+        self.filter_states = np.zeros((network.L, 1))
+        self.num_processed_samples = 0
+        
+        
+    def reset(self):
+        ''' Clear the filterbank state, as before the first sample of a signal. '''
+        self.filter_states[:] = 0
+        self.num_processed_samples = 0
+        
+        
+    def process(self, chunk):
+        ''' Compute the output samples for the next chunk of the input signal, updating the filterbank state. '''
+        chunk = np.atleast_1d(np.asarray(chunk, dtype = np.float64))
+        if len(chunk) == 0:
+            return np.empty(0)
+        
+        # Filter bank outputs mat is (L, chunk length)
+        bank_outputs = np.empty((self.network.L, len(chunk)))
+        bank_outputs[0, :], self.filter_states[0] = lfilter(self.low_pass_numerator, self.denominator, chunk, zi = self.filter_states[0])
+        for j in range(1, self.network.L):
+            bank_outputs[j, :], self.filter_states[j] = lfilter(self.all_pass_numerator, self.denominator, bank_outputs[j - 1, :], zi = self.filter_states[j])
+        
+        self.num_processed_samples += len(chunk)
+        # The readout follows the one selected in the LVN
+        if self.network.readout == 'matrix':
+            hidden_layer_out = self.network.expand_hidden_layer(bank_outputs, self.hidden_units_weights)
+            return self.network.linear_readout(hidden_layer_out, self.linear_params)
+        
+        hidden_nodes_inputs = self.network.project_hidden_units(bank_outputs, self.hidden_units_weights)
+        
+        return self.network.horner_readout(hidden_nodes_inputs, self.polynomial_coefficients, self.output_offset)
+        
+        
+    def stream(self, source, chunk_size = 65536):
+        ''' Generator of output chunks. The source is either an array (possibly memory-mapped), read chunk_size samples at a time, or an iterable of input chunks, such as a generator. '''
+        if isinstance(source, np.ndarray):
+            for start in range(0, len(source), chunk_size):
+                yield self.process(source[start : start + chunk_size])
+        else:
+            for chunk in source:
+                yield self.process(chunk)
+                
+                
+class FilterbankCache:
+    ''' Least recently used cache of Laguerre filterbank outputs, bounded by the total number of bytes of the stored matrices.
+        It can be shared by threads of the same process. '''
+    def __init__(self, max_bytes):
+        ''' Constructor. '''
+        if max_bytes <= 0:
+            print("Error, the filterbank cache size must be positive")
+            exit(-1)
+        
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()        # Least recently used entries first
+        self.lock = threading.Lock()
+        
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        
+    def get(self, key):
+        ''' Return the filterbank outputs stored for key, or None if they are not cached. '''
+        with self.lock:
+            bank_outputs = self.entries.get(key)
+            if bank_outputs is None:
+                self.misses += 1
+                return None
+            
+            self.hits += 1
+            self.entries.move_to_end(key)
+        
+        return bank_outputs
+        
+        
+    def put(self, key, bank_outputs):
+        ''' Store filterbank outputs under key, evicting least recently used entries to respect the size bound. '''
+        if bank_outputs.nbytes > self.max_bytes:
+            return
+        
+        # Cached matrices are shared among evaluations, so they must not be modified
+        bank_outputs.flags.writeable = False
+        
+        with self.lock:
+            if key in self.entries:
+                return
+            
+            while self.current_bytes + bank_outputs.nbytes > self.max_bytes:
+                _, evicted_outputs = self.entries.popitem(last = False)
+                self.current_bytes -= evicted_outputs.nbytes
+                self.evictions += 1
+            
+            self.entries[key] = bank_outputs
+            self.current_bytes += bank_outputs.nbytes
+        
+        
+    def clear(self):
+        ''' Remove all entries, keeping the statistics. '''
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+        
+        
+    def statistics(self):
+        ''' Return hit and miss counts, hit rate and memory usage of the cache. '''
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups > 0 else 0.0
+        
+        return {'hits'          : self.hits,
+                'misses'        : self.misses,
+                'hit_rate'      : hit_rate,
+                'evictions'     : self.evictions,
+                'entries'       : len(self.entries),
+                'bytes'         : self.current_bytes,
+                'max_bytes'     : self.max_bytes}
+                
+
 def laguerre_filter_memory(alpha):
     ''' Rough estimate of the extent of significative values in the Laguerre bank's impulse responses. '''
     M = (-30 - math.log(1 - alpha)) / math.log(alpha)
@@ -165,4 +511,42 @@ def laguerre_filter_memory(alpha):
     
     
     
-    
\ No newline at end of file
+@functools.lru_cache(maxsize = 64)
+def _laguerre_impulse_responses(alpha, L, M):
+    ''' Memoized implementation of laguerre_impulse_responses. '''
+    alpha_sqrt = math.sqrt(alpha)
+    impulse_responses = np.empty((L, M))
+    
+    # b_0[m] = sqrt(1 - alpha) * sqrt(alpha)^m
+    impulse_responses[0, :] = math.sqrt(1 - alpha) * np.power(alpha_sqrt, np.arange(M))
+    # b_j[m] = sqrt(alpha) * (b_j[m-1] + b_{j-1}[m]) - b_{j-1}[m-1], the all-pass recursion of the filterbank
+    for j in range(1, L):
+        impulse_responses[j, :] = lfilter([alpha_sqrt, -1.0], [1.0, -alpha_sqrt], impulse_responses[j - 1, :])
+    
+    impulse_responses.flags.writeable = False
+    
+    return impulse_responses
+    
+    
+def laguerre_impulse_responses(alpha, L, M):
+    ''' (L, M) matrix with the first M samples of the impulse responses of the orthonormal discrete Laguerre filters of orders 0 to L-1.
+        Responses are generated by the stable recursion among consecutive orders and memoized per (alpha, L, M), so the returned matrix is read-only. '''
+    if alpha <= 0 or alpha >= 1:
+        print('Error, alpha must be between 0 and 1')
+        exit(-1)
+    
+    return _laguerre_impulse_responses(float(alpha), int(L), int(M))
+    
+    
+@functools.lru_cache(maxsize = 256)
+def laguerre_truncation_length(alpha, L, tolerance = 1e-24):
+    ''' Number of samples after which the energy left in each of the L impulse responses, which have unit energy, is below tolerance. '''
+    M = 2 * laguerre_filter_memory(alpha) + 4 * L
+    while True:
+        impulse_responses = laguerre_impulse_responses(alpha, L, M)
+        # Energy of each response from each sample on
+        tail_energies = np.cumsum((impulse_responses ** 2)[:, ::-1], axis = 1)[:, ::-1]
+        negligible = np.flatnonzero(np.max(tail_energies, axis = 0) < tolerance)
+        if len(negligible) > 0:
+            return int(negligible[0])
+        M *= 2
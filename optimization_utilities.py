@@ -18,6 +18,11 @@
 import numpy as np
 import data_handling
 import laguerre_volterra_network_structure
+import instrumentation
+
+# Filterbank outputs shared by all cost functions of this process, keyed by dataset, alpha and filterbank structure
+filterbank_cache = laguerre_volterra_network_structure.FilterbankCache(max_bytes = 64 * 2 ** 20)
+instrumentation.register_cache('filterbank', filterbank_cache)
 
 # Normalized mean squared error
 def NMSE(y, y_pred, alpha):
@@ -58,6 +63,21 @@ def NMSE_explicit_memory(y, y_pred, M):
     
     return NMSE
 
+# Normalized mean squared error against the output of a cached dataset, whose denominator is computed only once for each memory length
+def NMSE_dataset(dataset, y_pred, alpha):
+    if dataset.num_samples != len(y_pred):
+        print("Actual and predicted y have different lengths")
+        exit(-1)
+    
+    with instrumentation.phase('nmse'):
+        M = laguerre_volterra_network_structure.laguerre_filter_memory(alpha)
+        
+        error = dataset.output[M:] - y_pred[M:]
+        
+        NMSE = np.dot(error, error) / dataset.output_energy(M)
+    
+    return NMSE
+
 # Break flat list-like solution into [alpha, W, C, offset] for a given LVN structure
 def decode_solution(candidate_solution, L, H, Q):
     # Identify solution members
@@ -76,15 +96,32 @@ def decode_solution(candidate_solution, L, H, Q):
     return alpha, W, C, offset
     
     
+# Break a (P, D) matrix of flat solutions into alphas (P,), W (P, H, L), C (P, H, Q) and offsets (P,)
+def decode_solutions(candidate_solutions, L, H, Q):
+    candidate_solutions = np.asarray(candidate_solutions, dtype = np.float64)
+    P = len(candidate_solutions)
+    
+    alphas = candidate_solutions[:, 0]
+    W = np.reshape(candidate_solutions[:, 1 : (H * L + 1)], (P, H, L))
+    C = np.reshape(candidate_solutions[:, (H * L + 1) : (H * L + 1) + H * Q], (P, H, Q))
+    offsets = candidate_solutions[:, (H * L + 1) + H * Q]
+    
+    return alphas, W, C, offsets
+    
+    
 # Compute cost of candidate solution, which is encoded as a flat array: alpha, W(0,0) ... W(L-1,H-1), C(0,0) ... C(Q-1,H-1), offset
 def define_cost(L, H, Q, Fs, train_filename):
+    # IO is loaded once per process and shared by every evaluation
+    train_data = data_handling.load_io(train_filename)
+    
+    solution_system = laguerre_volterra_network_structure.LVN()
+    solution_system.define_structure(L, H, Q, 1/Fs)
+    solution_system.set_filterbank_cache(filterbank_cache)
+    
     # Cost computation parameterized by the nesting function (define_cost)
     # modified_variable indicates which parameters were modified in the solution. -1 if all of them were.
     def compute_cost(candidate_solution, modified_variable):
         
-        # IO
-        train_input, train_output = data_handling.read_io(train_filename)
-
         # Get parameters from candidate solution
         alpha, W, C, offset = decode_solution(candidate_solution, L, H, Q)
         
@@ -95,15 +132,294 @@ def define_cost(L, H, Q, Fs, train_filename):
             weights_modified = False
             
         # Generate output and compute cost
-        solution_system = laguerre_volterra_network_structure.LVN()
-        solution_system.define_structure(L, H, Q, 1/Fs)
-        solution_output = solution_system.compute_output(train_input, alpha, W, C, offset, weights_modified)
+        solution_output = solution_system.compute_output(train_data.input, alpha, W, C, offset, weights_modified, train_data.key)
         
-        cost = NMSE(train_output, solution_output, alpha)
+        cost = NMSE_dataset(train_data, solution_output, alpha)
         
         return cost
         
     return compute_cost
 
 
+# Compute costs of a population of candidate solutions, a (P, D) matrix whose rows are encoded as in define_cost
+def define_batch_cost(L, H, Q, Fs, train_filename):
+    # IO is loaded once per process and shared by every evaluation
+    train_data = data_handling.load_io(train_filename)
+    
+    solution_system = laguerre_volterra_network_structure.LVN()
+    solution_system.define_structure(L, H, Q, 1/Fs)
+    solution_system.set_filterbank_cache(filterbank_cache)
     
+    def compute_batch_cost(candidate_solutions):
+        alphas, W, C, offsets = decode_solutions(candidate_solutions, L, H, Q)
+        
+        # Normalizing weights and scaling coefficients does not change the output, so it is skipped
+        solution_outputs = solution_system.compute_output_batch(train_data.input, alphas, W, C, offsets, train_data.key)
+        
+        costs = np.zeros(len(alphas))
+        for i in range(len(alphas)):
+            costs[i] = NMSE_dataset(train_data, solution_outputs[i], alphas[i])
+        
+        return costs
+        
+    return compute_batch_cost
+
+
+# Stateful cost function for metaheuristics that modify one variable at a time (SA and ACFSA)
+# The LVN output is kept for the current solution, so that single-variable moves update it instead of recomputing it:
+#  an output offset or polynomial coefficient change is a rank-1 update of the output,
+#  a weight change recomputes only the contribution of the hidden unit it belongs to,
+#  and an alpha change recomputes everything
+class IncrementalCost:
+    """ Cost function with the same encoding and calling convention of define_cost, plus commit and rollback of the last evaluated candidate """
+    
+    def __init__(self, L, H, Q, Fs, train_filename, refresh_interval = 1000):
+        """ Constructor """
+        if refresh_interval <= 0:
+            print("Error, refresh interval must be positive")
+            exit(-1)
+            
+        self.L = L;     self.H = H;     self.Q = Q
+        self.train_data = data_handling.load_io(train_filename)
+        self.system = laguerre_volterra_network_structure.LVN()
+        self.system.define_structure(L, H, Q, 1/Fs)
+        self.system.set_filterbank_cache(filterbank_cache)
+        
+        self.refresh_interval = refresh_interval        # Number of commits after which the state is recomputed from scratch, to bound round-off accumulation
+        self.commits_since_refresh = 0
+        self.state = None                               # State of the current (committed) solution
+        self.pending = None                             # State changes of the last evaluated candidate
+        
+        
+    def __call__(self, candidate_solution, modified_variable):
+        """ Compute the cost of a candidate solution. If modified_variable is -1 the candidate becomes the current solution,
+            otherwise it must be committed or rolled back after its acceptance decision """
+        candidate_solution = np.array(candidate_solution, dtype = np.float64)
+        
+        if self.state is None or modified_variable == -1:
+            self.pending = ('full', self._full_state(candidate_solution))
+        else:
+            # Candidates that differ from the current solution in other variables than the modified one are computed from scratch
+            changed_variables = np.flatnonzero(candidate_solution != self.state['solution'])
+            if len(changed_variables) == 0:
+                self.pending = ('full', self.state)
+            elif len(changed_variables) > 1 or changed_variables[0] != modified_variable or modified_variable == 0:
+                self.pending = ('full', self._full_state(candidate_solution))
+            elif modified_variable <= self.L * self.H:
+                self.pending = ('weight', self._weight_change(candidate_solution, modified_variable))
+            elif modified_variable <= self.L * self.H + self.H * self.Q:
+                self.pending = ('coefficient', self._coefficient_change(candidate_solution, modified_variable))
+            else:
+                self.pending = ('offset', self._offset_change(candidate_solution))
+        
+        cost = self.pending[1]['cost']
+        if modified_variable == -1:
+            self.commit()
+            
+        return cost
+        
+        
+    def commit(self):
+        """ The last evaluated candidate becomes the current solution """
+        if self.pending is None:
+            return
+        
+        change_type, change = self.pending
+        if change_type == 'full':
+            self.state = change
+            self.commits_since_refresh = 0
+        else:
+            if change_type == 'weight':
+                self.state['projections'][change['unit'], :] = change['projection']
+                self.state['powers'][:, change['unit'], :] = change['powers']
+            if change_type != 'offset':
+                self.state['contributions'][change['unit'], :] = change['contribution']
+            self.state['solution'] = change['solution']
+            self.state['output'] = change['output']
+            self.state['cost'] = change['cost']
+            
+            self.commits_since_refresh += 1
+            if self.commits_since_refresh >= self.refresh_interval:
+                self.state = self._full_state(self.state['solution'])
+                self.commits_since_refresh = 0
+        
+        self.pending = None
+        
+        
+    def rollback(self):
+        """ The last evaluated candidate is discarded and the current solution is kept """
+        self.pending = None
+        
+        
+    def reset_state(self, solution):
+        """ Make a solution whose cost is already known (e.g. a migrant of another search) the current one, rebuilding its state from scratch.
+            Unlike calling the cost function with modified_variable -1, this is not meant to be counted as a function evaluation. Returns the cost of the solution """
+        self.state = self._full_state(np.array(solution, dtype = np.float64))
+        self.commits_since_refresh = 0
+        self.pending = None
+        
+        return self.state['cost']
+        
+        
+    def get_state(self):
+        """ State of the current solution, saved in checkpoints so that resumed searches compute the same costs """
+        return {'state'                 : self.state,
+                'commits_since_refresh' : self.commits_since_refresh}
+                
+                
+    def set_state(self, saved_state):
+        """ Restore the state of the current solution from a checkpoint """
+        self.state = saved_state['state']
+        self.commits_since_refresh = saved_state['commits_since_refresh']
+        self.pending = None
+        
+        
+    def _cost(self, output, M):
+        """ NMSE of an output vector given the memory of the filterbank """
+        with instrumentation.phase('nmse'):
+            error = self.train_data.output[M:] - output[M:]
+            
+            return np.dot(error, error) / self.train_data.output_energy(M)
+        
+        
+    def _full_state(self, solution):
+        """ Compute filterbank projections, their powers, each hidden unit contribution and the output from scratch """
+        alpha, W, C, offset = decode_solution(solution, self.L, self.H, self.Q)
+        W = np.array(W)
+        C = np.array(C)
+        
+        bank_outputs = self.system.cached_laguerre_filterbank(self.train_data.input, alpha, self.train_data.key)
+        with instrumentation.phase('readout'):
+            # Projections are (H, N) and powers are (Q, H, N), with powers[q - 1] = projections ** q
+            projections = W @ bank_outputs
+            powers = np.empty((self.Q, self.H, self.train_data.num_samples))
+            powers[0] = projections
+            for q in range(1, self.Q):
+                np.multiply(powers[q - 1], projections, out = powers[q])
+            contributions = np.einsum('hq,qhn->hn', C, powers)
+            output = offset + np.sum(contributions, axis = 0)
+        M = laguerre_volterra_network_structure.laguerre_filter_memory(alpha)
+        
+        return {'solution'      : solution,
+                'bank_outputs'  : bank_outputs,
+                'M'             : M,
+                'projections'   : projections,
+                'powers'        : powers,
+                'contributions' : contributions,
+                'output'        : output,
+                'cost'          : self._cost(output, M)}
+        
+        
+    def _weight_change(self, solution, modified_variable):
+        """ Recompute the contribution of the hidden unit whose input weight was modified """
+        unit = (modified_variable - 1) // self.L
+        weights = solution[1 + unit * self.L : 1 + (unit + 1) * self.L]
+        coefficients = solution[1 + self.L * self.H + unit * self.Q : 1 + self.L * self.H + (unit + 1) * self.Q]
+        
+        with instrumentation.phase('readout'):
+            projection = weights @ self.state['bank_outputs']
+            powers = np.empty((self.Q, self.train_data.num_samples))
+            powers[0] = projection
+            for q in range(1, self.Q):
+                np.multiply(powers[q - 1], projection, out = powers[q])
+            contribution = coefficients @ powers
+            output = self.state['output'] + (contribution - self.state['contributions'][unit])
+        
+        return {'solution'      : solution,
+                'unit'          : unit,
+                'projection'    : projection,
+                'powers'        : powers,
+                'contribution'  : contribution,
+                'output'        : output,
+                'cost'          : self._cost(output, self.state['M'])}
+        
+        
+    def _coefficient_change(self, solution, modified_variable):
+        """ Rank-1 update of the output, along the power of the projection multiplied by the modified coefficient """
+        coefficient_index = modified_variable - (1 + self.L * self.H)
+        unit = coefficient_index // self.Q
+        power = coefficient_index % self.Q
+        delta = solution[modified_variable] - self.state['solution'][modified_variable]
+        
+        with instrumentation.phase('readout'):
+            update = delta * self.state['powers'][power, unit]
+            contribution = self.state['contributions'][unit] + update
+            output = self.state['output'] + update
+        
+        return {'solution'      : solution,
+                'unit'          : unit,
+                'contribution'  : contribution,
+                'output'        : output,
+                'cost'          : self._cost(output, self.state['M'])}
+        
+        
+    def _offset_change(self, solution):
+        """ Shift the output by the change in the output offset """
+        output = self.state['output'] + (solution[-1] - self.state['solution'][-1])
+        
+        return {'solution'      : solution,
+                'output'        : output,
+                'cost'          : self._cost(output, self.state['M'])}
+
+
+
+# Variable projection: the LVN output is linear in the polynomial coefficients and the output offset,
+#  so for given alpha and weights they are the least squares solution over the samples after the filterbank memory
+# The metaheuristics then search only alpha and the weights, encoded as a flat array: alpha, W(0,0) ... W(L-1,H-1)
+class VariableProjectionCost:
+    """ Cost function over alpha and hidden unit weights (1 + L*H variables), with polynomial coefficients and output offset obtained by least squares """
+    
+    def __init__(self, L, H, Q, Fs, train_filename):
+        """ Constructor """
+        self.L = L;     self.H = H;     self.Q = Q
+        self.num_variables = 1 + L * H
+        self.train_data = data_handling.load_io(train_filename)
+        self.system = laguerre_volterra_network_structure.LVN()
+        self.system.define_structure(L, H, Q, 1/Fs)
+        self.system.set_filterbank_cache(filterbank_cache)
+        
+        
+    def __call__(self, candidate_solution, modified_variable):
+        """ Compute the cost of the best LVN with the alpha and weights of the candidate solution """
+        _, _, cost = self.linear_parameters(candidate_solution)
+        
+        return cost
+        
+        
+    def linear_parameters(self, candidate_solution):
+        """ Solve the least squares problem for the polynomial coefficients (H, Q) and the output offset, returning them along with the resulting NMSE """
+        if len(candidate_solution) != self.num_variables:
+            print("Error, variable projection solutions must have 1 + L*H variables")
+            exit(-1)
+            
+        alpha = candidate_solution[0]
+        W = np.reshape(candidate_solution[1:], (self.H, self.L))
+        M = laguerre_volterra_network_structure.laguerre_filter_memory(alpha)
+        
+        hidden_layer_out = self.system.compute_hidden_layer_outputs(self.train_data.input, alpha, W, self.train_data.key)
+        linear_params, _, _, _ = np.linalg.lstsq(hidden_layer_out[M:], self.train_data.output[M:], rcond = None)
+        
+        error = self.train_data.output[M:] - hidden_layer_out[M:] @ linear_params
+        cost = np.dot(error, error) / self.train_data.output_energy(M)
+        
+        # The hidden layer outputs are ordered by power, then by hidden unit
+        offset = linear_params[0]
+        C = np.reshape(linear_params[1:], (self.Q, self.H)).T
+        
+        return C, offset, cost
+        
+        
+    def complete_solution(self, candidate_solution):
+        """ Expand a variable projection solution into the flat encoding of define_cost: alpha, W(0,0) ... W(L-1,H-1), C(0,0) ... C(Q-1,H-1), offset """
+        C, offset, _ = self.linear_parameters(candidate_solution)
+        
+        return np.concatenate((candidate_solution, C.flatten(), [offset]))
+        
+        
+    def complete_recorded_solutions(self, recorded_solutions):
+        """ Expand the solutions recorded by a metaheuristic, whose last column is the cost, keeping the cost as last column """
+        completed_solutions = []
+        for solution in recorded_solutions:
+            completed_solutions.append(np.concatenate((self.complete_solution(solution[:-1]), [solution[-1]])))
+            
+        return np.array(completed_solutions)
@@ -103,5 +103,17 @@ PSO.define_variables(initial_ranges, is_bounded)
 best_solution = PSO.optimize()
 print(best_solution)
 
+# ACOr with variable projection
+# Only alpha and the weights are searched, polynomial coefficients and output offset are solved by least squares
+print("ACOr (variable projection)")
+projection_cost = optimization_utilities.VariableProjectionCost(L, H, Q, Fs, "./signals_and_systems/infinite_order_train.csv")
+ACOr = ant_colony_for_continuous_domains.ACOr()
+ACOr.set_verbosity(False)
+ACOr.set_cost(projection_cost)
+ACOr.set_parameters(m, k, q, xi, function_evals)
+ACOr.define_variables(initial_ranges[:projection_cost.num_variables], is_bounded[:projection_cost.num_variables])
+best_solution = projection_cost.complete_recorded_solutions(ACOr.optimize())
+print(best_solution)
+
 # system_parameters = optimization_utilities.decode_solution(best_solution, L, H, Q)
 # data_handling.write_LVN_file("pso_infinite", system_parameters)
\ No newline at end of file
@@ -19,14 +19,17 @@
 import numpy as np
 # Own
 from base_metaheuristic import Base
+import instrumentation
     
 class PSO(Base):
     """ Class for the Particle Swarm Optimization algorithm (PSO), following (Poli et al., 2007) """
 
+    checkpoint_attributes = ['swarm_positions', 'swarm_velocities', 'personal_bests', 'global_best', 'inertia_weight']
+    
     def __init__(self):
         """ Constructor """
         # Define verbosity and NULL problem definition
-        super().__init__
+        super().__init__()
         
         # Initial algorithm parameters
         self.relative_iterations = None         # Array containing the iterations at which best solutions are reported
@@ -45,6 +48,10 @@ class PSO(Base):
         # Flag for modified PSO
         self.adaptive_inertia = False           # In vanilla PSO, there is no inertia weighting
         
+        # In the asynchronous update, particles are moved one at a time and later particles see global best updates of earlier ones.
+        # In the synchronous update, the whole swarm is evaluated, then bests are updated, then all particles are moved at once using array operations
+        self.update_mode = 'asynchronous'
+        
         
     def set_parameters(self, population_size, personal_acceleration, global_acceleration, function_evaluations_array):
         """ Define values for the parameters used by the algorithm """
@@ -69,6 +76,7 @@ class PSO(Base):
         
         self.num_iter = int(np.max(self.relative_iterations))
         self.population_size = population_size
+        self.iteration_evaluations = population_size
         self.personal_acceleration = personal_acceleration
         self.global_acceleration = global_acceleration
         
@@ -100,71 +108,169 @@ class PSO(Base):
         self.global_best[-1] = float('inf')
             
 
+    def set_update_mode(self, update_mode):
+        """ Choose between the 'asynchronous' per-particle update, used to obtain the published results, and the vectorized 'synchronous' update """
+        if update_mode != 'asynchronous' and update_mode != 'synchronous':
+            print("Error, update mode must be 'asynchronous' or 'synchronous'")
+            exit(-1)
+            
+        self.update_mode = update_mode
+        
+        
+    def emigrants(self, num_migrants):
+        """ The best personal bests of the swarm """
+        return np.array(self.personal_bests[np.argsort(self.personal_bests[:, -1], kind = 'stable')[:num_migrants]])
+        
+        
+    def inject_migrants(self, migrants):
+        """ Migrants replace the worst personal bests they are better than, and possibly the global best """
+        for migrant in migrants:
+            worst_particle = np.argmax(self.personal_bests[:, -1])
+            if migrant[-1] < self.personal_bests[worst_particle, -1]:
+                self.personal_bests[worst_particle, :] = migrant
+            if migrant[-1] < self.global_best[-1]:
+                self.global_best = np.array(migrant)
+                
+                
     def update_inertia_weight(self, acceptance_count):
         """ Inertia weight is not updated in vanilla PSO. It is kept at 1.0, the same of determining no inertia weight """
         pass
             
             
+    def _asynchronous_update(self):
+        """ Update bests, velocity and position of one particle at a time, as in the published results """
+        # When using adaptive inertia weight
+        acceptance_count = 0
+        
+        for particle in range(self.population_size):
+            # Update personal best solution
+            if self.swarm_positions[particle, -1] < self.personal_bests[particle, -1]:
+                self.personal_bests[particle, :] = np.array(self.swarm_positions[particle, :])
+                acceptance_count += 1
+                
+                # Update global best solution
+                if self.personal_bests[particle, -1] < self.global_best[-1]:
+                    self.global_best = np.array(self.personal_bests[particle, :])
+                    
+            # Update inertia weight based on success rate of the swarm
+            # Has no effect in vanilla PSO
+            self.update_inertia_weight(acceptance_count)
+            
+            # Update velocity vector
+            self.swarm_velocities[particle, :] =    self.inertia_weight * (self.swarm_velocities[particle, :]
+                                                    + self.personal_acceleration  * np.random.rand() * (self.personal_bests[particle, :-1]    - self.swarm_positions[particle, :-1])
+                                                    + self.global_acceleration    * np.random.rand() * (self.global_best[:-1]                 - self.swarm_positions[particle, :-1]))
+            # Update position vector
+            self.swarm_positions[particle, :-1] = self.swarm_positions[particle, :-1] + self.swarm_velocities[particle, :]
+            
+            # Restrict search for bounded variables
+            for var in range(self.num_variables):
+                if self.is_bounded[var]:
+                    # Use the hard border strategy
+                    if self.swarm_positions[particle, var] < self.initial_ranges[var][0]:
+                        self.swarm_positions[particle, var] = self.initial_ranges[var][0]
+                    elif self.swarm_positions[particle, var] > self.initial_ranges[var][1]:
+                        self.swarm_positions[particle, var] = self.initial_ranges[var][1]        
+                        
+                        
+    def _allocate_synchronous_buffers(self):
+        """ Bounds and work arrays of the synchronous update, allocated once per search """
+        # Unbounded variables have infinite bounds, so the hard border strategy is a single clipping of all variables
+        self.lower_bounds, self.upper_bounds = self.search_bounds()
+        self.personal_attraction = np.zeros((self.population_size, self.num_variables))
+        self.global_attraction = np.zeros((self.population_size, self.num_variables))
+        
+        
+    def _synchronous_update(self):
+        """ Update bests, velocities and positions of the whole swarm at once """
+        positions = self.swarm_positions[:, :-1]
+        
+        # Update personal best solutions
+        improved = self.swarm_positions[:, -1] < self.personal_bests[:, -1]
+        self.personal_bests[improved, :] = self.swarm_positions[improved, :]
+        acceptance_count = np.count_nonzero(improved)
+        
+        # Update global best solution
+        best_particle = np.argmin(self.personal_bests[:, -1])
+        if self.personal_bests[best_particle, -1] < self.global_best[-1]:
+            self.global_best = np.array(self.personal_bests[best_particle, :])
+            
+        # Update inertia weight based on success rate of the swarm
+        # Has no effect in vanilla PSO
+        self.update_inertia_weight(acceptance_count)
+        
+        # Update velocities, with one random acceleration factor per particle for each attraction
+        np.subtract(self.personal_bests[:, :-1], positions, out = self.personal_attraction)
+        self.personal_attraction *= self.personal_acceleration * np.random.rand(self.population_size, 1)
+        np.subtract(self.global_best[:-1], positions, out = self.global_attraction)
+        self.global_attraction *= self.global_acceleration * np.random.rand(self.population_size, 1)
+        self.swarm_velocities += self.personal_attraction
+        self.swarm_velocities += self.global_attraction
+        self.swarm_velocities *= self.inertia_weight
+        
+        # Update positions and restrict search for bounded variables using the hard border strategy
+        positions += self.swarm_velocities
+        np.clip(positions, self.lower_bounds, self.upper_bounds, out = positions)
+        
+        
     def optimize(self):
         """ Initializes the archive and enter the main loop, until it reaches maximum number of iterations """
         # Variables and cost function must be defined prior to optimization
         if self.num_variables == None:
             print("Error, number of variables and their boundaries must be defined prior to optimization")
             exit(-1)
-        if self.cost_function == None:
+        if self.cost_function == None and self.batch_cost_function == None:
             print("Error, cost function must be defined prior to optimization")
             exit(-1)
         
-        # Initialize swarm positions and velocities randomly
-        for i in range(self.population_size):
-            for j in range(self.num_variables):
-                self.swarm_positions[i, j] = np.random.uniform(self.initial_ranges[j][0], self.initial_ranges[j][1])
-                self.swarm_velocities[i, j] = np.random.uniform(self.initial_ranges[j][0], self.initial_ranges[j][1])
-        
         # Keep solutions defined by function_evaluations_array
         recorded_solutions = []
+        first_iteration = 0
+        
+        # Resume from a checkpoint or start a new search
+        loop_state = self.resume_checkpoint()
+        if loop_state != None:
+            first_iteration = loop_state['iteration']
+            recorded_solutions = loop_state['recorded_solutions']
+        elif self.update_mode == 'synchronous':
+            # Initialize swarm positions and velocities randomly, all particles at once
+            lower_ranges = np.array([initial_range[0] for initial_range in self.initial_ranges])
+            upper_ranges = np.array([initial_range[1] for initial_range in self.initial_ranges])
+            self.swarm_positions[:, :-1] = np.random.uniform(lower_ranges, upper_ranges, (self.population_size, self.num_variables))
+            self.swarm_velocities[:, :] = np.random.uniform(lower_ranges, upper_ranges, (self.population_size, self.num_variables))
+        else:
+            # Initialize swarm positions and velocities randomly
+            for i in range(self.population_size):
+                for j in range(self.num_variables):
+                    self.swarm_positions[i, j] = np.random.uniform(self.initial_ranges[j][0], self.initial_ranges[j][1])
+                    self.swarm_velocities[i, j] = np.random.uniform(self.initial_ranges[j][0], self.initial_ranges[j][1])
+        
+        if self.update_mode == 'synchronous':
+            self._allocate_synchronous_buffers()
         
         # Main optimization loop (population_size * num_iter cost function evaluations)
-        for iteration in range(self.num_iter):
-            # When using adaptive inertia weight
-            acceptance_count = 0
+        for iteration in range(first_iteration, self.num_iter):
+            # Compute cost of new positions
+            # Positions are updated only after being evaluated, so the whole swarm can be evaluated before updating bests
+            self.swarm_positions[:, -1] = self.evaluate_population(self.swarm_positions[:, :-1])
             
-            for particle in range(self.population_size):
-                # Compute cost of new position
-                self.swarm_positions[particle, -1] = self.cost_function(self.swarm_positions[particle, :-1], -1)
-                
-                # Update personal best solution
-                if self.swarm_positions[particle, -1] < self.personal_bests[particle, -1]:
-                    self.personal_bests[particle, :] = np.array(self.swarm_positions[particle, :])
-                    acceptance_count += 1
-                    
-                    # Update global best solution
-                    if self.personal_bests[particle, -1] < self.global_best[-1]:
-                        self.global_best = np.array(self.personal_bests[particle, :])
-                        
-                # Update inertia weight based on success rate of the swarm
-                # Has no effect in vanilla PSO
-                self.update_inertia_weight(acceptance_count)
-                
-                # Update velocity vector
-                self.swarm_velocities[particle, :] =    self.inertia_weight * (self.swarm_velocities[particle, :]
-                                                        + self.personal_acceleration  * np.random.rand() * (self.personal_bests[particle, :-1]    - self.swarm_positions[particle, :-1])
-                                                        + self.global_acceleration    * np.random.rand() * (self.global_best[:-1]                 - self.swarm_positions[particle, :-1]))
-                # Update position vector
-                self.swarm_positions[particle, :-1] = self.swarm_positions[particle, :-1] + self.swarm_velocities[particle, :]
-                
-                # Restrict search for bounded variables
-                for var in range(self.num_variables):
-                    if self.is_bounded[var]:
-                        # Use the hard border strategy
-                        if self.swarm_positions[particle, var] < self.initial_ranges[var][0]:
-                            self.swarm_positions[particle, var] = self.initial_ranges[var][0]
-                        elif self.swarm_positions[particle, var] > self.initial_ranges[var][1]:
-                            self.swarm_positions[particle, var] = self.initial_ranges[var][1]        
+            with instrumentation.phase('velocity_update'):
+                if self.update_mode == 'synchronous':
+                    self._synchronous_update()
+                else:
+                    self._asynchronous_update()
             
             if (self.relative_iterations - 1 == iteration).any():
                 recorded_solutions.append(np.array(self.global_best))
             
+            self.iteration_finished()
+            self.checkpoint_if_due({'iteration': iteration + 1, 'recorded_solutions': recorded_solutions}, self.function_evaluations)
+            if self.stopping_criterion_met():
+                break
+            
+        recorded_solutions = self.fill_recorded_solutions(recorded_solutions, self.global_best)
+        self.finish_search()
+        
         return np.array(recorded_solutions)
         
         
@@ -17,11 +17,9 @@
 
 # Python std lib
 import sys
-import math
 # 3rd party
 import numpy as np
 import matplotlib.pyplot as plt
-# from scipy.special import binom
 # Own
 import laguerre_volterra_network_structure
 
@@ -31,28 +29,6 @@ if len(sys.argv) != 2:
     
 j = int(sys.argv[1])
 
-def binom(n, k):
-    if n < k:
-        return 0
-    
-    return math.factorial(n) / ( math.factorial(k) * math.factorial(n - k))
-
-     
-def laguerre_filter_response(order, alpha, memory):
-    filter_impulse_response = []
-    for m in range(memory):
-        sum = 0.0
-        for k in range(order+1):                
-            sum += ((-1) ** k) * binom(m, k) * binom(order, k) * (alpha ** (order - k)) * ((1 - alpha) ** k)
-
-        output = (alpha ** ((m - order)/2)) * np.sqrt(1 - alpha) * sum
-        filter_impulse_response.append(output)
-    
-        
-    return np.array(filter_impulse_response)
-    
-    
-    
 plt.figure(figsize=(10,10))
 # Font sizes
 SMALL_SIZE = 8
@@ -73,7 +49,7 @@ labels = ['alpha = ' + str(i) for i in alphas]
 
 plt.plot(np.zeros(100), color = 'k')
 for alpha, style, label in zip(alphas, styles, labels):
-    plt.plot(laguerre_filter_response(j, alpha, 100), label = label, linestyle = style, linewidth=2, color='k')    
+    plt.plot(laguerre_volterra_network_structure.laguerre_impulse_responses(alpha, j + 1, 100)[j], label = label, linestyle = style, linewidth=2, color='k')    
 
 plt.ylabel(r'$b_%d[m]$' % j)
 plt.xlabel('m')
@@ -17,11 +17,9 @@
 
 # Python std lib
 import sys
-import math
 # 3rd party
 import numpy as np
 import matplotlib.pyplot as plt
-# from scipy.special import binom
 # Own
 import laguerre_volterra_network_structure
 
@@ -32,36 +30,8 @@ if len(sys.argv) != 3:
 L = int(sys.argv[1])
 alpha = float(sys.argv[2])
 
-def binom(n, k):
-    if n < k:
-        return 0
-    
-    return math.factorial(n) / ( math.factorial(k) * math.factorial(n - k))
-
-def laguerre_filter_response(order, alpha, memory):
-    filter_impulse_response = []
-    for m in range(memory):
-        sum = 0.0
-        for k in range(order+1):                
-            sum += ((-1) ** k) * binom(m, k) * binom(order, k) * (alpha ** (order - k)) * ((1 - alpha) ** k)
-
-        output = (alpha ** ((m - order)/2)) * np.sqrt(1 - alpha) * sum
-        filter_impulse_response.append(output)
-    
-        
-    return np.array(filter_impulse_response)
-    
-def laguerre_filterbank_response(max_order, alpha, memory):
-    filterbank_impulse_responses = []
-    for j in range(max_order):
-        order_response = laguerre_filter_response(j, alpha, memory)
-        filterbank_impulse_responses.append(order_response)
-        
-    return np.array(filterbank_impulse_responses)
-    
-    
 # #memory = laguerre_volterra_network_structure.laguerre_filter_memory(alpha)
-laguerre_bank = laguerre_filterbank_response(L, alpha, 250)
+laguerre_bank = laguerre_volterra_network_structure.laguerre_impulse_responses(alpha, L, 250)
 
 plt.figure(figsize=(10,10))
 # Font sizes
@@ -19,123 +19,56 @@
 
 # Python std library
 import sys
-import math
 # Own
 import laguerre_volterra_network_structure
 import data_handling
+import simulated_systems
+import volterra_kernels
 # Third party
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.colors import TwoSlopeNorm 
-#from scipy.special import binom
-from mpl_toolkits.mplot3d import Axes3D
-from matplotlib import cm
-from matplotlib.ticker import LinearLocator, FormatStrFormatter
-
-def binom(n, k):
-    if n < k:
-        return 0
-    
-    return math.factorial(n) / ( math.factorial(k) * math.factorial(n - k))
 
 if len(sys.argv) != 2:
     print("Error, specify the LVN file to extract kernels from")
     print("E.g. \"py %s my_sys.LVN\" " % sys.argv[0])
     exit(-1)
 
-def laguerre_filterbank_response(order, alpha):
-    memory = laguerre_volterra_network_structure.laguerre_filter_memory(alpha)
-    
-    filterbank_impulse_responses = []
-    for j in range(order):
-        order_response = []
-        for m in range(memory):
-            sum = 0.0
-            for k in range(j):
-                sum += ((-1) ** k) * binom(m, k) * binom(j, k) * (alpha ** (j - k)) * ((1 - alpha) ** k)
-            
-            output = (alpha ** ((m - j)/2)) * np.sqrt(1 - alpha) * sum
-            order_response.append(output)
-        
-        filterbank_impulse_responses.append(order_response)
-        
-    return np.array(filterbank_impulse_responses)
-    
-    
 #LVN_parameters = data_handling.read_LVN_file("finite_ord_train_system.LVN")
-LVN_parameters = data_handling.read_LVN_file(sys.argv[1])
-print(np.shape(LVN_parameters[2]))
-alpha = LVN_parameters[0]
-W = np.array(LVN_parameters[1])
-C = np.array(LVN_parameters[2])
-offset = LVN_parameters[3]
+alpha, W, C, offset = data_handling.read_LVN_file(sys.argv[1])
+print(np.shape(C))
 
 L = len(W[0])
 Q = len(C[0])
 H = len(C)
 
-memory = laguerre_volterra_network_structure.laguerre_filter_memory(alpha)
-
-laguerre_bank = laguerre_filterbank_response(L, alpha)
-
-# Compute 1st order kernel
-kernel_1 = np.array([0.0]*memory)
-# At each kenel point
-for m in range(memory):
-    sum_units = 0.0
-    # For each hidden unit
-    for h in range(H):
-        sum_filters = 0.0
-        # For each laguerre filter
-        for j in range(L):
-            sum_filters += W[h][j] * laguerre_bank[j, m]
-            
-        sum_units += C[h, 0] * sum_filters
-    kernel_1[m] = np.float(sum_units)
+# Kernels are extracted from a network with the sampling interval of the simulated systems
+system = laguerre_volterra_network_structure.LVN()
+system.define_structure(L, H, Q, 1 / simulated_systems.Fs)
+kernels = volterra_kernels.volterra_kernels(system, alpha, W, C, offset, max_order = min(2, Q))
+memory = len(kernels[1])
 
+# 1st order kernel
+kernel_1 = kernels[1]
 print("[1st order Volterra kernel]")    
 print(kernel_1)
 plt.figure(figsize=(10,10))
 plt.xticks(np.arange(0,memory,1))
 plt.plot(kernel_1, color='k')
 
-# Compute 2nd order kernel
-kernel_2 = np.array([[0.0] * memory for _ in range(memory)])
-# At each kenel point
-for m1 in range(memory):
-    for m2 in range(memory):
-        sum_units = 0.0
-        # For each hidden unit
-        for h in range(H):
-            sum_filters = 0.0
-            # For each laguerre filter
-            for j1 in range(L):
-                for j2 in range(L):
-                    sum_filters += W[h][j1] * W[h][j2] * laguerre_bank[j1, m1] * laguerre_bank[j2, m2]
-            
-            sum_units += C[h, 1] * sum_filters
-        
-        kernel_2[m1, m2] = sum_units
-        
-print("[2nd order Volterra kernel]")    
-print(kernel_2)
-
-fig = plt.figure(figsize=(10,10))
-
-# 3D plot
-# ax = fig.gca(projection='3d')
-# x = y = np.arange(0, memory, 1)
-# X, Y = np.meshgrid(x, y)
-# ax.plot_surface(X, Y, kernel_2, cmap='inferno', antialiased=False, alpha=0.27)
-# # Customize the z axis.
-# ax.set_zlim(-1.01, 1.01)
-# ax.zaxis.set_major_locator(LinearLocator(10))
-# ax.zaxis.set_major_formatter(FormatStrFormatter('%.02f'))
-
-# Heatmap plot
-norm = TwoSlopeNorm(vmin=kernel_2.min(), vmax = kernel_2.max(), vcenter=0)
-plt.imshow(kernel_2, cmap='RdBu', interpolation='nearest', norm=norm)
-plt.xticks(np.arange(0, memory, 1))
-plt.yticks(np.arange(0, memory, 1))
-plt.colorbar()
-plt.show()
\ No newline at end of file
+if Q >= 2:
+    # 2nd order kernel
+    kernel_2 = kernels[2]
+    print("[2nd order Volterra kernel]")    
+    print(kernel_2)
+    
+    fig = plt.figure(figsize=(10,10))
+    
+    # Heatmap plot
+    norm = TwoSlopeNorm(vmin=kernel_2.min(), vmax = kernel_2.max(), vcenter=0)
+    plt.imshow(kernel_2, cmap='RdBu', interpolation='nearest', norm=norm)
+    plt.xticks(np.arange(0, memory, 1))
+    plt.yticks(np.arange(0, memory, 1))
+    plt.colorbar()
+    
+plt.show()
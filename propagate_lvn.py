@@ -15,50 +15,64 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+# Check that the IIR and FFT Laguerre filterbank engines reproduce the reference sample-by-sample engine on the stored datasets, and time them
+
 # Python std lib
 import time
 # Own
 import laguerre_volterra_network_structure
-import optimization_utilities
 import data_handling
 # Third party
 import numpy as np
 
-signals_filename = './signals_and_systems/finite_order_train.csv'
-lvn_filename = './signals_and_systems/finite_order_train_system.LVN'
-
-train_input, train_output = data_handling.read_io(signals_filename)
-# print(np.array(train_input))
-# print(np.array(train_output))
-
 Fs = 25
-L = 5; H = 3; Q = 4
-alpha, W, C, offset = data_handling.read_LVN_file(lvn_filename)
-
-# print(alpha)
-# print(W)
-# print(C)
-# print(offset)
-
-solution_system = laguerre_volterra_network_structure.LVN()
-solution_system.define_structure(L, H, Q, 1/Fs)
-# solution_output = solution_system.compute_output(train_input, alpha, W, C, offset, False)
-# solution_output_mod = solution_system.compute_output_mod(train_input, alpha, W, C, offset, False)
+# Pairs of signal and system files
+datasets = [('./signals_and_systems/finite_order_train.csv', './signals_and_systems/finite_order_train_system.LVN'),
+            ('./signals_and_systems/finite_order_test.csv' , './signals_and_systems/finite_order_test_system.LVN'),
+            ('./signals_and_systems/long_finite_train.csv' , './signals_and_systems/long_finite_train_system.LVN'),
+            ('./signals_and_systems/long_finite_test.csv'  , './signals_and_systems/long_finite_test_system.LVN')]
+# Relative tolerance on the maximum absolute difference between engines
+tolerance = 1e-10
 
-# print('CSV output')
-# print(np.array(train_output))
-# print('Propagated output')
-# print(np.array(solution_output))
-# print('Propagated output MOD')
-# print(np.array(solution_output))
-
-times_std = []
-times_mod = []
-
-for _ in range(10):
-    time_start = time.process_time()
-    solution_output = solution_system.compute_output(train_input, alpha, W, C, offset, False)
-    time_end = time.process_time()
-    times_std.append(time_end-time_start)
+all_equivalent = True
+for signals_filename, lvn_filename in datasets:
+    print(signals_filename)
+    train_data = data_handling.load_io(signals_filename)
+    alpha, W, C, offset = data_handling.read_LVN_file(lvn_filename)
+    L = len(W[0]);  H = len(W);  Q = len(C[0])
+    
+    solution_system = laguerre_volterra_network_structure.LVN()
+    solution_system.define_structure(L, H, Q, 1/Fs)
     
-print(f'Times standard = {np.mean(times_std)} ({np.std(times_std)})')
\ No newline at end of file
+    outputs = {}
+    times = {}
+    for engine in ['loop', 'iir', 'fft']:
+        solution_system.set_filterbank_engine(engine)
+        engine_times = []
+        for _ in range(3):
+            time_start = time.perf_counter()
+            bank_outputs = solution_system.propagate_laguerre_filterbank(train_data.input, alpha)
+            time_end = time.perf_counter()
+            engine_times.append(time_end - time_start)
+        outputs[engine] = bank_outputs
+        times[engine] = np.min(engine_times)
+    
+    # Compare filterbank outputs and LVN outputs of each engine with the reference loop
+    solution_system.set_filterbank_engine('loop')
+    loop_output = solution_system.compute_output(train_data.input, alpha, W, C, offset, False)
+    print(f'N = {train_data.num_samples}, L = {L}')
+    for engine in ['iir', 'fft']:
+        bank_error = np.max(np.abs(outputs[engine] - outputs['loop'])) / np.max(np.abs(outputs['loop']))
+        solution_system.set_filterbank_engine(engine)
+        engine_output = solution_system.compute_output(train_data.input, alpha, W, C, offset, False)
+        output_error = np.max(np.abs(engine_output - loop_output)) / np.max(np.abs(loop_output))
+        
+        equivalent = bank_error < tolerance and output_error < tolerance
+        all_equivalent = all_equivalent and equivalent
+        print(f'{engine.upper()} engine: filterbank relative error = {bank_error:.3e}, output relative error = {output_error:.3e}, '
+              f'time = {times[engine]:.6f} s, speedup over loop = {times["loop"] / times[engine]:.1f}x')
+    print()
+
+if not all_equivalent:
+    print('Error, filterbank engines are not equivalent')
+    exit(-1)
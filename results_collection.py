@@ -24,17 +24,16 @@ import numpy as np
 # Utilities
 import optimization_utilities
 import data_handling
+import evaluation_executors
+import experiment_configuration
 # LVN
 import laguerre_volterra_network_structure
-# Metaheuristics
-import ant_colony_for_continuous_domains
-import simulated_annealing
-import particle_swarm_optimization
 
 # Argument number checking
-if len(sys.argv) != 3:
-    print('Error, wrong number of arguments. Execute this script as follows:\npython3 %s {simulated system order} {metaheuristic}' % sys.argv[0])
+if len(sys.argv) != 3 and len(sys.argv) != 4:
+    print('Error, wrong number of arguments. Execute this script as follows:\npython3 %s {simulated system order} {metaheuristic} [{number of worker processes}]' % sys.argv[0])
     print('The allowed values are: order = {\'finite\', \'infinite\'},  metaheuristic = {\'ACOr\', \'BAACOr\', \'SA\', \'ACFSA\', \'PSO\',  \'AIWPSO\'}')
+    print('Worker processes evaluate the populations of ACOr, BAACOr, PSO and AIWPSO in parallel (default 1)')
     exit(-1)
     
 # Argument coherence checking
@@ -45,135 +44,49 @@ if order_str != 'finite' and order_str != 'infinite':
     
 metaheuristic_name = (sys.argv[2]).lower()
 
-if metaheuristic_name != 'acor' and metaheuristic_name != 'baacor'  and metaheuristic_name != 'sa' and metaheuristic_name != 'acfsa' and metaheuristic_name != 'pso' and metaheuristic_name != 'aiwpso':
+if metaheuristic_name != 'acor' and metaheuristic_name != 'baacor'  and metaheuristic_name != 'sa' and metaheuristic_name != 'acfsa' and metaheuristic_name != 'pso' and metaheuristic_name != 'aiwpso' and metaheuristic_name != 'ptsa' and metaheuristic_name != 'ptacfsa':
     print('Error, choose an available metaheuristic')
     exit(-1)
 
-# Filenames for train and test signals
-train_filename = None
-test_filename = None
-
-# Optimized LVN structure definition
-Fs = 25                             # Sampling frequency is assumed to be 25 Hz, but could be any other value
-L = None;   H = None;    Q = None;    
+num_workers = 1
+if len(sys.argv) == 4:
+    num_workers = int(sys.argv[3])
+    if num_workers <= 0:
+        print('Error, the number of worker processes must be positive')
+        exit(-1)
 
 # Whether the simulated system has finite or infinite order determines the structure of the optimized LVN and from which file the data will be loaded
-train_filename = './signals_and_systems/' + order_str + '_order_train.csv'
-test_filename  = './signals_and_systems/' + order_str + '_order_test.csv'
-if order_str == 'finite':
-    L = 5;  H = 3;  Q = 4
-else:
-    L = 2;  H = 3;  Q = 5
-
-# Number of objective function evaluations of interest
-function_evals = [i * 100 for i in range(101)] + [11000 + i * 1000 for i in range(90)]
-
-# Instantiate metaheuristic
-metaheuristic = None
-if metaheuristic_name == 'acor':
-    print('ACOr')
-    # Parameters used for ACOr
-    k = 50;  pop_size = 10;  q = 0.01; xi = 0.85
-    metaheuristic = ant_colony_for_continuous_domains.ACOr()
-    metaheuristic.set_parameters(pop_size, k, q, xi, function_evals)
-    
-elif metaheuristic_name == 'baacor':
-    print('BAACOr')
-    # Parameters used for BAACOr
-    k = 50
-    m = 10
-    q_min = 1e-2;    q_max = 1.0
-    xi_min = 0.1;    xi_max = 0.93
-    # Configure
-    metaheuristic = ant_colony_for_continuous_domains.BAACOr()
-    metaheuristic.set_verbosity(False)
-    metaheuristic.set_parameters(m, k, q_min, q_max, xi_min, xi_max, 'exp', 'sig', function_evals)
-
-elif metaheuristic_name == 'sa':
-    print('SA')
-    # Parameters to be used for SA
-    initial_temperature = 10.0;  cooling_constant = 0.99;  step_size = 1e-2;
-    local_iterations = 100
-    metaheuristic = simulated_annealing.SA()
-    metaheuristic.set_parameters(initial_temperature, cooling_constant, step_size, local_iterations, function_evals)
-    
-elif metaheuristic_name == 'acfsa':
-    print('ACFSA')
-    # Parameters to be used for ACFSA
-    local_iterations = 100
-    initial_temperature = 10
-    cooling_constant = 0.99
-    # Configure
-    metaheuristic = simulated_annealing.ACFSA()
-    metaheuristic.set_verbosity(False)
-    metaheuristic.set_parameters(initial_temperature, cooling_constant, local_iterations, function_evals)
-
-
-elif metaheuristic_name == 'pso':
-    print('PSO')
-    # Parameters to be used for PSO
-    swarm_size = 20;  personal_acceleration = 2;  global_acceleration = 2
-    metaheuristic = particle_swarm_optimization.PSO()
-    metaheuristic.set_parameters(swarm_size, personal_acceleration, global_acceleration, function_evals)
-    
-else: # metaheuristic_name == "aiwpso":
-    print("AIWPSO")
-    # Parameters to be used for AIWPSO
-    swarm_size = 20;  personal_acceleration = 2;  global_acceleration = 2
-    min_inertia = 0.3; max_inertia = 0.99
-    metaheuristic = particle_swarm_optimization.AIWPSO()
-    metaheuristic.set_parameters(swarm_size, personal_acceleration, global_acceleration, min_inertia, max_inertia, function_evals)
-
-# Cost function definition based on structural parameters and ground truth
-metaheuristic.set_cost(optimization_utilities.define_cost(L, H, Q, Fs, train_filename))
-
-# Define characteristics of variables to be optimized
-# Variables initial ranges
-alpha_min   = 1e-5; alpha_max   = 0.9   # estimated lag with alpha = 0.9 is 263
-weight_min  = -1;   weight_max  = 1
-coef_min    = -1;   coef_max    = 1  
-offset_min  = -1;   offset_max  = 1
-
-# Define the ranges to be used in random initialization of algorithms for each variable,
-#  along with which variables are bounded by these ranges during the optimization
-initial_ranges = []
-is_bounded = []
+train_filename, test_filename = experiment_configuration.signal_filenames(order_str)
+L, H, Q = experiment_configuration.lvn_structure(order_str)
+Fs = experiment_configuration.Fs
 
-# Alpha variable is bounded
-initial_ranges.append([alpha_min,alpha_max])
-is_bounded.append(True)
-# Hidden units input weights are forcedly bounded by l2-normalization (normalization to unit Euclidean norm), not by the metaheuristics
-for _ in range(L * H): 
-    initial_ranges.append([weight_min, weight_max])
-    is_bounded.append(False)
-# Polynomial coefficients are not bounded in the initial range
-for _ in range(Q * H):
-    initial_ranges.append([coef_min,coef_max])
-    is_bounded.append(False)
-# Output offset is not bounded in the initial range
-initial_ranges.append([offset_min, offset_max])
-is_bounded.append(False)
+# Instantiate metaheuristic, with the cost function and variables used in the experiments
+print(metaheuristic_name)
+metaheuristic = experiment_configuration.configure_experiment(order_str, metaheuristic_name)
 
-metaheuristic.define_variables(initial_ranges, is_bounded)
-metaheuristic.set_verbosity(False)
+# Each worker process loads the train set once and evaluates a chunk of every population
+if num_workers > 1 and metaheuristic_name != 'sa' and metaheuristic_name != 'acfsa':
+    metaheuristic.set_executor(evaluation_executors.ProcessExecutor(num_workers, optimization_utilities.define_cost, (L, H, Q, Fs, train_filename),
+                                                                    optimization_utilities.define_batch_cost))
 
 # Run the metaheuristic 30 times and save results for the best found solution of each run
 # For each found solution, compute cost function on test set
-test_input, test_output = data_handling.read_io(test_filename)
+test_data = data_handling.load_io(test_filename)
 train_solutions = []
 train_costs = []
 test_costs = []
 LVN = laguerre_volterra_network_structure.LVN()
 LVN.define_structure(L, H, Q, 1/Fs)
-# Keep how much seconds each call to .optimize() spends
+# Keep how much wall-clock seconds each call to .optimize() spends
+# CPU time of this process would miss the evaluations done by the worker processes
 optimization_times = []
 
-for i in range(30):
+for i in range(experiment_configuration.num_runs):
     # Search parameters on train set
     print('Round %d' % i)
-    time_start = time.process_time()
+    time_start = time.perf_counter()
     solutions_at_FEs = metaheuristic.optimize()
-    time_end = time.process_time()
+    time_end = time.perf_counter()
     # Keep time spent
     optimization_times.append(time_end - time_start)
     # Keep full solutions
@@ -181,13 +94,8 @@ for i in range(30):
     # Keep costs separate
     train_costs.append(solutions_at_FEs[:, -1])
     # Decode solution and evaluate parameters on test set
-    run_test_NMSEs = []
-    for solution in solutions_at_FEs:
-        alpha, W, C, offset = optimization_utilities.decode_solution(solution, L, H, Q)
-        test_out_prediction = LVN.compute_output(test_input, alpha, W, C, offset, True)
-        test_nmse = optimization_utilities.NMSE(test_output, test_out_prediction, alpha)
-        run_test_NMSEs.append(test_nmse) 
-    test_costs.append(run_test_NMSEs)
+    test_costs.append(experiment_configuration.test_costs(solutions_at_FEs, L, H, Q, test_data, LVN))
+metaheuristic.executor.shutdown()
 
 output_base_filename = metaheuristic_name + '_' + order_str
 np.save('./results/' + output_base_filename + '_times.npy'          , optimization_times)   
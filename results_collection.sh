@@ -1,15 +1,4 @@
 # Num FE: 1 k, 5 k, 10 k, 50 k, 100 k (plot all 5 in log scale of x axis)
-# Finite order system
-nohup python3 results_collection.py finite sa&
-nohup python3 results_collection.py finite acfsa&
-nohup python3 results_collection.py finite pso&
-nohup python3 results_collection.py finite aiwpso&
-nohup python3 results_collection.py finite acor&
-nohup python3 results_collection.py finite baacor&
-
-nohup python3 results_collection.py infinite sa&
-nohup python3 results_collection.py infinite acfsa&
-nohup python3 results_collection.py infinite pso&
-nohup python3 results_collection.py infinite aiwpso&
-nohup python3 results_collection.py infinite acor&
-nohup python3 results_collection.py infinite baacor&
+# Runs all metaheuristics 30 times in both finite and infinite order systems, using one process per CPU
+# Interrupted executions resume from the runs already stored in ./results/runs/
+nohup python3 experiment_runner.py&
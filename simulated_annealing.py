@@ -21,14 +21,106 @@ import math
 import numpy as np
 # Own
 from base_metaheuristic import Base
+import instrumentation
 
+# Default number of uniform variates up to which Bates samples are drawn exactly
+BATES_EXACT_THRESHOLD = 32
+
+# Sample the Bates distribution, the mean of n uniforms in [-0.5, 0.5], with a cost that does not depend on n
+# Up to exact_threshold, the uniforms are drawn and averaged. Above it, the sum of uniforms (Irwin-Hall) is approximated by the Cornish-Fisher expansion of a standard normal sample,
+#  which corrects the normal approximation with the excess kurtosis -1.2/n of the Irwin-Hall distribution (its odd cumulants are null),
+#  leaving an error of order 1/n^2 in the distribution function. The sample is clipped to the [-0.5, 0.5] support of the Bates distribution
+# If exact_threshold is None, all samples are drawn exactly
+def sample_bates(n, exact_threshold = BATES_EXACT_THRESHOLD):
+    if exact_threshold is None or n <= exact_threshold:
+        return np.sum(np.random.uniform(low = -0.5, high = 0.5, size = n)) / n
+    
+    return bates_from_normal(np.random.standard_normal(), n)
+    
+# Approximate Bates sample from a standard normal sample z, with the Cornish-Fisher expansion described above
+def bates_from_normal(z, n):
+    excess_kurtosis = -1.2 / n
+    standardized_sum = z + excess_kurtosis / 24 * (z ** 3 - 3 * z)
+    # The sum of n uniforms in [-0.5, 0.5] has variance n/12, so their mean has standard deviation 1/sqrt(12n)
+    sample = standardized_sum / math.sqrt(12 * n)
+    
+    return min(max(sample, -0.5), 0.5)
+    
+
+class PrefetchedRandomStream:
+    ''' Random numbers of the SA inner loop drawn from a np.random.Generator in preallocated blocks and consumed sequentially.
+        Each kind of number (chosen variable, perturbation sign, Metropolis exponential and Bates normal) has its own block, refilled when exhausted,
+        so the per-call overhead of NumPy is paid once per block instead of once per number. The stream is pickled in checkpoints, blocks included. '''
+    
+    def __init__(self, generator, num_variables, block_size = 4096):
+        if block_size <= 0:
+            print("Error, the block size must be positive")
+            exit(-1)
+            
+        self.generator = generator
+        self.num_variables = num_variables
+        self.block_size = block_size
+        self.blocks = {}
+        self.positions = {}
+        
+        
+    def _draw_block(self, kind):
+        ''' Draw a block of numbers of the given kind '''
+        if kind == 'variable':
+            return self.generator.integers(0, self.num_variables, size = self.block_size).tolist()
+        if kind == 'sign':
+            return (1 - 2 * self.generator.integers(0, 2, size = self.block_size)).tolist()
+        if kind == 'exponential':
+            return self.generator.standard_exponential(size = self.block_size).tolist()
+        if kind == 'normal':
+            return self.generator.standard_normal(size = self.block_size).tolist()
+            
+            
+    def _next(self, kind):
+        ''' Next number of the given kind, refilling its block if it is exhausted '''
+        position = self.positions.get(kind, self.block_size)
+        if position == self.block_size:
+            self.blocks[kind] = self._draw_block(kind)
+            position = 0
+        self.positions[kind] = position + 1
+        
+        return self.blocks[kind][position]
+        
+        
+    def variable(self):
+        ''' Uniformly chosen variable index in [0, num_variables) '''
+        return self._next('variable')
+        
+        
+    def sign(self):
+        ''' -1 or 1 with equal probabilities '''
+        return self._next('sign')
+        
+        
+    def exponential(self):
+        ''' Standard exponential sample. Accepting a cost increase delta_J when delta_J <= temperature * exponential() has probability exp(-delta_J / temperature) '''
+        return self._next('exponential')
+        
+        
+    def normal(self):
+        ''' Standard normal sample '''
+        return self._next('normal')
+        
+        
+    def uniform_sum(self, n):
+        ''' Sum of n uniforms in [-0.5, 0.5], drawn directly from the generator since n varies '''
+        return float(np.sum(self.generator.uniform(low = -0.5, high = 0.5, size = n)))
+        
+        
 class SA(Base):
     """ Class for the Simulated Annealing optimizer (Kirkpatrick et al., 1983) with perturbation on continuous variable as in (Geng and Marmarelis, 2016) and using exponential decay cooling schedule (Nourani and Andresen, 1998) """    
     
+    checkpoint_attributes = ['current_solution', 'best_solution', 'temperature', 'random_stream', 'speculation_evaluations']
+    
     def __init__(self):
         """ Constructor """
         # Define verbosity and NULL problem definition
-        super().__init__
+        super().__init__()
         
         # Initial algorithm parameters
         self.relative_iterations = None                 # Array containing the iterations at which best solutions are reported
@@ -42,6 +134,31 @@ class SA(Base):
         self.current_solution = None                    # Set of variables that define the current solution, with its cost as the last element of the list
         self.best_solution = None                       # Best solution of the archive
         
+        # In the 'legacy' random mode, random numbers are drawn one at a time from the global NumPy state, as in the published results.
+        # In the 'prefetched' mode, they are drawn in blocks from a per-run generator (see PrefetchedRandomStream)
+        self.random_mode = 'legacy'
+        self.random_seed = None                         # Seed of the per-run generator. If None, it is drawn from the global NumPy state when the search starts
+        self.random_block_size = 4096
+        self.random_stream = None
+        
+        # Speculative evaluation of the local iterations, disabled with a single proposal (see set_speculation)
+        self.num_speculative_proposals = 1
+        self.speculation_evaluations = None             # Used and wasted speculative evaluations of each global iteration (num_global_iter, 2)
+        
+        
+    def set_random_mode(self, random_mode, seed = None, block_size = 4096):
+        """ Choose between drawing random numbers one at a time from the global NumPy state ('legacy') or in blocks from a per-run generator ('prefetched') """
+        if random_mode != 'legacy' and random_mode != 'prefetched':
+            print("Error, random mode must be 'legacy' or 'prefetched'")
+            exit(-1)
+        if block_size <= 0:
+            print("Error, the block size must be positive")
+            exit(-1)
+            
+        self.random_mode = random_mode
+        self.random_seed = seed
+        self.random_block_size = block_size
+        
         
     def set_parameters(self, initial_temperature, cooling_constant, step_size, num_local_iter, function_evaluations_array):
         """ Define values for the parameters used by the algorithm """
@@ -64,6 +181,7 @@ class SA(Base):
         
         self.num_global_iter = int(np.max(self.relative_iterations))
         self.num_local_iter = num_local_iter     
+        self.iteration_evaluations = num_local_iter
         self.temperature = initial_temperature      
         self.cooling_constant = cooling_constant
         self.step_size = step_size
@@ -91,17 +209,150 @@ class SA(Base):
     def compute_perturbation(self):
         """ For vanilla SA, the perturbation has fixed size for all variables """
         # Random sign of perturbation
-        random_sign = (-1) ** np.random.randint(0,2)
+        if self.random_stream is None:
+            random_sign = (-1) ** np.random.randint(0,2)
+        else:
+            random_sign = self.random_stream.sign()
         perturbation = random_sign * self.step_size
         
         return perturbation
         
+    def generate_candidate(self):
+        """ Choose a variable of the current solution and perturbate it, returning the candidate solution (with the cost of the current one) """
+        # Choose which variable will be pertubated
+        if self.random_stream is None:
+            self.chosen_variable = np.random.randint(0, self.num_variables)      # [0, num_variables)
+        else:
+            self.chosen_variable = self.random_stream.variable()
+        
+        # Perturbate the chosen variable
+        perturbation = self.compute_perturbation()
+        pertubated_variable = self.current_solution[self.chosen_variable] + perturbation
+        # For bounded variables, deal with search space violation using the hard border strategy
+        if self.is_bounded[self.chosen_variable]:
+        
+            if pertubated_variable < self.initial_ranges[self.chosen_variable][0]:
+                pertubated_variable = self.initial_ranges[self.chosen_variable][0]
+            
+            elif pertubated_variable > self.initial_ranges[self.chosen_variable][1]:
+                pertubated_variable = self.initial_ranges[self.chosen_variable][1]
+        
+        candidate_solution = np.array(self.current_solution)
+        candidate_solution[self.chosen_variable] = pertubated_variable
+        
+        return candidate_solution
+        
+        
     # Feedback functions over Bates distribution standard deviation in ACFSA
     # No effect on vanilla SA
     def positive_feedback(self):
         pass
     def negative_feedback(self):
         pass
+    # State changed by the feedback functions, saved and restored by the speculative evaluation
+    def feedback_state(self):
+        return None
+    def restore_feedback_state(self, state):
+        pass
+        
+    def emigrants(self, num_migrants):
+        """ A single chain only has its best solution to send """
+        return np.array([self.best_solution])
+        
+        
+    def inject_migrants(self, migrants):
+        """ The best migrant replaces the current solution if it is better. A stateful cost function rebuilds the state of the current solution from it,
+            which is not counted as a function evaluation since the migrant was already evaluated by its island """
+        best_migrant = np.array(migrants[np.argmin(np.asarray(migrants)[:, -1])])
+        if best_migrant[-1] >= self.current_solution[-1]:
+            return
+        
+        if hasattr(self.cost_function, 'reset_state'):
+            with instrumentation.phase('evaluation'):
+                best_migrant[-1] = self.cost_function.reset_state(best_migrant[:-1])
+        self.current_solution = best_migrant
+        if self.current_solution[-1] < self.best_solution[-1]:
+            self.best_solution = np.array(self.current_solution)
+            
+            
+    def set_speculation(self, num_proposals):
+        """ Evaluate up to num_proposals candidates at once, generated from the current solution assuming that the previous ones are rejected.
+            Metropolis decisions are then replayed in order and the candidates after the first acceptance are discarded, so the accepted trajectory follows the same distribution as sequential SA.
+            Candidates are evaluated as a population, with the batch cost function and the executor. A num_proposals of 1 restores the sequential evaluation.
+            Only the used candidates count as function evaluations, for the budget as well as for the stopping criteria and progress events; the discarded ones are reported by speculation_efficiency """
+        if num_proposals < 1:
+            print("Error, the number of speculative proposals must be positive")
+            exit(-1)
+            
+        self.num_speculative_proposals = num_proposals
+        
+        
+    def speculation_efficiency(self):
+        """ Fraction of the speculative evaluations of the last search that were used, overall and per global iteration (nan for iterations not run) """
+        evaluated = np.sum(self.speculation_evaluations, axis = 1)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            per_iteration = self.speculation_evaluations[:, 0] / evaluated
+        
+        return np.sum(self.speculation_evaluations[:, 0]) / max(np.sum(evaluated), 1), per_iteration
+        
+        
+    def speculative_local_iterations(self, global_i):
+        """ Run the local iterations of a global iteration in speculative batches, which never cross global iterations since the temperature changes between them """
+        local_i = 0
+        while local_i < self.num_local_iter:
+            num_proposals = min(self.num_speculative_proposals, self.num_local_iter - local_i)
+            if self.verbosity:
+                print("[%d]" % (local_i + self.num_local_iter * global_i))
+                print(self.current_solution)
+            
+            ## Generate candidates from the current solution, tentatively applying the negative feedback of the previous ones
+            with instrumentation.phase('perturbation'):
+                saved_feedback_state = self.feedback_state()
+                candidates = np.empty((num_proposals, self.num_variables + 1))
+                chosen_variables = np.empty(num_proposals, dtype = int)
+                acceptance_samples = np.empty(num_proposals)
+                for j in range(num_proposals):
+                    candidates[j] = self.generate_candidate()
+                    chosen_variables[j] = self.chosen_variable
+                    # Drawn in the same order as the sequential SA
+                    acceptance_samples[j] = np.random.rand() if self.random_stream is None else self.random_stream.exponential()
+                    self.negative_feedback()
+            candidates[:, -1] = self.evaluate_population(candidates[:, :-1], account = False)
+            
+            ## Replay the Metropolis decisions in order, up to the first acceptance
+            with instrumentation.phase('acceptance'):
+                accepted = None
+                for j in range(num_proposals):
+                    delta_J = candidates[j, -1] - self.current_solution[-1]
+                    if self.random_stream is None:
+                        is_accepted = delta_J < 0 or acceptance_samples[j] <= math.exp(-delta_J/self.temperature)
+                    else:
+                        is_accepted = delta_J <= self.temperature * acceptance_samples[j]
+                    if is_accepted:
+                        accepted = j
+                        break
+                
+                num_used = num_proposals if accepted is None else accepted + 1
+                if accepted is not None:
+                    # Replay the feedback of the rejected candidates before the accepted one
+                    self.restore_feedback_state(saved_feedback_state)
+                    for j in range(accepted):
+                        self.chosen_variable = chosen_variables[j]
+                        self.negative_feedback()
+                    
+                    self.chosen_variable = chosen_variables[accepted]
+                    if candidates[accepted, -1] < self.best_solution[-1]:
+                        self.best_solution = np.array(candidates[accepted])
+                    self.current_solution = np.array(candidates[accepted])
+                    self.positive_feedback()
+                    
+                self.speculation_evaluations[global_i] += [num_used, num_proposals - num_used]
+                self.account_evaluations(num_used, np.min(candidates[:num_used, -1]))
+                instrumentation.count('speculative_used_evaluations', num_used)
+                instrumentation.count('speculative_wasted_evaluations', num_proposals - num_used)
+            
+            local_i += num_used
+            
         
     def optimize(self):
         """ Generate a random initial solution and enter the algorithm loop until the number of global iterations is reached """
@@ -112,86 +363,120 @@ class SA(Base):
         if self.cost_function == None:
             print("Error, first define the cost function to be used")
             exit(-1)
+        if self.num_speculative_proposals > 1 and self.batch_cost_function == None and hasattr(self.cost_function, 'commit'):
+            print("Error, speculative evaluation requires a stateless cost function or a batch cost function")
+            exit(-1)
         
-        # Randomize initial solution
-        for i in range(self.num_variables):
-            self.current_solution[i] = np.random.uniform(self.initial_ranges[i][0], self.initial_ranges[i][1])
-        # Compute its cost considering that weights were modified
-        self.current_solution[-1] = self.cost_function(self.current_solution[:-1], -1)
-        self.best_solution = np.array(self.current_solution)
-
         # Keep solutions defined by function_evaluations_array
         recorded_solutions = []
+        first_global_iter = 0
+        
+        # Resume from a checkpoint or start a new search
+        loop_state = self.resume_checkpoint()
+        if loop_state != None:
+            first_global_iter = loop_state['global_iteration']
+            recorded_solutions = loop_state['recorded_solutions']
+        else:
+            self.speculation_evaluations = np.zeros((self.num_global_iter, 2), dtype = int)
+            self.random_stream = None
+            if self.random_mode == 'prefetched':
+                seed = self.random_seed if self.random_seed is not None else np.random.randint(0, 2 ** 32, size = 4)
+                self.random_stream = PrefetchedRandomStream(np.random.default_rng(seed), self.num_variables, self.random_block_size)
+            
+            # Randomize initial solution
+            for i in range(self.num_variables):
+                if self.random_stream is None:
+                    self.current_solution[i] = np.random.uniform(self.initial_ranges[i][0], self.initial_ranges[i][1])
+                else:
+                    self.current_solution[i] = self.random_stream.generator.uniform(self.initial_ranges[i][0], self.initial_ranges[i][1])
+            # Compute its cost considering that weights were modified
+            self.current_solution[-1] = self.evaluate(self.current_solution[:-1], -1)
+            self.best_solution = np.array(self.current_solution)
+
         if self.verbosity: print("[ALGORITHM MAIN LOOP]")
         # SA main loop
-        for global_i in range(self.num_global_iter):
+        for global_i in range(first_global_iter, self.num_global_iter):
             # Update temperature according to the exponential decay cooling scheduling
             self.temperature = self.temperature * self.cooling_constant
-            for local_i in range(self.num_local_iter):
-                total_i = local_i + self.num_local_iter * global_i
-                if self.verbosity:
-                    print("[%d]" % total_i)
-                    print(self.current_solution)
+            if self.num_speculative_proposals > 1:
+                self.speculative_local_iterations(global_i)
+            else:
+                for local_i in range(self.num_local_iter):
+                    total_i = local_i + self.num_local_iter * global_i
+                    if self.verbosity:
+                        print("[%d]" % total_i)
+                        print(self.current_solution)
                 
-                ## Generate candidate solution and compute its cost
-                # Choose which variable will be pertubated
-                self.chosen_variable = np.random.randint(0, self.num_variables)      # [0, num_variables)
+                    ## Generate candidate solution and compute its cost
+                    with instrumentation.phase('perturbation'):
+                        candidate_solution = self.generate_candidate()
+                    candidate_solution[-1] = self.evaluate(candidate_solution[:-1], self.chosen_variable)
                 
-                # Perturbate the chosen variable
-                perturbation = self.compute_perturbation()
-                pertubated_variable = self.current_solution[self.chosen_variable] + perturbation
-                # For bounded variables, deal with search space violation using the hard border strategy
-                if self.is_bounded[self.chosen_variable]:
-                    
-                    if pertubated_variable < self.initial_ranges[self.chosen_variable][0]:
-                        pertubated_variable = self.initial_ranges[self.chosen_variable][0]
-                        
-                    elif pertubated_variable > self.initial_ranges[self.chosen_variable][1]:
-                        pertubated_variable = self.initial_ranges[self.chosen_variable][1]
+                    # Decide if solution will replace the current one based on the Metropolis sampling algorithm
+                    with instrumentation.phase('acceptance'):
+                        delta_J = candidate_solution[-1] - self.current_solution[-1] 
+                        if delta_J < 0:
+                            accepted = True
+                            # Possibly update best solution seen during search until the moment
+                            if candidate_solution[-1] < self.best_solution[-1]:
+                                self.best_solution = np.array(candidate_solution)
+                            if self.random_stream is None:
+                                np.random.rand()
+                        elif self.random_stream is None:
+                            accepted = np.random.rand() <= math.exp(-delta_J/self.temperature)
+                        else:
+                            # Equivalent to comparing a uniform sample with exp(-delta_J/temperature), without computing the exponential
+                            accepted = delta_J <= self.temperature * self.random_stream.exponential()
                 
-                candidate_solution = np.array(self.current_solution)
-                candidate_solution[self.chosen_variable] = pertubated_variable
-                candidate_solution[-1] = self.cost_function(candidate_solution[:-1], self.chosen_variable)
-                
-                # Decide if solution will replace the current one based on the Metropolis sampling algorithm
-                delta_J = candidate_solution[-1] - self.current_solution[-1] 
-                if delta_J < 0:
-                    acceptance_probability = 1.0
-                    # Possibly update best solution seen during search until the moment
-                    if candidate_solution[-1] < self.best_solution[-1]:
-                        self.best_solution = np.array(candidate_solution)
-                else:
-                    acceptance_probability = math.exp(-delta_J/self.temperature)
-                
-                # Candidate accepted
-                if np.random.rand() <= acceptance_probability:
-                    self.current_solution[self.chosen_variable] = candidate_solution[self.chosen_variable]
-                    self.current_solution[-1] = candidate_solution[-1]
+                        # Candidate accepted
+                        if accepted:
+                            self.current_solution[self.chosen_variable] = candidate_solution[self.chosen_variable]
+                            self.current_solution[-1] = candidate_solution[-1]
                     
-                    # Positive feedback over Bates distribution standard deviation in ACFSA
-                    # Has no effect in vanilla SA
-                    self.positive_feedback()
+                            # Positive feedback over Bates distribution standard deviation in ACFSA
+                            # Has no effect in vanilla SA
+                            self.positive_feedback()
                 
-                # Candidate rejected
-                else:
-                    # Negative feedback over Bates distribution standard deviation in ACFSA
-                    # Has no effect in vanilla SA
-                    self.negative_feedback()
+                        # Candidate rejected
+                        else:
+                            # Negative feedback over Bates distribution standard deviation in ACFSA
+                            # Has no effect in vanilla SA
+                            self.negative_feedback()
+                    
+                    # Keep or discard the candidate in a stateful cost function, whose periodic full recomputations are evaluation work
+                    with instrumentation.phase('evaluation'):
+                        if accepted:
+                            self.commit_candidate()
+                        else:
+                            self.rollback_candidate()
                     
             if (self.relative_iterations - 1 == global_i).any():
                 recorded_solutions.append(np.array(self.best_solution))
             
+            self.iteration_finished()
+            self.checkpoint_if_due({'global_iteration': global_i + 1, 'recorded_solutions': recorded_solutions}, self.function_evaluations)
+            if self.stopping_criterion_met():
+                break
+            
+        recorded_solutions = self.fill_recorded_solutions(recorded_solutions, self.best_solution)
+        self.finish_search()
+        
         return np.array(recorded_solutions)
 
         
 class ACFSA(SA):
     """ Simulated annealing using adaptive solution generation based in the feedback (positive feedback C and negative feedback) heuristics described in (Martins et al., 2012) """
     
+    checkpoint_attributes = SA.checkpoint_attributes + ['crystallization_factor']
+    
     def __init__(self):
         """ Constructor """
         # Define verbosity and NULL problem definition
-        super().__init__
+        super().__init__()
         self.crystallization_factor = None       # crystallization factors define the starndard deviation of the step size distribution for each variable at each itertion
+        # With None, perturbations average crystallization_factor uniforms, as in the published results.
+        # Otherwise, crystallization factors above the threshold are sampled in constant time (see sample_bates)
+        self.bates_exact_threshold = None
 
         
     def set_parameters(self, initial_temperature, cooling_constant, num_local_iter, function_evaluations_array):
@@ -199,6 +484,15 @@ class ACFSA(SA):
         super().set_parameters(initial_temperature, cooling_constant, 1, num_local_iter, function_evaluations_array)
     
     
+    def set_bates_sampler(self, exact_threshold = BATES_EXACT_THRESHOLD):
+        """ Sample perturbations exactly up to a crystallization factor of exact_threshold and approximately above it, in constant time. None restores exact sampling for any crystallization factor """
+        if exact_threshold is not None and exact_threshold < 1:
+            print("Error, the exact Bates sampling threshold must be positive")
+            exit(-1)
+            
+        self.bates_exact_threshold = exact_threshold
+        
+        
     def define_variables(self, initial_ranges, is_bounded):
         """ Defines the number of variables, their initial values ranges and wether or not these ranges constrain the variable during the search.
             Defines crystallization_factor dimensionality """
@@ -214,12 +508,30 @@ class ACFSA(SA):
             print("Crystallization factor must be an integer")
             exit(-1)
             
-        random_array = np.random.uniform(low = -0.5, high = 0.5, size = int(self.crystallization_factor[self.chosen_variable]))
-        perturbation = np.sum(random_array) / self.crystallization_factor[self.chosen_variable]
+        n = int(self.crystallization_factor[self.chosen_variable])
+        if self.random_stream is not None:
+            if self.bates_exact_threshold is None or n <= self.bates_exact_threshold:
+                perturbation = self.random_stream.uniform_sum(n) / n
+            else:
+                perturbation = bates_from_normal(self.random_stream.normal(), n)
+        elif self.bates_exact_threshold is None:
+            random_array = np.random.uniform(low = -0.5, high = 0.5, size = n)
+            perturbation = np.sum(random_array) / self.crystallization_factor[self.chosen_variable]
+        else:
+            perturbation = sample_bates(n, self.bates_exact_threshold)
         
         return perturbation
         
         
+    def feedback_state(self):
+        """ Copy of the crystallization factors, restored by the speculative evaluation when a candidate is accepted """
+        return np.array(self.crystallization_factor)
+        
+        
+    def restore_feedback_state(self, state):
+        self.crystallization_factor[:] = state
+        
+        
     def positive_feedback(self):
         """ Increases standard deviation of Bates distribution in perturbation """
         self.crystallization_factor[self.chosen_variable] = math.ceil(self.crystallization_factor[self.chosen_variable]  / 4)
@@ -230,4 +542,225 @@ class ACFSA(SA):
     def negative_feedback(self):
         """ Decreases standard deviation of Bates distribution in perturbation """
         if self.crystallization_factor[self.chosen_variable] < int(1e5):
-            self.crystallization_factor[self.chosen_variable] += 1
\ No newline at end of file
+            self.crystallization_factor[self.chosen_variable] += 1            
+            
+            
+class ParallelTemperingSA(SA):
+    """ Simulated annealing running R replicas of the Markov chain in lockstep, at a geometric ladder of temperatures cooled with the SA exponential schedule (Swendsen and Wang, 1986; Earl and Deem, 2005).
+        At each step, every replica proposes a single-variable move and the R candidates are evaluated as one population, so they can be evaluated in parallel by the executor.
+        Every exchange_interval steps, replicas at neighbouring temperatures exchange their solutions with the replica exchange acceptance probability.
+        Each step costs R function evaluations, so function evaluations must be divisible by the number of local iterations times the number of replicas """
+    
+    checkpoint_attributes = ['replicas', 'best_solution', 'temperature', 'exchange_attempts', 'exchange_acceptances']
+    
+    def __init__(self):
+        """ Constructor """
+        super().__init__()
+        self.num_replicas = 8
+        self.exchange_interval = 10                     # Number of steps between replica exchanges
+        self.temperature_ladder = None                  # Temperature of each replica relative to the coldest one, which follows the SA cooling schedule
+        
+        # Optimization results
+        self.replicas = None                            # Solution of each replica (R, D + 1), with its cost as the last column. Replica 0 is the coldest
+        self.exchange_attempts = None                   # Exchanges attempted and accepted between each pair of neighbouring replicas
+        self.exchange_acceptances = None
+        
+        
+    def set_parameters(self, min_temperature, max_temperature, cooling_constant, step_size, num_local_iter, num_replicas, exchange_interval, function_evaluations_array):
+        """ Define values for the parameters used by the algorithm. The initial temperatures of the replicas are geometrically spaced between min_temperature and max_temperature """
+        if num_replicas < 2 or exchange_interval <= 0:
+            print("Error, there must be at least two replicas and the exchange interval must be positive")
+            exit(-1)
+        if min_temperature <= 0 or max_temperature < min_temperature:
+            print("Error, temperatures must be positive and the maximum temperature must not be lower than the minimum")
+            exit(-1)
+        if not (np.array([x.is_integer() for x in np.array(function_evaluations_array) / (num_local_iter * num_replicas)])).all():
+            print("Error, at least one number of function evaluations is not divisible by the number of local iterations times the number of replicas")
+            exit(-1)
+        
+        # Each global iteration costs num_local_iter * num_replicas function evaluations
+        super().set_parameters(min_temperature, cooling_constant, step_size, num_local_iter * num_replicas, function_evaluations_array)
+        self.num_local_iter = num_local_iter
+        self.num_replicas = num_replicas
+        self.exchange_interval = exchange_interval
+        self.temperature_ladder = (max_temperature / min_temperature) ** (np.arange(num_replicas) / (num_replicas - 1))
+        
+        
+    def define_variables(self, initial_ranges, is_bounded):
+        """ Defines the number of variables, their initial values ranges and wether or not these ranges constrain the variable during the search """
+        super().define_variables(initial_ranges, is_bounded)
+        self.replicas = np.zeros((self.num_replicas, self.num_variables + 1))
+        
+        
+    def compute_perturbations(self, chosen_variables):
+        """ Perturbations of the chosen variable of each replica. For vanilla SA, they have fixed size for all variables """
+        return self.step_size * (1 - 2 * np.random.randint(0, 2, size = self.num_replicas))
+        
+        
+    def feedback(self, chosen_variables, accepted):
+        """ Feedback over the perturbations of each replica after the acceptance decisions. No effect in vanilla SA """
+        pass
+        
+        
+    def exchange_replicas(self, temperatures, exchange_count):
+        """ Attempt exchanges between neighbouring replicas, alternating between even and odd pairs so that each replica takes part in at most one exchange """
+        for r in range(exchange_count % 2, self.num_replicas - 1, 2):
+            # Detailed balance between the two temperatures: accept with probability min(1, exp((E_r - E_r+1) * (1/T_r - 1/T_r+1)))
+            log_acceptance = (self.replicas[r, -1] - self.replicas[r + 1, -1]) * (1 / temperatures[r] - 1 / temperatures[r + 1])
+            self.exchange_attempts[r] += 1
+            if log_acceptance >= 0 or np.random.rand() <= math.exp(log_acceptance):
+                self.replicas[[r, r + 1]] = self.replicas[[r + 1, r]]
+                self.exchange_acceptances[r] += 1
+                
+                
+    def emigrants(self, num_migrants):
+        """ The best solution found and the best replicas """
+        replica_order = np.argsort(self.replicas[:, -1], kind = 'stable')
+        
+        return np.concatenate(([self.best_solution], self.replicas[replica_order[:num_migrants - 1]]))
+        
+        
+    def inject_migrants(self, migrants):
+        """ The best migrant replaces the solution of the coldest replica if it is better """
+        best_migrant = np.array(migrants[np.argmin(np.asarray(migrants)[:, -1])])
+        if best_migrant[-1] < self.replicas[0, -1]:
+            self.replicas[0] = best_migrant
+            if best_migrant[-1] < self.best_solution[-1]:
+                self.best_solution = np.array(best_migrant)
+                
+                
+    def optimize(self):
+        """ Generate random initial solutions for the replicas and enter the algorithm loop until the number of global iterations is reached """
+        # Input error checking
+        if self.num_variables == None:
+            print("Error, first set the number of variables and their boundaries")
+            exit(-1)
+        if self.cost_function == None and self.batch_cost_function == None:
+            print("Error, first define the cost function to be used")
+            exit(-1)
+        if self.random_mode != 'legacy':
+            print("Error, parallel tempering only supports the legacy random mode")
+            exit(-1)
+        
+        # Keep solutions defined by function_evaluations_array
+        recorded_solutions = []
+        first_global_iter = 0
+        lower_bounds, upper_bounds = self.search_bounds()
+        replica_indices = np.arange(self.num_replicas)
+        
+        # Resume from a checkpoint or start a new search
+        loop_state = self.resume_checkpoint()
+        if loop_state != None:
+            first_global_iter = loop_state['global_iteration']
+            recorded_solutions = loop_state['recorded_solutions']
+        else:
+            # Randomize initial solutions
+            for r in range(self.num_replicas):
+                for i in range(self.num_variables):
+                    self.replicas[r, i] = np.random.uniform(self.initial_ranges[i][0], self.initial_ranges[i][1])
+            self.replicas[:, -1] = self.evaluate_population(self.replicas[:, :-1])
+            self.best_solution = np.array(self.replicas[np.argmin(self.replicas[:, -1])])
+            self.exchange_attempts = np.zeros(self.num_replicas - 1, dtype = int)
+            self.exchange_acceptances = np.zeros(self.num_replicas - 1, dtype = int)
+            
+        if self.verbosity: print("[ALGORITHM MAIN LOOP]")
+        # Parallel tempering main loop
+        for global_i in range(first_global_iter, self.num_global_iter):
+            # Update temperatures according to the exponential decay cooling scheduling
+            self.temperature = self.temperature * self.cooling_constant
+            temperatures = self.temperature * self.temperature_ladder
+            for local_i in range(self.num_local_iter):
+                total_i = local_i + self.num_local_iter * global_i
+                if self.verbosity:
+                    print("[%d]" % total_i)
+                    print(self.best_solution)
+                
+                ## Generate one candidate per replica and compute their costs
+                with instrumentation.phase('perturbation'):
+                    chosen_variables = np.random.randint(0, self.num_variables, size = self.num_replicas)
+                    perturbed_variables = self.replicas[replica_indices, chosen_variables] + self.compute_perturbations(chosen_variables)
+                    # For bounded variables, deal with search space violation using the hard border strategy
+                    perturbed_variables = np.clip(perturbed_variables, lower_bounds[chosen_variables], upper_bounds[chosen_variables])
+                    candidates = np.array(self.replicas)
+                    candidates[replica_indices, chosen_variables] = perturbed_variables
+                candidates[:, -1] = self.evaluate_population(candidates[:, :-1])
+                
+                # Decide which candidates replace the solution of their replica based on the Metropolis sampling algorithm
+                with instrumentation.phase('acceptance'):
+                    delta_J = candidates[:, -1] - self.replicas[:, -1]
+                    accepted = np.random.rand(self.num_replicas) <= np.exp(-np.maximum(delta_J, 0) / temperatures)
+                    self.replicas[accepted] = candidates[accepted]
+                    self.feedback(chosen_variables, accepted)
+                    
+                    # Possibly update best solution seen during search until the moment
+                    best_candidate = np.argmin(candidates[:, -1])
+                    if candidates[best_candidate, -1] < self.best_solution[-1]:
+                        self.best_solution = np.array(candidates[best_candidate])
+                    
+                    if (total_i + 1) % self.exchange_interval == 0:
+                        self.exchange_replicas(temperatures, (total_i + 1) // self.exchange_interval)
+                    
+            if (self.relative_iterations - 1 == global_i).any():
+                recorded_solutions.append(np.array(self.best_solution))
+            
+            self.iteration_finished()
+            self.checkpoint_if_due({'global_iteration': global_i + 1, 'recorded_solutions': recorded_solutions}, self.function_evaluations)
+            if self.stopping_criterion_met():
+                break
+            
+        recorded_solutions = self.fill_recorded_solutions(recorded_solutions, self.best_solution)
+        self.finish_search()
+        
+        return np.array(recorded_solutions)
+        
+        
+class ParallelTemperingACFSA(ParallelTemperingSA):
+    """ Parallel tempering with the ACFSA perturbations, sampled from Bates distributions whose crystallization factors adapt by feedback (Martins et al., 2012).
+        Crystallization factors belong to the temperatures of the ladder, so they are not exchanged along with the solutions """
+    
+    checkpoint_attributes = ParallelTemperingSA.checkpoint_attributes + ['crystallization_factors']
+    
+    def __init__(self):
+        """ Constructor """
+        super().__init__()
+        self.crystallization_factors = None             # Crystallization factor of each variable at each temperature (R, D)
+        self.bates_exact_threshold = None               # See ACFSA
+        
+        
+    def set_parameters(self, min_temperature, max_temperature, cooling_constant, num_local_iter, num_replicas, exchange_interval, function_evaluations_array):
+        """ Define values for the parameters used by the algorithm """
+        super().set_parameters(min_temperature, max_temperature, cooling_constant, 1, num_local_iter, num_replicas, exchange_interval, function_evaluations_array)
+        
+        
+    def set_bates_sampler(self, exact_threshold = BATES_EXACT_THRESHOLD):
+        """ Sample perturbations exactly up to a crystallization factor of exact_threshold and approximately above it, in constant time. None restores exact sampling for any crystallization factor """
+        if exact_threshold is not None and exact_threshold < 1:
+            print("Error, the exact Bates sampling threshold must be positive")
+            exit(-1)
+            
+        self.bates_exact_threshold = exact_threshold
+        
+        
+    def define_variables(self, initial_ranges, is_bounded):
+        """ Defines the number of variables, their initial values ranges and wether or not these ranges constrain the variable during the search.
+            Defines crystallization_factors dimensionality """
+        super().define_variables(initial_ranges, is_bounded)
+        self.crystallization_factors = np.ones((self.num_replicas, self.num_variables))
+        
+        
+    def compute_perturbations(self, chosen_variables):
+        """ Bates distributed perturbations, with standard deviation inversely proportional to the square root of the crystallization factor of each replica and chosen variable """
+        perturbations = np.empty(self.num_replicas)
+        for r in range(self.num_replicas):
+            n = int(self.crystallization_factors[r, chosen_variables[r]])
+            perturbations[r] = sample_bates(n, self.bates_exact_threshold)
+            
+        return perturbations
+        
+        
+    def feedback(self, chosen_variables, accepted):
+        """ Positive feedback (larger perturbations) for accepted candidates and negative feedback for rejected ones """
+        replica_indices = np.arange(self.num_replicas)
+        factors = self.crystallization_factors[replica_indices, chosen_variables]
+        factors = np.where(accepted, np.maximum(np.ceil(factors / 4), 1), np.where(factors < int(1e5), factors + 1, factors))
+        self.crystallization_factors[replica_indices, chosen_variables] = factors
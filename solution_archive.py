@@ -0,0 +1,114 @@
+#!python3
+
+# Copyright (C) 2020  Victor O. Costa
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Python standard lib
+import math
+# 3rd party
+import numpy as np
+
+class SolutionArchive:
+    """ Archive of the k best solutions found, ordered by cost (best first), with room for m new solutions.
+        Solutions are rows with the variables followed by the cost, as in the metaheuristics.
+        Two (k + m) buffers are allocated once and alternate at each merge, so merging never reallocates. """
+        
+    def __init__(self, k, m, num_variables):
+        """ Constructor """
+        if k <= 0 or m <= 0 or num_variables <= 0:
+            print("Error, archive dimensions must be positive")
+            exit(-1)
+            
+        self.k = k                                                  # Number of kept solutions
+        self.m = m                                                  # Maximum number of solutions merged at once
+        self.num_variables = num_variables
+        self.buffers = [np.zeros((k + m, num_variables + 1)), np.zeros((k + m, num_variables + 1))]
+        self.current = 0                                            # Index of the buffer holding the archive
+        
+        # Rank weights of the archive positions, recomputed in place only when their standard deviation changes
+        self.ranks = np.linspace(1, k, k)
+        self.weights = np.zeros(k)
+        self.cumulative_weights = np.zeros(k)
+        self.probabilities = np.zeros(k)
+        self.weights_std = None
+        
+        
+    @property
+    def solutions(self):
+        """ (k, num_variables + 1) view of the archive, best solution first """
+        return self.buffers[self.current][:self.k]
+        
+        
+    @property
+    def new_solutions(self):
+        """ (m, num_variables + 1) view where new solutions can be written before calling merge() without arguments """
+        return self.buffers[self.current][self.k:]
+        
+        
+    def initialize(self, solutions):
+        """ Fill the archive with k solutions, sorting them by cost """
+        if np.shape(solutions) != (self.k, self.num_variables + 1):
+            print("Error, the archive must be initialized with k solutions")
+            exit(-1)
+            
+        solutions = np.asarray(solutions)
+        self.buffers[self.current][:self.k] = solutions[solutions[:, -1].argsort()]
+        
+        
+    def merge(self, new_solutions = None):
+        """ Merge up to m new solutions into the archive, keeping the k best in order. 
+            Without arguments, the solutions written in new_solutions are merged """
+        archive = self.buffers[self.current]
+        if new_solutions is None:
+            new_solutions = archive[self.k:]
+        num_new = len(new_solutions)
+        if num_new > self.m:
+            print("Error, at most m solutions can be merged at once")
+            exit(-1)
+            
+        # Only the few new solutions are sorted, the archive is already ordered
+        new_order = np.argsort(new_solutions[:, -1], kind = 'stable')
+        new_costs = new_solutions[new_order, -1]
+        archive_costs = archive[:self.k, -1]
+        
+        # Position of each solution in the merged order. On ties, archive solutions come first
+        new_positions = np.searchsorted(archive_costs, new_costs, side = 'right') + np.arange(num_new)
+        archive_positions = np.arange(self.k) + np.searchsorted(new_costs, archive_costs, side = 'left')
+        
+        # Write the k best solutions into the other buffer, which then holds the archive
+        merged = self.buffers[1 - self.current]
+        kept_new = new_positions < self.k
+        kept_archive = archive_positions < self.k
+        merged[new_positions[kept_new]] = new_solutions[new_order[kept_new]]
+        merged[archive_positions[kept_archive]] = archive[:self.k][kept_archive]
+        self.current = 1 - self.current
+        
+        
+    def rank_probabilities(self, std):
+        """ Probabilities of selecting each archive position, proportional to a Gaussian function of the rank with mean 1 and standard deviation std """
+        if std != self.weights_std:
+            # Same operations of ACOr.gaussian_pdf_weights, computed in place
+            np.subtract(self.ranks, 1, out = self.weights)
+            self.weights /= std
+            np.square(self.weights, out = self.weights)
+            self.weights *= -1/2
+            np.exp(self.weights, out = self.weights)
+            self.weights *= 1 / (std * math.sqrt(2 * math.pi))
+            # The total weight is accumulated sequentially, as the built-in sum
+            np.cumsum(self.weights, out = self.cumulative_weights)
+            np.divide(self.weights, self.cumulative_weights[-1], out = self.probabilities)
+            self.weights_std = std
+            
+        return self.probabilities
@@ -0,0 +1,168 @@
+#!python3
+
+# Copyright (C) 2020  Victor O. Costa
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+## Volterra kernels equivalent to a Laguerre-Volterra network
+# The LVN output is y[n] = offset + sum_h sum_q c_hq u_h[n]^q, with u_h[n] = sum_m g_h[m] x[n - m] and g_h = sum_j w_hj b_j, where b_j is the impulse response of the j-th Laguerre filter.
+# Therefore the q-th order kernel is k_q(m_1, .., m_q) = sum_h c_hq g_h(m_1) .. g_h(m_q), a sum of H symmetric rank-one tensors, and the 0-th order kernel is the offset.
+
+# 3rd party
+import numpy as np
+from scipy.special import comb
+# Own
+from laguerre_volterra_network_structure import laguerre_filter_memory, laguerre_impulse_responses
+
+
+class SymmetricKernel:
+    ''' Volterra kernel of order q stored in triangular form: only the values at sorted lags m_1 <= m_2 <= .. <= m_q are kept, as the kernel is symmetric.
+        This needs about q! times less memory than the full (M, .., M) tensor. '''
+    def __init__(self, order, memory, indices, values):
+        ''' Constructor. indices is the (number of values, order) array of sorted lags, in lexicographic order, and values holds the kernel at those lags. '''
+        self.order = order
+        self.memory = memory
+        self.indices = indices
+        self.values = values
+        
+        
+    def __getitem__(self, lags):
+        ''' Kernel value at the given lags, in any order. '''
+        if len(lags) != self.order:
+            print("Error, the number of lags must equal the kernel order")
+            exit(-1)
+        
+        return self.values[self._position(sorted(lags))]
+        
+        
+    def _position(self, sorted_lags):
+        ''' Position of a sorted lag tuple in the lexicographic enumeration of sorted tuples. '''
+        position = 0
+        previous_lag = 0
+        for i, lag in enumerate(sorted_lags):
+            remaining_order = self.order - i
+            # Tuples starting with a smaller lag at this position come before
+            for smaller_lag in range(previous_lag, lag):
+                position += comb(self.memory - smaller_lag + remaining_order - 2, remaining_order - 1, exact = True)
+            previous_lag = lag
+        
+        return position
+        
+        
+    def full(self):
+        ''' Expand into the full (M, .., M) tensor. '''
+        kernel = np.empty((self.memory,) * self.order)
+        # Each value is written at every permutation of its lags
+        for permutation in _permutations(self.order):
+            kernel[tuple(self.indices[:, permutation].T)] = self.values
+        
+        return kernel
+        
+        
+# All permutations of range(order), as lists
+def _permutations(order):
+    if order == 1:
+        return [[0]]
+    
+    permutations = []
+    for permutation in _permutations(order - 1):
+        for position in range(order):
+            permutations.append(permutation[:position] + [order - 1] + permutation[position:])
+    
+    return permutations
+    
+
+# Array of all sorted tuples 0 <= m_1 <= .. <= m_order < memory, in lexicographic order
+def sorted_lag_tuples(memory, order):
+    tuples = np.arange(memory)[:, np.newaxis]
+    for _ in range(1, order):
+        # Each tuple is extended by every lag from its last lag to memory - 1
+        extensions = memory - tuples[:, -1]
+        total = int(np.sum(extensions))
+        group_starts = np.repeat(np.cumsum(extensions) - extensions, extensions)
+        new_lags = np.repeat(tuples[:, -1], extensions) + (np.arange(total) - group_starts)
+        tuples = np.column_stack((np.repeat(tuples, extensions, axis = 0), new_lags))
+    
+    return tuples
+    
+    
+# Impulse responses (L, M) of the Laguerre filterbank of a network, including its sampling interval scaling
+def laguerre_bank_responses(network, alpha, memory):
+    return network.T * laguerre_impulse_responses(alpha, network.L, memory)
+    
+    
+# Impulse responses (H, M) of the hidden units inputs, g_h = sum_j w_hj b_j
+def hidden_unit_responses(network, alpha, W, memory):
+    return np.array(W, dtype = np.float64) @ laguerre_bank_responses(network, alpha, memory)
+    
+    
+# Kernel of a single order q >= 1 from the hidden unit responses G (H, M) and the coefficients of that order c (H,)
+def kernel_from_responses(G, c, order, storage = 'auto'):
+    if storage not in ('auto', 'full', 'triangular'):
+        print("Error, kernel storage must be 'auto', 'full' or 'triangular'")
+        exit(-1)
+    if storage == 'auto':
+        storage = 'full' if order <= 2 else 'triangular'
+    H, memory = np.shape(G)
+    
+    if storage == 'triangular':
+        indices = sorted_lag_tuples(memory, order)
+        # Products of the responses at the lags of each tuple, (H, number of tuples), then summed over units weighted by their coefficients
+        products = G[:, indices[:, 0]]
+        for i in range(1, order):
+            products *= G[:, indices[:, i]]
+        
+        return SymmetricKernel(order, memory, indices, c @ products)
+    
+    if order == 1:
+        return c @ G
+    if order == 2:
+        return (G.T * c) @ G
+    
+    # Higher orders: one outer product chain per hidden unit
+    kernel = np.zeros((memory,) * order)
+    for h in range(H):
+        unit_kernel = c[h] * G[h]
+        for _ in range(1, order):
+            unit_kernel = np.multiply.outer(unit_kernel, G[h])
+        kernel += unit_kernel
+    
+    return kernel
+    
+    
+# Volterra kernels [k_0, k_1, .., k_max_order] of an LVN with the given structure and parameters. 
+# By default kernels go up to Q and span the memory of the Laguerre filterbank. Orders up to 2 are returned as full arrays and higher orders as SymmetricKernel, unless storage is 'full' or 'triangular'
+def volterra_kernels(network, alpha, W, C, offset, max_order = None, memory = None, storage = 'auto'):
+    if network.L == None or network.H == None or network.Q == None:
+        print("Error, first define the LVN structure")
+        exit(-1)
+    if np.shape(W) != (network.H, network.L) or np.shape(C) != (network.H, network.Q):
+        print("Error, parameters do not match the LVN structure")
+        exit(-1)
+    if max_order == None:
+        max_order = network.Q
+    if max_order > network.Q:
+        print("Error, the LVN has no kernels above order Q")
+        exit(-1)
+    if memory == None:
+        memory = laguerre_filter_memory(alpha)
+        
+    C = np.array(C, dtype = np.float64)
+    G = hidden_unit_responses(network, alpha, W, memory)
+    
+    kernels = [float(offset)]
+    for order in range(1, max_order + 1):
+        kernels.append(kernel_from_responses(G, C[:, order - 1], order, storage))
+    
+    return kernels